@@ -38,6 +38,7 @@ config = {
         "tagger_SWAB_20_ip": "192.168.1.8",           # Added 
         "tagger_SWAB_20_port": "41101",               # Added 
         "tagger_SWAB_20_serial": "174000JFF",         # Added 
+        "tagger_SWAB_20_buffer_size": int(1e8),
         "pos_xyz_Newport_25XA_ip": "192.168.1.90",    # Added 
         "laser_msquared_ip": "192.168.1.222",        # Added 
         "laser_msquared_port": "39900",              # Added 
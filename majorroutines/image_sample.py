@@ -28,53 +28,22 @@ def populate_img_array(valsToAdd, imgArray, writePos):
     in the 2D image array. This allows for real time imaging of the sample's
     fluorescence.
 
-    Note that this function could probably be much faster. At least in this
-    context, we don't care if it's fast. The implementation below was
-    written for simplicity.
+    The placement is precomputed by positioning.get_snake_scan_plan. If you
+    have the ScanPlan from positioning.get_scan_grid_2d, use it directly.
 
     Params:
         valsToAdd: np.ndarray
             The increment of raw data to add to the image array
         imgArray: np.ndarray
             The xDim x yDim array of fluorescence counts
-        writePos: tuple(int)
-            The last x, y write position on the image array. [] will default
-            to the bottom right corner.
+        writePos: list(int)
+            The number of values written so far. [] will default to the
+            start of the scan, in the bottom right corner.
     """
     yDim = imgArray.shape[0]
     xDim = imgArray.shape[1]
-
-    if len(writePos) == 0:
-        writePos[:] = [xDim, yDim - 1]
-
-    xPos = writePos[0]
-    yPos = writePos[1]
-
-    # Figure out what direction we're heading
-    headingLeft = (yDim - 1 - yPos) % 2 == 0
-
-    for val in valsToAdd:
-        if headingLeft:
-            # Determine if we're at the left x edge
-            if xPos == 0:
-                yPos = yPos - 1
-                imgArray[yPos, xPos] = val
-                headingLeft = not headingLeft  # Flip directions
-            else:
-                xPos = xPos - 1
-                imgArray[yPos, xPos] = val
-        else:
-            # Determine if we're at the right x edge
-            if xPos == xDim - 1:
-                yPos = yPos - 1
-                imgArray[yPos, xPos] = val
-                headingLeft = not headingLeft  # Flip directions
-            else:
-                xPos = xPos + 1
-                imgArray[yPos, xPos] = val
-    writePos[:] = [xPos, yPos]
-
-    return imgArray
+    scan_plan = positioning.get_snake_scan_plan(xDim, yDim)
+    return scan_plan.populate(valsToAdd, imgArray, writePos)
 
 
 def main(
@@ -339,26 +308,18 @@ def main_with_cxn(
     readout_power = tool_belt.set_laser_power(cxn, nv_sig, laser_key)
     # See if this setup has finely specified delay times, else just get the
     # one-size-fits-all value.
-    dir_path = ["", "Config", "Positioning"]
-    cxn.registry.cd(*dir_path)
-    _, keys = cxn.registry.dir()
-
-    if "xy_small_response_delay" in keys:
-        xy_delay = common.get_registry_entry(cxn, "xy_small_response_delay", dir_path)
-    else:
-        xy_delay = common.get_registry_entry(cxn, "xy_delay", dir_path)
+    positioning_config = positioning.get_positioning_config(cxn)
+    xy_delay = positioning_config.xy_small_response_delay
 
     # Get the scale in um per unit
-    xy_scale = common.get_registry_entry(cxn, "xy_nm_per_unit", dir_path)
+    xy_scale = positioning_config["xy_nm_per_unit"]
     if xy_scale == -1:
         um_scaled = False
     else:
         xy_scale *= 1000
 
-    z_delay = common.get_registry_entry(cxn, "z_delay", ["", "Config", "Positioning"])
-    z_scale = common.get_registry_entry(
-        cxn, "z_nm_per_unit", ["", "Config", "Positioning"]
-    )
+    z_delay = positioning_config["z_delay"]
+    z_scale = positioning_config["z_nm_per_unit"]
     # use whichever delay is longer:
     if (z_delay > xy_delay) and scan_type == "XZ" :
         delay = z_delay
@@ -367,14 +328,9 @@ def main_with_cxn(
     else:
         delay = xy_delay
 
-    try:
-        xy_units = common.get_registry_entry(
-            cxn, "xy_units", ["", "Config", "Positioning"]
-        )
-        z_units = common.get_registry_entry(
-            cxn, "z_units", ["", "Config", "Positioning"]
-        )
-    except Exception as exc:
+    xy_units = positioning_config.get("xy_units")
+    z_units = positioning_config.get("z_units")
+    if xy_units is None or z_units is None:
         print("xy_units or z_units not in config")
         xy_units = None
         z_units = None
@@ -411,17 +367,19 @@ def main_with_cxn(
 
     if scan_type == "XY":
         ret_vals = positioning.get_scan_grid_2d(
-            x_center, y_center, x_range, y_range, x_num_steps, y_num_steps
+            x_center, y_center, x_range, y_range, x_num_steps, y_num_steps, True
         )
     elif scan_type == "XZ":
         ret_vals = positioning.get_scan_grid_2d(
-            x_center, z_center,x_range, y_range, x_num_steps, y_num_steps)
+            x_center, z_center,x_range, y_range, x_num_steps, y_num_steps, True)
     elif scan_type == 'YZ':
         ret_vals = positioning.get_scan_grid_2d(
-            y_center, z_center,x_range, y_range, x_num_steps, y_num_steps)
+            y_center, z_center,x_range, y_range, x_num_steps, y_num_steps, True)
+    # The plan places each sample of the scan in the image arrays
+    scan_plan = ret_vals[-1]
 
     if xy_control_style == ControlStyle.STEP:
-        x_positions, y_positions, x_positions_1d, y_positions_1d, extent = ret_vals
+        x_positions, y_positions, x_positions_1d, y_positions_1d, extent = ret_vals[:5]
         pos_units = "um"
 
         x_low = x_positions_1d[0]
@@ -433,17 +391,14 @@ def main_with_cxn(
 
         # %% Set up our raw data objects
         # make an array to save information if the piezo did not reach it's target
-        flag_img_array = np.empty((x_num_steps, y_num_steps))
-        flag_img_write_pos = []
+        flag_img_array = np.empty(scan_plan.img_shape)
         # array for dx values
-        dx_img_array = np.empty((x_num_steps, y_num_steps))
-        dx_img_write_pos = []
+        dx_img_array = np.empty(scan_plan.img_shape)
         # array for dy values
-        dy_img_array = np.empty((x_num_steps, y_num_steps))
-        dy_img_write_pos = []
+        dy_img_array = np.empty(scan_plan.img_shape)
 
     elif xy_control_style == ControlStyle.STREAM:
-        x_voltages, y_voltages, x_voltages_1d, y_voltages_1d, extent = ret_vals
+        x_voltages, y_voltages, x_voltages_1d, y_voltages_1d, extent = ret_vals[:5]
         x_positions_1d, y_positions_1d = x_voltages_1d, y_voltages_1d
         pos_units = "V"
         # xy_server.load_stream_xy(x_voltages, y_voltages)
@@ -460,8 +415,7 @@ def main_with_cxn(
 
     # Initialize imgArray and set all values to NaN so that unset values
     # are not interpreted as 0 by matplotlib's colobar
-    img_array = np.empty((x_num_steps, y_num_steps))
-    img_array[:] = np.nan
+    img_array = scan_plan.new_img_array()
     img_array_kcps = np.copy(img_array)
     img_write_pos = []
 
@@ -509,12 +463,76 @@ def main_with_cxn(
     counter.start_tag_stream()
     tool_belt.init_safe_stop()
 
-    if xy_control_style == ControlStyle.STEP:
+    if xy_control_style == ControlStyle.STEP and hasattr(xyz_server, "start_step_scan"):
+
+        # The stage server walks the points itself, triggering the pulse gen
+        # at each one, and we just collect the counts and positions in bulk
+        if scan_type == "XY":
+            scan_coords = [x_positions, y_positions, [z_center] * total_num_samples]
+            scan_axes = [0, 1]
+        elif scan_type == "XZ":
+            scan_coords = [x_positions, [y_center] * total_num_samples, y_positions]
+            scan_axes = [0, 2]
+        elif scan_type == "YZ":
+            scan_coords = [[x_center] * total_num_samples, x_positions, y_positions]
+            scan_axes = [1, 2]
+        target_positions = np.array(scan_coords).T
+        xyz_server.start_step_scan(*scan_coords, period)
+
+        # Moves take longer than the sequence, so time out if the scan stalls
+        # rather than on the total duration
+        timeout_duration = 10
+        timeout_inst = time.time() + timeout_duration
+        num_read_so_far = 0
+        num_positions_so_far = 0
+
+        while num_read_so_far < total_num_samples:
+
+            if (time.time() > timeout_inst) or tool_belt.safe_stop():
+                xyz_server.stop_step_scan()
+                break
+
+            new_samples = counter.read_counter_simple()
+            num_new_samples = len(new_samples)
+            if num_new_samples > 0:
+                scan_plan.populate(new_samples, img_array, img_write_pos)
+                img_array_kcps[:] = (img_array[:] / 1000) / readout_sec
+                kpl.imshow_update(ax, img_array_kcps, vmin, vmax)
+                num_read_so_far += num_new_samples
+                timeout_inst = time.time() + timeout_duration
+
+            # How far we are from the target pos, for diagnostics
+            new_positions = np.array(xyz_server.read_step_scan())
+            num_new_positions = len(new_positions)
+            if num_new_positions > 0:
+                new_inds = np.arange(num_new_positions) + num_positions_so_far
+                offsets = (new_positions - target_positions[new_inds]) * 1e3
+                dx_vals = offsets[:, scan_axes[0]]
+                dy_vals = offsets[:, scan_axes[1]]
+                num_positions_so_far = scan_plan.scatter(
+                    [dx_vals, dy_vals],
+                    [dx_img_array, dy_img_array],
+                    num_positions_so_far,
+                )
+
+    elif xy_control_style == ControlStyle.STEP:
 
         dx_list = []
         dy_list = []
         dz_list = []
 
+        # With position telemetry the server samples the positions in the
+        # background, so we skip the read after every pixel and match the
+        # samples to the pixels once the scan is done
+        use_telemetry = hasattr(xyz_server, "read_position_telemetry")
+        if use_telemetry:
+            xyz_server.start_position_telemetry()
+            # Offset of the server's clock from ours
+            start_time = time.time()
+            server_time = xyz_server.get_telemetry_time()
+            clock_offset = server_time - (start_time + time.time()) / 2
+            pixel_times = []
+
         for i in range(total_num_samples):
 
             cur_x_pos = x_positions[i]
@@ -529,33 +547,61 @@ def main_with_cxn(
                 flag = xyz_server.write_xyz(cur_x_pos, y_center, cur_y_pos)
 
             # Some diagnostic stuff - checking how far we are from the target pos
-            actual_x_pos, actual_y_pos, actual_z_pos = xyz_server.read_xyz()
-            dx_list.append((actual_x_pos - cur_x_pos) * 1e3)
-            if scan_type == "XY":
-                dy_list.append((actual_y_pos - cur_y_pos) * 1e3)
-            elif scan_type == "XZ" or scan_type == 'YZ' :
-                cur_z_pos = cur_y_pos
-                dy_list.append((actual_z_pos - cur_z_pos) * 1e3)
+            if use_telemetry:
+                pixel_times.append(time.time() + clock_offset)
+            else:
+                actual_x_pos, actual_y_pos, actual_z_pos = xyz_server.read_xyz()
+                dx_list.append((actual_x_pos - cur_x_pos) * 1e3)
+                if scan_type == "XY":
+                    dy_list.append((actual_y_pos - cur_y_pos) * 1e3)
+                elif scan_type == "XZ" or scan_type == 'YZ' :
+                    cur_z_pos = cur_y_pos
+                    dy_list.append((actual_z_pos - cur_z_pos) * 1e3)
             # read the counts at this location
 
             pulse_gen.stream_start(1)
 
             new_samples = counter.read_counter_simple(1)
             # update the image arrays
-            populate_img_array(new_samples, img_array, img_write_pos)
-            populate_img_array([flag], flag_img_array, flag_img_write_pos)
-
-            populate_img_array(
-                [(actual_x_pos - cur_x_pos) * 1e3], dx_img_array, dx_img_write_pos
-            )
-            populate_img_array(
-                [(actual_y_pos - cur_y_pos) * 1e3], dy_img_array, dy_img_write_pos
-            )
+            new_vals = [new_samples, [flag]]
+            img_arrays = [img_array, flag_img_array]
+            if not use_telemetry:
+                new_vals.append([(actual_x_pos - cur_x_pos) * 1e3])
+                new_vals.append([(actual_y_pos - cur_y_pos) * 1e3])
+                img_arrays.extend([dx_img_array, dy_img_array])
+            scan_plan.populate(new_vals, img_arrays, img_write_pos)
             # Either include this in loop so it plots data as it takes it (takes about 2x as long)
             # or put it ourside loop so it plots after data is complete
             img_array_kcps[:] = (img_array[:] / 1000) / readout_sec
             kpl.imshow_update(ax, img_array_kcps, vmin, vmax)
 
+        if use_telemetry:
+            stop_time = time.time() + clock_offset
+            xyz_server.stop_position_telemetry()
+            num_pixels = len(pixel_times)
+            if num_pixels > 0:
+                telemetry = np.array(
+                    xyz_server.read_position_telemetry(pixel_times[0] - 1, stop_time)
+                )
+                # Position at each pixel from the last sample before its readout
+                if len(telemetry) > 0:
+                    sample_inds = np.searchsorted(
+                        telemetry[:, 0], pixel_times, side="right"
+                    )
+                    actual_positions = telemetry[np.maximum(sample_inds - 1, 0), 1:]
+                    actual_positions[sample_inds == 0] = np.nan
+                else:
+                    actual_positions = np.full((num_pixels, 3), np.nan)
+                dx_vals = (actual_positions[:, 0] - x_positions[:num_pixels]) * 1e3
+                if scan_type == "XY":
+                    actual_y_vals = actual_positions[:, 1]
+                else:
+                    actual_y_vals = actual_positions[:, 2]
+                dy_vals = (actual_y_vals - y_positions[:num_pixels]) * 1e3
+                dx_list.extend(dx_vals.tolist())
+                dy_list.extend(dy_vals.tolist())
+                scan_plan.scatter([dx_vals, dy_vals], [dx_img_array, dy_img_array])
+
     elif xy_control_style == ControlStyle.STREAM:
 
         pulse_gen.stream_start(total_num_samples)
@@ -584,7 +630,7 @@ def main_with_cxn(
                     new_samples = [
                         max(int(el[0]) - int(el[1]), 0) for el in new_samples
                     ]
-                populate_img_array(new_samples, img_array, img_write_pos)
+                scan_plan.populate(new_samples, img_array, img_write_pos)
                 img_array_kcps[:] = (img_array[:] / 1000) / readout_sec
                 kpl.imshow_update(ax, img_array_kcps, vmin, vmax)
                 num_read_so_far += num_new_samples
@@ -161,6 +161,10 @@ def read_timed_counts(cxn, num_steps, period):
         if tool_belt.safe_stop():
             break
 
+        # Wait on the pulse generator for a bit rather than spinning on the
+        # counter. Returns right away once the stream has finished
+        pulsegen_server.wait_for_stream(0.1)
+
         # Read the samples and update the image
         new_samples = counter_server.read_counter_simple()
         num_new_samples = len(new_samples)
@@ -224,11 +228,8 @@ def stationary_count_lite(cxn, nv_sig, coords, config):
         positioning.set_xyz(cxn, [x_center, y_center, z_center])
     time.sleep(0.5)  # finding we need a bit more time to settle at new position
 
-    config_positioning = config["Positioning"]
-    if "xy_small_response_delay" in config_positioning:
-        delay = config["Positioning"]["xy_small_response_delay"]
-    else:
-        delay = config["Positioning"]["xy_delay"]
+    positioning_config = positioning.get_positioning_config(cxn)
+    delay = positioning_config.xy_small_response_delay
     seq_args = [delay, readout, laser_name, laser_power]
     seq_args_string = tool_belt.encode_seq_args(seq_args)
     pulsegen_server.stream_load(seq_file_name, seq_args_string)
@@ -325,8 +326,9 @@ def optimize_list_with_cxn(cxn, nv_sig_list):
 
 def optimize_on_axis(cxn, nv_sig, axis_ind, config, fig=None):
 
-    xy_control_style = positioning.get_xy_control_style(cxn)
-    z_control_style = positioning.get_z_control_style(cxn)
+    positioning_config = positioning.get_positioning_config(cxn)
+    xy_control_style = positioning_config.xy_control_style
+    z_control_style = positioning_config.z_control_style
 
     num_steps = 31
 
@@ -356,13 +358,9 @@ def optimize_on_axis(cxn, nv_sig, axis_ind, config, fig=None):
 
         xy_server = positioning.get_server_pos_xy(cxn)
 
-        config_positioning = config["Positioning"]
-        scan_range = config_positioning["xy_optimize_range"]
-        scan_dtype = eval(config_positioning["xy_dtype"])
-        if "xy_small_response_delay" in config_positioning:
-            delay = config["Positioning"]["xy_small_response_delay"]
-        else:
-            delay = config["Positioning"]["xy_delay"]
+        scan_range = positioning_config["xy_optimize_range"]
+        scan_dtype = positioning_config.xy_dtype
+        delay = positioning_config.xy_small_response_delay
 
         if xy_control_style == ControlStyle.STEP:
             # Move to first point in scan
@@ -423,9 +421,9 @@ def optimize_on_axis(cxn, nv_sig, axis_ind, config, fig=None):
     # z
     elif axis_ind == 2:
 
-        scan_range = config["Positioning"]["z_optimize_range"]
-        scan_dtype = eval(config["Positioning"]["z_dtype"]) #matt, make sure this still works for your piezo
-        delay = config["Positioning"]["z_delay"]
+        scan_range = positioning_config["z_optimize_range"]
+        scan_dtype = positioning_config.z_dtype #matt, make sure this still works for your piezo
+        delay = positioning_config["z_delay"]
 
         if z_control_style == ControlStyle.STEP:
             auto_scan = False
@@ -514,6 +512,23 @@ def main_with_cxn(
     if nv_sig["disable_opt"]:
         prepare_microscope(cxn, nv_sig, adjusted_coords)
         return [], None
+
+    # If the drift model knows where the NV is well enough, skip optimizing
+    # and just move there
+    predicted_drift, drift_uncertainty = positioning.predict_drift(cxn)
+    if positioning.drift_prediction_confident(cxn, drift_uncertainty):
+        print("Drift prediction within threshold. Skipping optimize.")
+        opti_coords = (numpy.array(passed_coords) + predicted_drift).tolist()
+        if set_drift:
+            positioning.set_drift(cxn, predicted_drift)
+        if set_to_opti_coords:
+            prepare_microscope(cxn, nv_sig, opti_coords)
+        else:
+            print("Predicted coordinates: ")
+            print("{:.3f}, {:.3f}, {:.2f}".format(*opti_coords))
+            prepare_microscope(cxn, nv_sig)
+        tool_belt.reset_cfm(cxn)
+        return opti_coords, None
     adjusted_nv_sig = copy.deepcopy(nv_sig)
     adjusted_nv_sig["coords"] = adjusted_coords
 
@@ -702,7 +717,7 @@ def main_with_cxn(
 
     if opti_succeeded and set_drift:
         drift = (numpy.array(opti_coords) - numpy.array(passed_coords)).tolist()
-        positioning.set_drift(cxn, drift)
+        positioning.record_drift(cxn, drift)
 
     ### Set to the optimized coordinates, or just tell the user what they are
 
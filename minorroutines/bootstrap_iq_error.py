@@ -295,13 +295,6 @@ def measurement(
             state_activ = States.LOW
             state_proxy = States.HIGH
 
-    ref_0_list = []
-    ref_H_list = []
-    sig_list = []
-
-    ref_0_ste_list = []
-    ref_H_ste_list = []
-    sig_ste_list = []
     if do_dq:
         uwave_pi_pulse_low = nv_sig["pi_pulse_X_{}".format(States.LOW.name)]
         uwave_pi_pulse_high = nv_sig["pi_pulse_X_{}".format(States.HIGH.name)]
@@ -313,6 +306,10 @@ def measurement(
     else:
         uwave_pi_pulse = nv_sig["pi_pulse_X_{}".format(state.name)]
 
+    # ref_0, ref_H, and sig gates repeat, so accumulate them modulo 3 with
+    # one step per run
+    counter_server.start_accumulation(num_runs, 3)
+
     for n in range(num_runs):
         print(n)
         targeting.main_with_cxn(cxn, nv_sig)
@@ -377,46 +374,42 @@ def measurement(
         seq_args_string = tool_belt.encode_seq_args(seq_args)
         pulsegen_server.stream_immediate(seq_file, num_reps, seq_args_string)
 
-        new_counts = counter_server.read_counter_modulo_gates(3, 1)
-        # print(new_counts)
-        sample_counts = new_counts[0]
-        ref_0 = sample_counts[0]
-        ref_H = sample_counts[1]
-        sig = sample_counts[2]
-
-        # new_counts = counter_server.read_counter_separate_gates(1)
-        # sample_counts = new_counts[0]
-        # if len(sample_counts) != 3 * num_reps:
-        #     print("Error!")
-        # # first are the counts after polarization into ms = 0
-        # ref_0_counts = sample_counts[0::3]
-        # # second are the counts after a pi_x into +/-1
-        # ref_H_counts = sample_counts[1::3]
-        # # third are the counts after the uwave sequence
-        # sig_counts = sample_counts[2::3]
+        counter_server.accumulate(n, 1)
 
         counter_server.stop_tag_stream()
 
         tool_belt.reset_cfm(cxn)
 
-        # analysis
-
-        ref_0_list.append(ref_0)
-        ref_H_list.append(ref_H)
-        sig_list.append(sig)
-
-    ref_0_avg = numpy.average(ref_0_list)
-    ref_H_avg = numpy.average(ref_H_list)
-    sig_avg = numpy.average(sig_list)
+    # analysis
+
+    # Total counts per run for each gate. Runs skipped by a safe stop have no
+    # shots, so they're NaN rather than 0 counts. The standard error of a
+    # total is that of the mean scaled by the shots
+    sums, _, stes, num_shots = counter_server.read_accumulated()
+    num_shots = numpy.array(num_shots)
+    no_shots = num_shots == 0
+    sums = numpy.where(no_shots, numpy.nan, sums)
+    count_stes = numpy.where(no_shots, numpy.nan, numpy.array(stes) * num_shots)
+    num_runs_done = numpy.count_nonzero(~no_shots.any(axis=1))
+    ref_0_list = sums[:, 0].tolist()
+    ref_H_list = sums[:, 1].tolist()
+    sig_list = sums[:, 2].tolist()
+    ref_0_ste_list = count_stes[:, 0].tolist()
+    ref_H_ste_list = count_stes[:, 1].tolist()
+    sig_ste_list = count_stes[:, 2].tolist()
+
+    ref_0_avg = numpy.nanmean(ref_0_list)
+    ref_H_avg = numpy.nanmean(ref_H_list)
+    sig_avg = numpy.nanmean(sig_list)
 
     print((ref_0_avg / (num_reps * 1000)) / gate_time * 1e9)
     print((ref_H_avg / (num_reps * 1000)) / gate_time * 1e9)
     print((sig_avg / (num_reps * 1000)) / gate_time * 1e9)
 
     # error analysis for summing each run
-    ref_0_ste_avg = numpy.sqrt(ref_0_avg) / numpy.sqrt(num_runs)
-    ref_H_ste_avg = numpy.sqrt(ref_H_avg) / numpy.sqrt(num_runs)
-    sig_ste_avg = numpy.sqrt(sig_avg) / numpy.sqrt(num_runs)
+    ref_0_ste_avg = numpy.sqrt(ref_0_avg) / numpy.sqrt(num_runs_done)
+    ref_H_ste_avg = numpy.sqrt(ref_H_avg) / numpy.sqrt(num_runs_done)
+    sig_ste_avg = numpy.sqrt(sig_avg) / numpy.sqrt(num_runs_done)
 
     sig_counts_avg = sig_avg - ref_H_avg
     sig_counts_ste = numpy.sqrt(sig_ste_avg**2 + ref_H_ste_avg**2)
@@ -437,16 +430,20 @@ def measurement(
 
     N = numpy.array(sig_list) - numpy.array(ref_H_list)
     D = numpy.array(ref_0_list) - numpy.array(ref_H_list)
-    # N_unc = numpy.sqrt( numpy.array(sig_ste_list)**2 + numpy.array(ref_H_ste_list)**2)
-    # D_unc = numpy.sqrt( numpy.array(ref_0_ste_list)**2 + numpy.array(ref_H_ste_list)**2)
+    N_unc = numpy.sqrt(
+        numpy.array(sig_ste_list) ** 2 + numpy.array(ref_H_ste_list) ** 2
+    )
+    D_unc = numpy.sqrt(
+        numpy.array(ref_0_ste_list) ** 2 + numpy.array(ref_H_ste_list) ** 2
+    )
 
     pop = (N / D - half_contrast) * 2
-    # pop_unc = pop * numpy.sqrt( (N_unc/N)**2 + (D_unc/D)**2)
+    # Propagate the uncertainty of N / D, which the shift and scale double
+    pop_unc = 2 * numpy.abs(N / D) * numpy.sqrt((N_unc / N) ** 2 + (D_unc / D) ** 2)
 
     if do_plot:
         fig, ax = plt.subplots()
-        kpl.plot_points(ax, range(num_runs), pop, color=KplColors.RED)
-        # ax.error_bar(range(num_runs), pop,y_err=pop_unc, "ro")
+        kpl.plot_points(ax, range(num_runs), pop, yerr=pop_unc, color=KplColors.RED)
         ax.set_xlabel(r"Num repitition")
         ax.set_ylabel("Error")
         # kpl.anchored_text(ax, "{} ns delay between HIGH/LOW pulses\n{} ns delay between SQ/DQ pulses\npulse_error: {:.3f}".format(inter_uwave_buffer,inter_pulse_time,pulse_error ), kpl.Loc.UPPER_RIGHT)
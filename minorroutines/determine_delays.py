@@ -52,10 +52,6 @@ def measure_delay(
     tau_ind_list = list(range(num_steps))
     shuffle(tau_ind_list)
 
-    sig_counts = numpy.empty(num_steps)
-    sig_counts[:] = numpy.nan
-    ref_counts = numpy.copy(sig_counts)
-
     counter_server = tool_belt.get_server_counter(cxn)
     pulsegen_server = tool_belt.get_server_pulse_gen(cxn)
 
@@ -66,6 +62,9 @@ def measure_delay(
 
     tool_belt.init_safe_stop()
 
+    # Reference and signal gates alternate, so accumulate them modulo 2
+    counter_server.start_accumulation(num_steps, 2)
+
     n = 0
     for tau_ind in tau_ind_list:
         if tool_belt.safe_stop():
@@ -173,33 +172,37 @@ def measure_delay(
         # print('here')
         # complete_counts = counter_server.read_counter_complete()
 
-        # new_counts = counter_server.read_counter_separate_gates(1)
-        new_counts = counter_server.read_counter_modulo_gates(2, 1)
-
-        # print('here2')
-        sample_counts = new_counts[0]
-        # print(sample_counts)
-        # if len(sample_counts) != 2 * num_reps:
-        #     print("Error!")
-        ref_counts[tau_ind] = sample_counts[0]  # sum(sample_counts[0::2])
-        sig_counts[tau_ind] = sample_counts[1]  # sum(sample_counts[1::2])
+        counter_server.accumulate(tau_ind, 1)
 
         print("run time:", time.time() - st)
 
     counter_server.stop_tag_stream()
 
+    # Total counts per step. Steps skipped by a safe stop have no shots, so
+    # they're NaN rather than 0 counts. The standard error of a total is that
+    # of the mean scaled by the shots
+    sums, _, stes, num_shots = counter_server.read_accumulated()
+    num_shots = numpy.array(num_shots)
+    no_shots = num_shots == 0
+    sums = numpy.where(no_shots, numpy.nan, sums)
+    count_stes = numpy.where(no_shots, numpy.nan, numpy.array(stes) * num_shots)
+    ref_counts = sums[:, 0]
+    sig_counts = sums[:, 1]
+    ref_counts_ste = count_stes[:, 0]
+    sig_counts_ste = count_stes[:, 1]
+
     tool_belt.reset_cfm(cxn)
 
     # kcps
     #    sig_count_rates = (sig_counts / (num_reps * 1000)) / (readout / (10**9))
     #    ref_count_rates = (ref_counts / (num_reps * 1000)) / (readout / (10**9))
-    norm_avg_sig = sig_counts / numpy.average(ref_counts)
+    norm_avg_sig = sig_counts / numpy.nanmean(ref_counts)
     # norm_avg_sig = sig_counts / ref_counts
 
     fig, axes_pack = plt.subplots(1, 2, figsize=(17, 8.5))
     ax = axes_pack[0]
-    ax.plot(taus, sig_counts, "r-", label="signal")
-    ax.plot(taus, ref_counts, "g-", label="reference")
+    ax.errorbar(taus, sig_counts, yerr=sig_counts_ste, fmt="r-", label="signal")
+    ax.errorbar(taus, ref_counts, yerr=ref_counts_ste, fmt="g-", label="reference")
     ax.set_title("Counts vs Delay Time")
     ax.set_xlabel("{} Delay time (ns)".format(delayed_element))
     ax.set_ylabel("Counts")
@@ -225,10 +228,14 @@ def measure_delay(
         "delay_range-units": "ns",
         "num_steps": num_steps,
         "num_reps": num_reps,
-        "sig_counts": sig_counts.astype(int).tolist(),
+        "sig_counts": sig_counts.tolist(),
         "sig_counts-units": "counts",
-        "ref_counts": ref_counts.astype(int).tolist(),
+        "sig_counts_ste": sig_counts_ste.tolist(),
+        "sig_counts_ste-units": "counts",
+        "ref_counts": ref_counts.tolist(),
         "ref_counts-units": "counts",
+        "ref_counts_ste": ref_counts_ste.tolist(),
+        "ref_counts_ste-units": "counts",
         "norm_avg_sig": norm_avg_sig.astype(float).tolist(),
         "norm_avg_sig-units": "arb",
     }
@@ -101,46 +101,64 @@ class DaqCounterNiPxie6363(LabradServer):
         logging.info("init complete")
 
     def stopServer(self):
-        for apd_index in self.tasks:
-            self.close_task_internal(apd_index)
+        for stream_key in list(self.tasks):
+            self.close_task_internal(stream_key)
 
-    def close_task_internal(self, apd_index):
-        task = self.tasks[apd_index]
+    def close_task_internal(self, stream_key):
+        task = self.tasks[stream_key]
         task.close()
-        self.tasks.pop(apd_index)
-        self.stream_reader_state.pop(apd_index)
+        self.tasks.pop(stream_key)
+        self.stream_reader_state.pop(stream_key)
 
-    def try_load_stream_reader(self, c, apd_index, period, total_num_to_read):
+    def get_stream_key(self, apd_index):
+        """Get the key of the open stream that counts the specified APD.
+        Streams are keyed by the tuple of APD indices they count.
+        """
+        for stream_key in self.tasks:
+            if apd_index in stream_key:
+                return stream_key
+        return None
+
+    def try_load_stream_reader(self, c, apd_indices, period, total_num_to_read):
 
-        # Close the stream task if it exists
+        # Close any stream tasks counting these APDs
         # This can happen if we quit out early
-        if apd_index in self.tasks:
-            self.close_task_internal(apd_index)
+        for apd_index in apd_indices:
+            stream_key = self.get_stream_key(apd_index)
+            if stream_key is not None:
+                self.close_task_internal(stream_key)
 
 #        logging.info('tasks closed')
-        task = nidaqmx.Task('ApdDaq-load_stream_reader_{}'.format(apd_index))
-        self.tasks[apd_index] = task
-
-        chan_num = self.daq_ctr_apd[apd_index]
-        
-        chan_name = 'PXI1Slot3_2/' + chan_num
-#        logging.info(chan_name)
-        
-        chan = task.ci_channels.add_ci_count_edges_chan(chan_name)
-        chan.ci_count_edges_term = self.daq_ci_apd[apd_index]
+        stream_key = tuple(apd_indices)
+        task_name = '_'.join(str(el) for el in stream_key)
+        task = nidaqmx.Task('ApdDaq-load_stream_reader_{}'.format(task_name))
+        self.tasks[stream_key] = task
+
+        # One counter channel per APD. They share the task's sample clock
+        # and pause trigger, so they're read together in one driver call
+        for apd_index in apd_indices:
+            chan_num = self.daq_ctr_apd[apd_index]
+            chan_name = 'PXI1Slot3_2/' + chan_num
+#            logging.info(chan_name)
+            chan = task.ci_channels.add_ci_count_edges_chan(chan_name)
+            chan.ci_count_edges_term = self.daq_ci_apd[apd_index]
 
         # Set up the input stream
         input_stream = nidaqmx.task.InStream(task)
         input_stream.read_all_avail_samp = True
         reader = stream_readers.CounterReader(input_stream)
-        # Just collect whatever data is available when we read
+        # We pass the persistent buffer flattened across channels
         reader.verify_array_shape = False
 
         # Set up the gate ('pause trigger')
         # Pause when low - i.e. read only when high
+        gate_chan_names = [self.daq_di_apd_gate[ind] for ind in apd_indices]
+        gate_chan_name = gate_chan_names[0]
+        if any(val != gate_chan_name for val in gate_chan_names):
+            logging.warning('APDs in one task have different gates. '
+                            'Gating all on {}.'.format(gate_chan_name))
         task.triggers.pause_trigger.trig_type = TriggerType.DIGITAL_LEVEL
         task.triggers.pause_trigger.dig_lvl_when = Level.LOW
-        gate_chan_name = self.daq_di_apd_gate[apd_index]
         task.triggers.pause_trigger.dig_lvl_src = gate_chan_name
 
         # Configure the sample to advance on the rising edge of the PFI input.
@@ -151,22 +169,84 @@ class DaqCounterNiPxie6363(LabradServer):
                                         samps_per_chan=total_num_to_read)
 
         # Initialize the state dictionary for this stream
-        self.stream_reader_state[apd_index] = {}
-        state_dict = self.stream_reader_state[apd_index]
+        num_apds = len(apd_indices)
+        self.stream_reader_state[stream_key] = {}
+        state_dict = self.stream_reader_state[stream_key]
+        state_dict['input_stream'] = input_stream
         state_dict['reader'] = reader
         state_dict['num_read_so_far'] = 0
         state_dict['total_num_to_read'] = total_num_to_read
-        # Something funny is happening if we get more
-        # than 1000 samples in one read
-        # 4/4/22 we saw that the buffer size was too small at 1000 and actually needed more. 
-        # We got rid of the min argument and now just set the buffer size to the number of samples
-        state_dict['buffer_size'] =total_num_to_read# min(total_num_to_read, 1000)
-        state_dict['last_value'] = 0  # Last cumulative value we read
+        # 4/4/22 we saw that the buffer size was too small at 1000 and
+        # actually needed more. So the buffer holds the whole stream. It's
+        # allocated once here and reused by every read
+        state_dict['buffer'] = numpy.empty(num_apds * total_num_to_read,
+                                           dtype=numpy.uint32)
+        # Last cumulative value we read for each APD
+        state_dict['last_value'] = numpy.zeros(num_apds, dtype=numpy.uint32)
 
         # Start the task. It will start counting immediately so we'll have to
         # discard the first sample.
         task.start()
 
+    def read_stream_internal(self, apd_index, num_to_read):
+        """Read the stream counting the specified APD. Returns a 2D array of
+        the counts in each sample, [APD, sample], with the APDs in the order
+        they were passed to the load setting.
+        """
+        stream_key = self.get_stream_key(apd_index)
+        state_dict = self.stream_reader_state[stream_key]
+
+        reader = state_dict['reader']
+        num_read_so_far = state_dict['num_read_so_far']
+        total_num_to_read = state_dict['total_num_to_read']
+        buffer = state_dict['buffer']
+        num_apds = len(state_dict['last_value'])
+
+        # Read the samples currently in the DAQ memory. We always request an
+        # explicit number of samples so that the channel-grouped layout of
+        # the buffer is known
+        if num_to_read == None:
+            # Read whatever is in the buffer
+            num_requested = state_dict['input_stream'].avail_samp_per_chan
+        else:
+            num_requested = num_to_read
+        num_requested = min(num_requested, total_num_to_read)
+        read_buffer = buffer[0: num_apds * num_requested]
+        wait_inf = nidaqmx.constants.WAIT_INFINITELY
+        num_new_samples = reader.read_many_sample_uint32(read_buffer,
+                                         num_requested, timeout=wait_inf)
+        if (num_to_read is not None) and (num_new_samples != num_to_read):
+            raise Warning('Read more/less samples than specified.')
+        new_samples_cum = read_buffer.reshape(num_apds, num_requested)
+
+        # Check if we collected more samples than we need, which may happen
+        # if the pulser runs longer than necessary. If so, just to throw out
+        # excess samples.
+        if num_read_so_far + num_new_samples > total_num_to_read:
+            num_new_samples = total_num_to_read - num_read_so_far
+        new_samples_cum = new_samples_cum[:, 0: num_new_samples]
+
+        # The DAQ counter reader returns cumulative counts, which is not what
+        # we want. So we have to calculate the difference between samples
+        # n and n-1 in order to get the actual count for the nth sample,
+        # starting from the last value of the previous read. The uint32
+        # subtraction wraps, so this is correct across counter rollover too.
+        last_value = state_dict['last_value']
+        new_samples_diff = numpy.diff(new_samples_cum, axis=1,
+                                      prepend=last_value[:, numpy.newaxis])
+
+        if num_new_samples > 0:
+            state_dict['last_value'] = new_samples_cum[:, -1].copy()
+
+        # Update the current count and check if we're done with the task
+        num_read_so_far += num_new_samples
+        if num_read_so_far == total_num_to_read:
+            self.close_task_internal(stream_key)
+        else:
+            state_dict['num_read_so_far'] = num_read_so_far
+
+        return new_samples_diff
+
     @setting(0, apd_index='i', period='i', total_num_to_read='i')
     def load_stream_reader(self, c, apd_index, period, total_num_to_read):
         """Open a stream to count clicks from the specified APD. The
@@ -181,7 +261,25 @@ class DaqCounterNiPxie6363(LabradServer):
                 Total number of samples that the stream will record. Due to a
                 bug this value must currently be > 1.
         """
-        self.try_load_stream_reader(c, apd_index, period, total_num_to_read)
+        self.try_load_stream_reader(c, [apd_index], period, total_num_to_read)
+
+    @setting(6, apd_indices='*i', period='i', total_num_to_read='i')
+    def load_stream_reader_apds(self, c, apd_indices, period,
+                                total_num_to_read):
+        """Open one stream that counts clicks from all the specified APDs on
+        a shared sample clock and gate. The stream can be read with any of the
+        read settings by passing any of its APD indices.
+
+        Params
+            apd_indices: list(int)
+                Indices of the APDs to use
+            period: int
+                Expected between sample clocks in ns
+            total_num_to_read: int
+                Total number of samples that the stream will record. Due to a
+                bug this value must currently be > 1.
+        """
+        self.try_load_stream_reader(c, apd_indices, period, total_num_to_read)
 
     @setting(1,  num_to_read='i', apd_index='i', returns='*w')
     def read_counter_simple(self, c, num_to_read=None, apd_index=0):
@@ -198,63 +296,11 @@ class DaqCounterNiPxie6363(LabradServer):
 
         Returns
             list(int)
-                The samples that were read
+                The samples that were read, summed over the stream's APDs
         """
-        # Unpack the state dictionary
-        state_dict = self.stream_reader_state[apd_index]
+        new_samples_diff = self.read_stream_internal(apd_index, num_to_read)
+        return new_samples_diff.sum(axis=0, dtype=numpy.uint32)
 
-        reader = state_dict['reader']
-        num_read_so_far = state_dict['num_read_so_far']
-        total_num_to_read = state_dict['total_num_to_read']
-        buffer_size = state_dict['buffer_size'] 
-
-        # Read the samples currently in the DAQ memory
-        if num_to_read == None:
-            # Read whatever is in the buffer
-            new_samples_cum = numpy.zeros(buffer_size, dtype=numpy.uint32)
-            read_all_available = nidaqmx.constants.READ_ALL_AVAILABLE
-            num_new_samples = reader.read_many_sample_uint32(new_samples_cum,
-                     number_of_samples_per_channel=read_all_available)
-        else:
-            # Read the specified number of samples
-            new_samples_cum = numpy.zeros(buffer_size, dtype=numpy.uint32)
-            wait_inf = nidaqmx.constants.WAIT_INFINITELY
-            num_new_samples = reader.read_many_sample_uint32(new_samples_cum,
-                                             num_to_read, timeout=wait_inf)
-            if num_new_samples != num_to_read:
-                raise Warning('Read more/less samples than specified.')
-
-        # Check if we collected more samples than we need, which may happen
-        # if the pulser runs longer than necessary. If so, just to throw out
-        # excess samples.
-        if num_read_so_far + num_new_samples > total_num_to_read:
-            num_new_samples = total_num_to_read - num_read_so_far
-        new_samples_cum = new_samples_cum[0: num_new_samples]
-
-        # The DAQ counter reader returns cumulative counts, which is not what
-        # we want. So we have to calculate the difference between samples
-        # n and n-1 in order to get the actual count for the nth sample.
-        new_samples_diff = numpy.zeros(num_new_samples)
-        for index in range(num_new_samples):
-            if index == 0:
-                last_value = state_dict['last_value']
-            else:
-                last_value = new_samples_cum[index-1]
-
-            new_samples_diff[index] = new_samples_cum[index] - last_value
-
-        if num_new_samples > 0:
-            state_dict['last_value'] = new_samples_cum[num_new_samples-1]
-
-        # Update the current count and check if we're done with the task
-        num_read_so_far += num_new_samples
-        if num_read_so_far == total_num_to_read:
-            self.close_task_internal(apd_index)
-        else:
-            state_dict['num_read_so_far'] = num_read_so_far
-
-        return new_samples_diff
-    
     @setting(2,  num_to_read='i',  apd_index='i', returns="*2w")#*2w")
     def read_counter_separate_gates(self, c, num_to_read=None, apd_index=0):
         """Read the stream loaded by load_stream_reader.
@@ -270,68 +316,31 @@ class DaqCounterNiPxie6363(LabradServer):
 
         Returns
             2D list(int)
-                The samples that were read
+                The samples that were read, summed over the stream's APDs
         """
 #        num_to_read += 1 #apd_tagger starts counting from 0, so we have to add 1 to match what the daq is expecting
-        # Unpack the state dictionary
-        state_dict = self.stream_reader_state[apd_index]
+        new_samples_diff = self.read_stream_internal(apd_index, num_to_read)
+        return new_samples_diff.sum(axis=0, dtype=numpy.uint32, keepdims=True)
 
-        reader = state_dict['reader']
-        num_read_so_far = state_dict['num_read_so_far']
-        total_num_to_read = state_dict['total_num_to_read']
-        buffer_size = state_dict['buffer_size'] 
-
-        # Read the samples currently in the DAQ memory
-        if num_to_read == None:
-            # Read whatever is in the buffer
-            new_samples_cum = numpy.zeros(buffer_size, dtype=numpy.uint32)
-            read_all_available = nidaqmx.constants.READ_ALL_AVAILABLE
-            num_new_samples = reader.read_many_sample_uint32(new_samples_cum,
-                     number_of_samples_per_channel=read_all_available)
-        else:
-            # Read the specified number of samples
-            new_samples_cum = numpy.zeros(buffer_size, dtype=numpy.uint32)
-            wait_inf = nidaqmx.constants.WAIT_INFINITELY
-            num_new_samples = reader.read_many_sample_uint32(new_samples_cum,
-                                             num_to_read, timeout=wait_inf)
-            if num_new_samples != num_to_read:
-                raise Warning('Read more/less samples than specified.')
+    @setting(7,  num_to_read='i', apd_index='i', returns='*2w')
+    def read_counter_separate_apds(self, c, num_to_read=None, apd_index=0):
+        """Read the stream loaded by load_stream_reader_apds without
+        combining the APDs.
 
-        # Check if we collected more samples than we need, which may happen
-        # if the pulser runs longer than necessary. If so, just to throw out
-        # excess samples.
-        if num_read_so_far + num_new_samples > total_num_to_read:
-            num_new_samples = total_num_to_read - num_read_so_far
-        new_samples_cum = new_samples_cum[0: num_new_samples]
-
-        # The DAQ counter reader returns cumulative counts, which is not what
-        # we want. So we have to calculate the difference between samples
-        # n and n-1 in order to get the actual count for the nth sample.
-        new_samples_diff = numpy.zeros(num_new_samples)
-        for index in range(num_new_samples):
-            if index == 0:
-                last_value = state_dict['last_value']
-            else:
-                last_value = new_samples_cum[index-1]
-
-            new_samples_diff[index] = new_samples_cum[index] - last_value
-
-        if num_new_samples > 0:
-            state_dict['last_value'] = new_samples_cum[num_new_samples-1]
+        Params
+            num_to_read: int
+                Number of samples to read. This will not return until there
+                are num_to_read samples available. Default is None, in which
+                case we simply read what is available.
+            apd_index: int
+                Index of any APD in the stream. Default is 0
 
-        # Update the current count and check if we're done with the task
-        num_read_so_far += num_new_samples
-        if num_read_so_far == total_num_to_read:
-            self.close_task_internal(apd_index)
-        else:
-            state_dict['num_read_so_far'] = num_read_so_far
-            
-         
-        new_samples_diff = [[int(el) for el in new_samples_diff]]
-        
-#        logging.info(new_samples_cum)
-        # logging.info(new_samples_diff)
-        return new_samples_diff
+        Returns
+            2D list(int)
+                The samples that were read, [sample, APD]
+        """
+        new_samples_diff = self.read_stream_internal(apd_index, num_to_read)
+        return new_samples_diff.T
 
     @setting(3)
     def clear_buffer(self, c):
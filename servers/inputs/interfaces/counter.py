@@ -9,12 +9,25 @@ Created on August 29th, 2022
 
 from abc import ABC, abstractmethod
 import logging
+import threading
 from labrad.server import LabradServer
 from labrad.server import setting
+from twisted.internet.threads import deferToThread
 import numpy as np
 
 
 class Counter(LabradServer, ABC):
+    # Set by implementations whose reads block waiting on a background
+    # acquisition thread. The reads are then run in a worker thread so that
+    # the reactor stays free to serve other settings in the meantime
+    threaded_reads = False
+
+    def __init__(self):
+        super().__init__()
+        # Guards the accumulated statistics, which threaded reads update from
+        # worker threads
+        self.accumulation_lock = threading.Lock()
+
     def read_counter_setting_internal(self, num_to_read):
         if self.stream is None:
             logging.error("read_counter attempted while stream is None.")
@@ -36,50 +49,32 @@ class Counter(LabradServer, ABC):
 
         return counts
 
+    def read_counter_reduced(self, num_to_read, reduce_func):
+        """Read the complete counts and reduce them with reduce_func. Returns a
+        Deferred if reads are threaded
+        """
+        if self.threaded_reads:
+            d = deferToThread(self.read_counter_setting_internal, num_to_read)
+            d.addCallback(reduce_func)
+            return d
+        complete_counts = self.read_counter_setting_internal(num_to_read)
+        return reduce_func(complete_counts)
+
     @setting(207, num_to_read="i", returns="*3w")
     def read_counter_complete(self, c, num_to_read=None):
-        return self.read_counter_setting_internal(num_to_read)
+        return self.read_counter_reduced(num_to_read, reduce_complete)
 
     @setting(208, num_to_read="i", returns="*w")
     def read_counter_simple(self, c, num_to_read=None):
-
-        complete_counts = self.read_counter_setting_internal(num_to_read)
-
-        # To combine APDs we assume all the APDs have the same gate
-        # gate_channels = list(self.tagger_di_gate.values())
-        # first_gate_channel = gate_channels[0]
-        # if not all(val == first_gate_channel for val in gate_channels):
-        #     logging.critical("Combined counts from APDs with different gates.")
-
-        # Just find the sum of each sample in complete_counts
-        return_counts = [np.sum(sample, dtype=int) for sample in complete_counts]
-
-        return return_counts
+        return self.read_counter_reduced(num_to_read, reduce_simple)
 
     @setting(209, num_to_read="i", returns="*2w")
     def read_counter_separate_gates(self, c, num_to_read=None):
-
-        complete_counts = self.read_counter_setting_internal(num_to_read)
-        # logging.info(complete_counts)
-
-        # To combine APDs we assume all the APDs have the same gate
-        # gate_channels = list(self.tagger_di_gate.values())
-        # first_gate_channel = gate_channels[0]
-        # if not all(val == first_gate_channel for val in gate_channels):
-        #     logging.critical("Combined counts from APDs with different gates.")
-
-        # Add the APD counts as vectors for each sample in complete_counts
-        return_counts = [
-            np.sum(sample, 0, dtype=int).tolist() for sample in complete_counts
-        ]
-
-        return return_counts
+        return self.read_counter_reduced(num_to_read, reduce_separate_gates)
 
     @setting(210, modulus="i", num_to_read="i", returns="*2w")
     def read_counter_modulo_gates(self, c, modulus, num_to_read=None):
 
-        complete_counts = self.read_counter_setting_internal(num_to_read)
-
         # To combine APDs we assume all the APDs have the same gate
         try:
             gate_channels = list(self.tagger_di_gate.values())
@@ -88,39 +83,97 @@ class Counter(LabradServer, ABC):
                 logging.critical("Combined counts from APDs with different gates.")
         except:
             pass
-        # Add the APD counts as vectors for each sample in complete_counts
-        # sum_lambda = lambda arg: np.sum(arg, 0, dtype=int).tolist()
-        # with Pool() as p:
-        #     separate_gate_counts = p.map(sum_lambda, complete_counts)
-        separate_gate_counts = [
-            np.sum(el, 0, dtype=int).tolist() for el in complete_counts
-        ]
 
-        # Run the modulus
-        return_counts = []
-        for sample in separate_gate_counts:
-            sample_list = []
-            for ind in range(modulus):
-                sample_list.append(np.sum(sample[ind::modulus]))
-            return_counts.append(sample_list)
-
-        # logging.info(return_counts)
-
-        return return_counts
+        return self.read_counter_reduced(
+            num_to_read, lambda counts: reduce_modulo_gates(counts, modulus)
+        )
 
     @setting(211, num_to_read="i", returns="*2w")
     def read_counter_separate_apds(self, c, num_to_read=None):
+        return self.read_counter_reduced(num_to_read, reduce_separate_apds)
 
-        complete_counts = self.read_counter_setting_internal(num_to_read)
+    @setting(215, gate_map="*2i", num_to_read="i", returns="*3w")
+    def read_counter_demux(self, c, gate_map, num_to_read=None):
+        """Read samples from a sweep loaded with the pulse generator's
+        stream_load_sweep and sort their gates back into the points of the
+        sweep. gate_map is the gate map returned by stream_load_sweep. Returns
+        counts summed over APDs and passes of the sweep, [sample, point, gate
+        index within the point]
+        """
+        return self.read_counter_reduced(
+            num_to_read, lambda counts: reduce_demux(counts, gate_map)
+        )
 
-        # Just find the sum of the counts for each APD for each
-        # sample in complete_counts
-        return_counts = [
-            [np.sum(apd_counts, dtype=int) for apd_counts in sample]
-            for sample in complete_counts
-        ]
+    # region Accumulation
+    # Per-(step, gate) statistics kept in the server across reps and runs so
+    # that only the summary crosses the network. Gates are folded modulo the
+    # modulus passed to start_accumulation, as in read_counter_modulo_gates,
+    # and each gate of each rep is one shot
 
-        return return_counts
+    accumulation_sums = None
+
+    @setting(212, num_steps="i", modulus="i")
+    def start_accumulation(self, c, num_steps, modulus=1):
+        """Reset the accumulated statistics for a measurement with num_steps
+        steps and modulus gates per rep
+        """
+        shape = (num_steps, modulus)
+        with self.accumulation_lock:
+            self.accumulation_sums = np.zeros(shape)
+            self.accumulation_sums_squared = np.zeros(shape)
+            self.accumulation_num_shots = np.zeros(shape, dtype=np.int64)
+
+    @setting(213, step="i", num_to_read="i")
+    def accumulate(self, c, step, num_to_read=None):
+        """Read num_to_read samples and add them to the statistics for step
+        rather than returning them
+        """
+        if self.accumulation_sums is None:
+            logging.error("accumulate attempted before start_accumulation.")
+            return
+        return self.read_counter_reduced(
+            num_to_read, lambda counts: self.accumulate_internal(step, counts)
+        )
+
+    def accumulate_internal(self, step, complete_counts):
+        # Shot counts summed over APDs, [sample, gate]
+        shot_counts = as_counts_array(complete_counts).sum(axis=1)
+        shot_counts = shot_counts.astype(np.float64)
+        num_samples, num_gates = shot_counts.shape
+        with self.accumulation_lock:
+            modulus = self.accumulation_sums.shape[1]
+            gate_inds = np.arange(num_gates) % modulus
+            gate_sums = shot_counts.sum(axis=0)
+            gate_sums_squared = (shot_counts**2).sum(axis=0)
+            self.accumulation_sums[step] += np.bincount(
+                gate_inds, weights=gate_sums, minlength=modulus
+            )
+            self.accumulation_sums_squared[step] += np.bincount(
+                gate_inds, weights=gate_sums_squared, minlength=modulus
+            )
+            gate_num_shots = np.bincount(gate_inds, minlength=modulus)
+            self.accumulation_num_shots[step] += num_samples * gate_num_shots
+
+    @setting(214, returns="*2v*2v*2v*2w")
+    def read_accumulated(self, c):
+        """Return the total counts, the mean counts per shot, the standard
+        errors of the means, and the number of shots, each as a [step, gate]
+        array. Steps with fewer than two shots have a nan standard error
+        """
+        if self.accumulation_sums is None:
+            logging.error("read_accumulated attempted before start_accumulation.")
+            return
+        with self.accumulation_lock:
+            sums = self.accumulation_sums.copy()
+            sums_squared = self.accumulation_sums_squared.copy()
+            num_shots = self.accumulation_num_shots.copy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = sums / num_shots
+            variances = (sums_squared - sums * means) / (num_shots - 1)
+            stes = np.sqrt(np.maximum(variances, 0) / num_shots)
+        return sums, means, stes, num_shots.astype(np.uint32)
+
+    # endregion
 
     @abstractmethod
     def reset(self, c):
@@ -142,3 +195,153 @@ class Counter(LabradServer, ABC):
         Clear the buffer of the time tagger if necessary
         """
         pass
+
+
+
+# region Reductions
+# Each reduction takes the complete counts [sample, apd, gate] array and
+# applies a single numpy operation over all the samples at once. Results are
+# uint32 arrays, which LabRAD sends as packed *w arrays
+
+
+def as_counts_array(complete_counts):
+    """Coerce complete_counts into a [sample, apd, gate] array"""
+    if complete_counts is None or len(complete_counts) == 0:
+        return np.zeros((0, 0, 0), dtype=np.int32)
+    return np.asarray(complete_counts)
+
+
+def reduce_complete(complete_counts):
+    return as_counts_array(complete_counts).astype(np.uint32)
+
+
+def reduce_simple(complete_counts):
+    """Total counts per sample"""
+    complete_counts = as_counts_array(complete_counts)
+    return complete_counts.sum(axis=(1, 2), dtype=np.uint32)
+
+
+def reduce_separate_gates(complete_counts):
+    """Counts per sample and gate, summed over APDs"""
+    complete_counts = as_counts_array(complete_counts)
+    return complete_counts.sum(axis=1, dtype=np.uint32)
+
+
+def reduce_modulo_gates(complete_counts, modulus):
+    """Counts per sample and gate index modulo modulus, summed over APDs"""
+    separate_gate_counts = reduce_separate_gates(complete_counts)
+    num_samples, num_gates = separate_gate_counts.shape
+    # Nothing to fold, e.g. a poll before any samples are in
+    if num_samples == 0 or num_gates == 0:
+        return np.zeros((num_samples, modulus), dtype=np.uint32)
+    # Zero-pad the gates up to a multiple of the modulus so we can fold
+    # them into [sample, gate // modulus, gate % modulus] and sum
+    num_pad = -num_gates % modulus
+    separate_gate_counts = np.pad(separate_gate_counts, ((0, 0), (0, num_pad)))
+    folded_counts = separate_gate_counts.reshape(num_samples, -1, modulus)
+    return folded_counts.sum(axis=1, dtype=np.uint32)
+
+
+def reduce_separate_apds(complete_counts):
+    """Counts per sample and APD, summed over gates"""
+    complete_counts = as_counts_array(complete_counts)
+    return complete_counts.sum(axis=2, dtype=np.uint32)
+
+
+def reduce_demux(complete_counts, gate_map):
+    """Counts per sample, sweep point, and gate index within the point,
+    summed over APDs. gate_map gives [point, gate index within the point] for
+    each gate in one pass of the sweep. Gates beyond the first pass wrap
+    around onto the map
+    """
+    separate_gate_counts = reduce_separate_gates(complete_counts)
+    num_samples, num_gates = separate_gate_counts.shape
+    gate_map = np.asarray(gate_map, dtype=np.int64).reshape(-1, 2)
+    num_points = gate_map[:, 0].max() + 1
+    num_point_gates = gate_map[:, 1].max() + 1
+    # Flat index of each gate in the [sample, point, gate] output
+    map_inds = gate_map[:, 0] * num_point_gates + gate_map[:, 1]
+    gate_inds = map_inds[np.arange(num_gates) % len(gate_map)]
+    num_bins = num_points * num_point_gates
+    sample_offsets = np.arange(num_samples)[:, np.newaxis] * num_bins
+    demux_counts = np.bincount(
+        (sample_offsets + gate_inds).ravel(),
+        weights=separate_gate_counts.ravel(),
+        minlength=num_samples * num_bins,
+    )
+    demux_counts = demux_counts.reshape(num_samples, num_points, num_point_gates)
+    return demux_counts.astype(np.uint32)
+
+
+# endregion
+
+
+if __name__ == "__main__":
+    # Benchmark the reductions against the original per-sample list
+    # comprehensions for a 1e4 sample read
+    import time
+
+    def reduce_simple_loop(complete_counts):
+        return [np.sum(sample, dtype=int) for sample in complete_counts]
+
+    def reduce_separate_gates_loop(complete_counts):
+        return [np.sum(sample, 0, dtype=int).tolist() for sample in complete_counts]
+
+    def reduce_modulo_gates_loop(complete_counts, modulus):
+        separate_gate_counts = reduce_separate_gates_loop(complete_counts)
+        return_counts = []
+        for sample in separate_gate_counts:
+            sample_list = []
+            for ind in range(modulus):
+                sample_list.append(np.sum(sample[ind::modulus]))
+            return_counts.append(sample_list)
+        return return_counts
+
+    def reduce_separate_apds_loop(complete_counts):
+        return [
+            [np.sum(apd_counts, dtype=int) for apd_counts in sample]
+            for sample in complete_counts
+        ]
+
+    num_samples = 10**4
+    num_apds = 2
+    modulus = 3
+    rng = np.random.default_rng()
+    benchmarks = [
+        ("simple", reduce_simple, reduce_simple_loop),
+        ("separate_gates", reduce_separate_gates, reduce_separate_gates_loop),
+        ("separate_apds", reduce_separate_apds, reduce_separate_apds_loop),
+        (
+            "modulo_gates",
+            lambda counts: reduce_modulo_gates(counts, modulus),
+            lambda counts: reduce_modulo_gates_loop(counts, modulus),
+        ),
+    ]
+
+    for num_reps in [1, 10, 100]:
+        shape = (num_samples, num_apds, num_reps)
+        complete_counts = rng.poisson(2, shape).astype(np.int32)
+        for name, reduce_func, reduce_func_loop in benchmarks:
+            start = time.time()
+            loop_counts = reduce_func_loop(complete_counts)
+            loop_time = time.time() - start
+            start = time.time()
+            counts = reduce_func(complete_counts)
+            vectorized_time = time.time() - start
+
+            match = np.array_equal(counts, np.array(loop_counts))
+            msg = "{} reps, {}: loop {:.4f} s, vectorized {:.4f} s, match: {}"
+            print(msg.format(num_reps, name, loop_time, vectorized_time, match))
+
+    # Empty reads, as from a poll before any samples are in, and samples
+    # without any gates
+    for shape in [(0, num_apds, 0), (0, num_apds, 10), (10, num_apds, 0)]:
+        complete_counts = np.zeros(shape, dtype=np.int32)
+        for name, reduce_func, reduce_func_loop in benchmarks:
+            counts = reduce_func(complete_counts)
+            loop_counts = np.array(reduce_func_loop(complete_counts))
+            if counts.size == 0:
+                match = loop_counts.size == 0
+            else:
+                match = np.array_equal(counts, loop_counts)
+            print("{} shape, {}: match: {}".format(shape, name, match))
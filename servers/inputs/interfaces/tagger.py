@@ -10,12 +10,58 @@ Created on August 29th, 2022
 from abc import ABC, abstractmethod
 from servers.inputs.interfaces.counter import Counter
 import logging
+import threading
+import time
 import numpy as np
 from labrad.server import setting
 from numba import jit, njit
 
 
 class Tagger(Counter, ABC):
+    # Counts are produced by a background acquisition thread (see
+    # start_acquisition), so counter reads block in a worker thread
+    threaded_reads = True
+    # Number of samples the ring buffer of counts holds before the oldest
+    # unread samples are dropped
+    ring_buffer_size = 10**5
+    # Hard cap on the ring buffer's memory in bytes. Samples with many gates
+    # get fewer slots, but the buffer always holds at least one sample
+    ring_buffer_max_bytes = 2**28
+    # A counter read gives up and returns what it has if no new samples come
+    # in for this long in s
+    read_timeout = 30.0
+    # Number of tags the software stream buffer holds. Implementations may
+    # override this from their config
+    stream_buffer_size = 10**8
+    # The acquisition thread waits between reads of the stream for about as
+    # long as it takes target_tags_per_read tags to come in at the measured
+    # tag rate, clamped to these bounds in s
+    min_poll_interval = 0.001
+    max_poll_interval = 0.05
+    target_tags_per_read = 10**5
+
+    def __init__(self):
+        super().__init__()
+        # Guards the ring buffer and histogram filled by the acquisition thread
+        self.acquisition_condition = threading.Condition()
+        # Held by the acquisition thread while it reads and processes a chunk
+        # of tags so that clear_buffer can't interleave with it
+        self.acquisition_lock = threading.Lock()
+        self.acquisition_stop = threading.Event()
+        self.acquisition_thread = None
+        self.acquisition_mode = None
+        # Exception that stopped the acquisition thread, raised to the next
+        # read
+        self.acquisition_error = None
+
+    @abstractmethod
+    def read_raw_stream(self):
+        """
+        Return the timestamps and channels of the tags that have come in
+        since the last read
+        """
+        pass
+
     @abstractmethod
     def start_tag_stream(self, c, apd_indices=None, gate_indices=None, clock=True):
         """
@@ -52,30 +98,413 @@ class Tagger(Counter, ABC):
         if self.stream is None:
             logging.error("read_tag_stream attempted while stream is None.")
             return
-        if num_to_read is None:
-            timestamps, channels = self.read_raw_stream()
-        else:
-            timestamps = np.array([], dtype=np.int64)
-            channels = np.array([], dtype=int)
-            num_read = 0
-            while True:
-                # logging.info('in the while loop')
-                # logging.info(num_read)
-                timestamps_chunk, channels_chunk = self.read_raw_stream()
-                timestamps = np.append(timestamps, timestamps_chunk)
-                channels = np.append(channels, channels_chunk)
-                # Check if we've read enough samples
-                new_num_read = np.count_nonzero(channels_chunk == self.tagger_di_clock)
-                num_read += new_num_read
-                if num_read >= num_to_read:
-                    break
+        timestamps, channels = self.read_tag_stream_internal(num_to_read)
         # Convert timestamps to strings since labrad does not support int64s
         # It must be converted to int64s back on the client
         timestamps = timestamps.astype(str).tolist()
         return timestamps, channels
 
+    @setting(302, num_to_read="i", returns="y")
+    def read_tag_stream_packed(self, c, num_to_read=None):
+        """Same as read_tag_stream, but the tags are returned as one packed
+        little-endian byte buffer rather than lists. The buffer holds the
+        int64 timestamps in ps followed by the int32 channels. This skips
+        the per-tag string conversion, which dominates the cost of
+        read_tag_stream at high count rates. Unpack on the client with
+        tool_belt.decode_tag_stream
+        """
+        if self.stream is None:
+            logging.error("read_tag_stream_packed attempted while stream is None.")
+            return
+        timestamps, channels = self.read_tag_stream_internal(num_to_read)
+        timestamps = np.asarray(timestamps, dtype="<i8")
+        channels = np.asarray(channels, dtype="<i4")
+        return timestamps.tobytes() + channels.tobytes()
+
+    def read_tag_stream_internal(self, num_to_read=None):
+        """Read raw tags from the stream. If num_to_read is passed, keep
+        reading until at least that many clock clicks (samples) have come in.
+        num_to_read of None or <= 0 does a single read
+        """
+        if self.acquisition_mode is not None:
+            logging.error(
+                "read_tag_stream attempted while the acquisition thread is "
+                "consuming the stream."
+            )
+            empty_timestamps = np.empty((0), dtype=np.int64)
+            return empty_timestamps, np.empty((0), dtype=np.int32)
+        if num_to_read is None or num_to_read <= 0:
+            return self.read_raw_stream()
+        timestamps_chunks = []
+        channels_chunks = []
+        num_read = 0
+        while num_read < num_to_read:
+            timestamps_chunk, channels_chunk = self.read_raw_stream()
+            timestamps_chunks.append(timestamps_chunk)
+            channels_chunks.append(channels_chunk)
+            # Check if we've read enough samples
+            num_read += np.count_nonzero(channels_chunk == self.tagger_di_clock)
+        timestamps = np.concatenate(timestamps_chunks)
+        channels = np.concatenate(channels_chunks)
+        return timestamps, channels
+
+    def reset_tag_stream_state(self):
+        """Reset the stream state. The acquisition thread must be stopped"""
+        self.stream = None
+        self.stream_apd_indices = []
+        self.stream_channels = []
+        self.leftover_channels = np.empty((0), dtype=np.int32)
+        self.leftover_timestamps = np.empty((0), dtype=np.int64)
+        self.histogram = None
+        self.histogram_bin_width = None
+        self.histogram_num_bins = None
+        self.g2_histogram = None
+        self.g2_bin_width = None
+        self.g2_window = None
+        with self.acquisition_condition:
+            self.clear_ring_buffer()
+            self.ring_buffer = None
+            self.ring_overflows = 0
+            self.acquisition_error = None
+            self.reset_telemetry()
+
+    # region Acquisition thread
+
+    def start_acquisition(self, mode):
+        """Start the background thread that drains the stream. In "counts"
+        mode the tags are converted into counts as they arrive and pushed onto
+        the ring buffer. In "histogram" mode they are added to the arrival
+        time histogram, and in "g2" mode to the delay histogram between the
+        first two APDs
+        """
+        # Reads from worker threads may race to start the thread
+        with self.acquisition_condition:
+            if self.acquisition_mode is not None:
+                if mode != self.acquisition_mode:
+                    logging.error(
+                        f"Acquisition already running in {self.acquisition_mode} mode."
+                    )
+                return
+            self.acquisition_mode = mode
+            self.acquisition_stop.clear()
+            self.acquisition_thread = threading.Thread(
+                target=self.acquisition_loop, daemon=True
+            )
+            self.acquisition_thread.start()
+
+    def stop_acquisition(self):
+        """Stop the acquisition thread and wake any pending reads"""
+        if self.acquisition_thread is None:
+            return
+        self.acquisition_stop.set()
+        self.acquisition_thread.join()
+        self.acquisition_thread = None
+        with self.acquisition_condition:
+            self.acquisition_mode = None
+            self.acquisition_condition.notify_all()
+
+    def acquisition_loop(self):
+        while not self.acquisition_stop.is_set():
+            try:
+                with self.acquisition_lock:
+                    start = time.perf_counter()
+                    self.process_raw_stream()
+                    process_latency = time.perf_counter() - start
+                with self.acquisition_condition:
+                    self.process_latency = process_latency
+                    self.max_process_latency = max(
+                        self.max_process_latency, process_latency
+                    )
+            except Exception as exc:
+                logging.exception(exc)
+                # Stop and fail the pending reads instead of retrying a read
+                # that will likely keep failing
+                with self.acquisition_condition:
+                    self.acquisition_error = exc
+                    self.acquisition_mode = None
+                    self.acquisition_condition.notify_all()
+                return
+            self.acquisition_stop.wait(self.get_poll_interval())
+
+    def process_raw_stream(self):
+        """Read a chunk of tags off the stream and process it according to
+        the acquisition mode
+        """
+        buffer_timestamps, buffer_channels = self.read_raw_stream()
+        apd_channels = [self.tagger_di_apd[val] for val in self.stream_apd_indices]
+        if self.acquisition_mode == "counts":
+            return_counts, self.leftover_channels = tags_to_counts(
+                buffer_channels,
+                self.tagger_di_clock,
+                self.tagger_di_apd_gate,
+                apd_channels,
+                self.leftover_channels,
+            )
+            self.push_ring_buffer(return_counts)
+        elif self.acquisition_mode == "histogram":
+            histogram, leftover_timestamps, leftover_channels = tags_to_histogram(
+                buffer_timestamps,
+                buffer_channels,
+                self.tagger_di_clock,
+                self.tagger_di_apd_gate,
+                apd_channels,
+                self.leftover_timestamps,
+                self.leftover_channels,
+                self.histogram_bin_width,
+                self.histogram_num_bins,
+            )
+            self.leftover_timestamps = leftover_timestamps
+            self.leftover_channels = leftover_channels
+            with self.acquisition_condition:
+                self.add_to_histogram(histogram)
+        elif self.acquisition_mode == "g2":
+            g2_histogram, leftover_timestamps, leftover_channels = tags_to_g2(
+                buffer_timestamps,
+                buffer_channels,
+                apd_channels[0],
+                apd_channels[1],
+                self.leftover_timestamps,
+                self.leftover_channels,
+                self.g2_bin_width,
+                self.g2_window,
+            )
+            self.leftover_timestamps = leftover_timestamps
+            self.leftover_channels = leftover_channels
+            with self.acquisition_condition:
+                self.g2_histogram += g2_histogram
+
+    def add_to_histogram(self, histogram):
+        """Add a chunk's histogram to the running one. Caller must hold
+        acquisition_condition
+        """
+        # Nothing clocked yet
+        if histogram.shape[1] == 0:
+            return
+        if self.histogram is None:
+            self.histogram = histogram
+            return
+        # The number of gates per sample should be fixed by the sequence
+        num_reps = max(self.histogram.shape[1], histogram.shape[1])
+        if self.histogram.shape[1] != histogram.shape[1]:
+            logging.error("Number of gates per sample changed mid histogram.")
+            pad_width = ((0, 0), (0, num_reps - self.histogram.shape[1]), (0, 0))
+            self.histogram = np.pad(self.histogram, pad_width)
+            pad_width = ((0, 0), (0, num_reps - histogram.shape[1]), (0, 0))
+            histogram = np.pad(histogram, pad_width)
+        self.histogram += histogram
+
+    # endregion
+    # region Telemetry
+
+    def reset_telemetry(self):
+        """Reset the stream telemetry. Caller must hold acquisition_condition"""
+        self.num_hardware_overflows = 0
+        self.num_software_overflow_reads = 0
+        self.num_tags = 0
+        self.tag_rate = 0.0
+        self.stream_fill = 0.0
+        self.max_stream_fill = 0.0
+        self.read_latency = 0.0
+        self.max_read_latency = 0.0
+        self.process_latency = 0.0
+        self.max_process_latency = 0.0
+        self.last_read_time = None
+
+    def record_raw_read(
+        self, num_tags, num_hardware_overflows, has_software_overflows, latency
+    ):
+        """Update the telemetry with the results of a read_raw_stream call.
+        latency is the time in s the hardware read took
+        """
+        now = time.perf_counter()
+        with self.acquisition_condition:
+            self.num_hardware_overflows += num_hardware_overflows
+            self.num_software_overflow_reads += int(has_software_overflows)
+            self.num_tags += num_tags
+            # The stream buffer fills between reads, so the tags we get back
+            # are its fill level at the time of the read
+            self.stream_fill = num_tags / self.stream_buffer_size
+            self.max_stream_fill = max(self.max_stream_fill, self.stream_fill)
+            self.read_latency = latency
+            self.max_read_latency = max(self.max_read_latency, latency)
+            # Exponential moving average of the tag rate over recent reads
+            if self.last_read_time is not None:
+                elapsed = now - self.last_read_time
+                if elapsed > 0:
+                    tag_rate = num_tags / elapsed
+                    self.tag_rate = 0.8 * self.tag_rate + 0.2 * tag_rate
+            self.last_read_time = now
+
+    def get_poll_interval(self):
+        """Poll interval in s for the current tag rate. Keeps reads around
+        target_tags_per_read tags, and well below the stream buffer size
+        """
+        target_tags = min(self.target_tags_per_read, self.stream_buffer_size / 10)
+        if self.tag_rate <= 0:
+            return self.min_poll_interval
+        poll_interval = target_tags / self.tag_rate
+        return min(max(poll_interval, self.min_poll_interval), self.max_poll_interval)
+
+    @setting(303, returns="*(sv)")
+    def get_stream_telemetry(self, c):
+        """Return telemetry for the current stream as (name, value) pairs:
+        hardware overflows, reads with software buffer overflows, counter
+        samples dropped from a full ring buffer, total tags, tag rate in
+        tags/s, last and max software buffer fill fraction, last and max
+        hardware read latency in s, last and max processing latency of the
+        acquisition thread in s, ring buffer fill fraction, and the
+        recommended poll interval in s for clients polling with
+        num_to_read=None
+        """
+        with self.acquisition_condition:
+            if self.ring_buffer is None:
+                ring_fill = 0.0
+            else:
+                ring_fill = self.ring_num_samples / len(self.ring_buffer)
+            telemetry = [
+                ("num_hardware_overflows", self.num_hardware_overflows),
+                ("num_software_overflow_reads", self.num_software_overflow_reads),
+                ("num_dropped_samples", self.ring_overflows),
+                ("num_tags", self.num_tags),
+                ("tag_rate", self.tag_rate),
+                ("stream_fill", self.stream_fill),
+                ("max_stream_fill", self.max_stream_fill),
+                ("read_latency", self.read_latency),
+                ("max_read_latency", self.max_read_latency),
+                ("process_latency", self.process_latency),
+                ("max_process_latency", self.max_process_latency),
+                ("ring_fill", ring_fill),
+                ("poll_interval", self.get_poll_interval()),
+            ]
+        return [(name, float(val)) for name, val in telemetry]
+
+    @setting(304, buffer_size="i")
+    def set_stream_buffer_size(self, c, buffer_size):
+        """Set the number of tags the software stream buffer holds. Takes
+        effect at the next start_tag_stream
+        """
+        self.stream_buffer_size = buffer_size
+
+    # endregion
+    # region Ring buffer
+
+    def push_ring_buffer(self, return_counts):
+        """Append samples to the ring buffer, dropping the oldest unread
+        samples if it's full
+        """
+        num_new = len(return_counts)
+        if num_new == 0:
+            return
+        with self.acquisition_condition:
+            sample_shape = return_counts.shape[1:]
+            if self.ring_buffer is None or self.ring_buffer.shape[1:] != sample_shape:
+                if self.ring_num_samples > 0:
+                    msg = "Sample shape changed mid stream. Dropping {} samples."
+                    logging.error(msg.format(self.ring_num_samples))
+                sample_bytes = np.dtype(np.int32).itemsize * int(np.prod(sample_shape))
+                capacity = self.ring_buffer_max_bytes // max(sample_bytes, 1)
+                capacity = min(max(capacity, 1), self.ring_buffer_size)
+                self.ring_buffer = np.empty((capacity, *sample_shape), dtype=np.int32)
+                self.clear_ring_buffer()
+            capacity = len(self.ring_buffer)
+            num_dropped = max(self.ring_num_samples + num_new - capacity, 0)
+            if num_dropped > 0:
+                msg = "Counter ring buffer full. Dropping {} oldest samples."
+                logging.error(msg.format(num_dropped))
+                self.ring_overflows += num_dropped
+                if num_new > capacity:
+                    return_counts = return_counts[-capacity:]
+                    num_new = capacity
+                num_dropped_old = min(num_dropped, self.ring_num_samples)
+                self.ring_start = (self.ring_start + num_dropped_old) % capacity
+                self.ring_num_samples -= num_dropped_old
+            write_start = self.ring_start + self.ring_num_samples
+            write_inds = (write_start + np.arange(num_new)) % capacity
+            self.ring_buffer[write_inds] = return_counts
+            self.ring_num_samples += num_new
+            self.acquisition_condition.notify_all()
+
+    def pop_ring_buffer(self, num_to_pop=None):
+        """Remove and return up to num_to_pop of the oldest samples (all of
+        them by default). Caller must hold acquisition_condition
+        """
+        if self.ring_buffer is None:
+            return np.empty((0, 0, 0), dtype=np.int32)
+        if num_to_pop is None or num_to_pop > self.ring_num_samples:
+            num_to_pop = self.ring_num_samples
+        capacity = len(self.ring_buffer)
+        read_inds = (self.ring_start + np.arange(num_to_pop)) % capacity
+        return_counts = self.ring_buffer[read_inds]
+        self.ring_start = (self.ring_start + num_to_pop) % capacity
+        self.ring_num_samples -= num_to_pop
+        return return_counts
+
+    def clear_ring_buffer(self):
+        """Drop any unread samples. Caller must hold acquisition_condition"""
+        self.ring_start = 0
+        self.ring_num_samples = 0
+
+    # endregion
+
+    def read_counter_internal(self):
+        """Return the samples currently in the ring buffer without waiting"""
+        with self.acquisition_condition:
+            return self.pop_ring_buffer()
+
+    def raise_acquisition_error(self):
+        """Raise the exception that stopped the acquisition thread, if any.
+        Caller must hold acquisition_condition
+        """
+        exc = self.acquisition_error
+        if exc is not None:
+            self.acquisition_error = None
+            raise RuntimeError(f"Tagger acquisition failed: {exc!r}") from exc
+
+    def read_counter_setting_internal(self, num_to_read):
+        """Wait on the acquisition thread for num_to_read samples. Starts the
+        thread on the first read after start_tag_stream. If num_to_read is
+        None, just return whatever samples are available. If no new samples
+        come in for read_timeout s or the stream stops, return the samples
+        read so far. Raises if the acquisition thread fails
+        """
+        if self.stream is None:
+            logging.error("read_counter attempted while stream is None.")
+            return
+        with self.acquisition_condition:
+            self.raise_acquisition_error()
+        self.start_acquisition("counts")
+        if self.acquisition_mode != "counts":
+            return
+        with self.acquisition_condition:
+            if num_to_read is None:
+                return self.pop_ring_buffer()
+            # Pop the samples as they come in so that reads larger than the
+            # ring buffer can complete
+            chunks = [self.pop_ring_buffer(num_to_read)]
+            num_read = len(chunks[0])
+            while num_read < num_to_read:
+                self.acquisition_condition.wait_for(
+                    lambda: self.ring_num_samples > 0
+                    or self.acquisition_mode is None,
+                    timeout=self.read_timeout,
+                )
+                if self.ring_num_samples > 0:
+                    chunk = self.pop_ring_buffer(num_to_read - num_read)
+                    chunks.append(chunk)
+                    num_read += len(chunk)
+                    continue
+                self.raise_acquisition_error()
+                if self.acquisition_mode is None:
+                    msg = "Stream stopped after {} samples, requested {}."
+                else:
+                    msg = "Counter read timed out after {} samples, requested {}."
+                logging.error(msg.format(num_read, num_to_read))
+                break
+            # Drop empty chunks popped before the sample shape was known
+            chunks = [chunk for chunk in chunks if len(chunk) > 0] or chunks[:1]
+            return np.concatenate(chunks)
+
 
-@njit
 def tags_to_counts(
     buffer_channels,
     clock_channel,
@@ -86,10 +515,320 @@ def tags_to_counts(
     """This is the core counter function for the converting time tags to counts.
     It needs to be fast - if it's not fast enough, we may encounter unexpected
     behavior, like certain samples returning 0 counts when clearly they should
-    return something > 0. For that reason, this function lives outside the class
-    so that it can be compiled by numba. It's written in very basic (and slow,
-    natively) python so that the compiler has no trouble understanding what
-    to do.
+    return something > 0. The buffer is classified in a single pass: clock and
+    gate edges are located once (see locate_gates) and the APD clicks in each
+    gate window are read off a running click count, so the cost is O(buffer)
+    regardless of the number of samples or gates.
+
+    Parameters
+    ----------
+    buffer_channels : array(int)
+        List of channels returned by the read call on the tagger device
+    clock_channel : int
+        Tagger device's clock channel
+    apd_gate_channel : int
+        Tagger device's APD virtual gate channel
+    apd_channels : list(int)
+        Tagger device's channels hooked up to the APDs
+    leftover_channels : array(int)
+        List containing current leftover channels (i.e. any tags that didn't
+        have a clock pulse come after them the last rad request)
+
+    Returns
+    -------
+    3D array(int)
+        Main data structure (return_counts) - the first dimension is for samples,
+        the second is for APDs, and the third is for reps/gates.
+    array(int)
+        Updated leftover_channels
+    """
+
+    channels = np.concatenate((leftover_channels, buffer_channels))
+    gates = locate_gates(channels, clock_channel, apd_gate_channel)
+
+    # No samples were clocked - make a dummy return_counts and add everything to leftovers
+    if gates is None:
+        return np.empty((0, 0, 0), dtype=np.int32), channels
+    sample_end_ind, num_samples, num_reps, open_inds, close_inds = gates
+
+    # Clicks per gate window for each APD. open_inds/close_inds are -1 for gates
+    # that never showed up, which we leave at 0 counts
+    num_apds = len(apd_channels)
+    return_counts = np.zeros((num_samples, num_apds, num_reps), dtype=np.int32)
+    valid = (open_inds >= 0) & (close_inds >= 0)
+    gate_opens = open_inds[valid]
+    gate_closes = close_inds[valid]
+    sampled_channels = channels[:sample_end_ind]
+    for dim2 in range(num_apds):
+        # Running click count - the gate edges themselves are never APD clicks
+        # so the difference across a window is the number of clicks inside it
+        cum_clicks = np.cumsum(sampled_channels == apd_channels[dim2], dtype=np.int32)
+        num_counts = cum_clicks[gate_closes] - cum_clicks[gate_opens]
+        return_counts[:, dim2, :][valid] = num_counts
+
+    # Reset leftovers from the last sample clock
+    leftover_channels = channels[sample_end_ind:]
+
+    return return_counts, leftover_channels
+
+
+def tags_to_histogram(
+    buffer_timestamps,
+    buffer_channels,
+    clock_channel,
+    apd_gate_channel,
+    apd_channels,
+    leftover_timestamps,
+    leftover_channels,
+    bin_width,
+    num_bins,
+):
+    """Histogram the arrival times of APD clicks relative to the opening of the
+    gate they fall in. Like tags_to_counts, only clocked samples are processed
+    and everything after the last clock click is returned as leftovers.
+
+    Parameters
+    ----------
+    buffer_timestamps : array(int)
+        Timestamps in ps returned by the read call on the tagger device
+    buffer_channels : array(int)
+        List of channels returned by the read call on the tagger device
+    clock_channel : int
+        Tagger device's clock channel
+    apd_gate_channel : int
+        Tagger device's APD virtual gate channel
+    apd_channels : list(int)
+        Tagger device's channels hooked up to the APDs
+    leftover_timestamps : array(int)
+        Timestamps of the leftover tags from the last read
+    leftover_channels : array(int)
+        Channels of the leftover tags from the last read
+    bin_width : int
+        Histogram bin width in ps
+    num_bins : int
+        Number of bins. Clicks more than bin_width * num_bins after the gate
+        opens are dropped
+
+    Returns
+    -------
+    3D array(int)
+        Histogram - the first dimension is for APDs, the second is for the gate
+        index within a sample, and the third is for arrival time bins
+    array(int)
+        Updated leftover_timestamps
+    array(int)
+        Updated leftover_channels
+    """
+
+    timestamps = np.concatenate((leftover_timestamps, buffer_timestamps))
+    channels = np.concatenate((leftover_channels, buffer_channels))
+    gates = locate_gates(channels, clock_channel, apd_gate_channel)
+    num_apds = len(apd_channels)
+
+    if gates is None:
+        histogram = np.zeros((num_apds, 0, num_bins), dtype=np.int64)
+        return histogram, timestamps, channels
+    sample_end_ind, num_samples, num_reps, open_inds, close_inds = gates
+
+    # Flatten the gates into time order, keeping track of each gate's index
+    # within its sample
+    valid = (open_inds >= 0) & (close_inds >= 0)
+    gate_opens = open_inds[valid]
+    gate_closes = close_inds[valid]
+    gate_ranks = np.broadcast_to(np.arange(num_reps), valid.shape)[valid]
+
+    histogram = np.zeros((num_apds, num_reps, num_bins), dtype=np.int64)
+    sampled_channels = channels[:sample_end_ind]
+    for dim1 in range(num_apds):
+        click_inds = np.flatnonzero(sampled_channels == apd_channels[dim1])
+        # Find the last gate to open before each click and drop the clicks
+        # that came in after that gate closed
+        gate_pos = np.searchsorted(gate_opens, click_inds) - 1
+        in_gate = gate_pos >= 0
+        in_gate[in_gate] = click_inds[in_gate] < gate_closes[gate_pos[in_gate]]
+        click_inds = click_inds[in_gate]
+        gate_pos = gate_pos[in_gate]
+        delays = timestamps[click_inds] - timestamps[gate_opens[gate_pos]]
+        bins = delays // bin_width
+        in_range = bins < num_bins
+        flat_bins = gate_ranks[gate_pos[in_range]] * num_bins + bins[in_range]
+        flat_hist = np.bincount(flat_bins, minlength=num_reps * num_bins)
+        histogram[dim1] = flat_hist.reshape((num_reps, num_bins))
+
+    leftover_timestamps = timestamps[sample_end_ind:]
+    leftover_channels = channels[sample_end_ind:]
+
+    return histogram, leftover_timestamps, leftover_channels
+
+
+def tags_to_g2(
+    buffer_timestamps,
+    buffer_channels,
+    apd_channel_a,
+    apd_channel_b,
+    leftover_timestamps,
+    leftover_channels,
+    bin_width,
+    window,
+):
+    """Histogram the delays between clicks on two APDs for a g2 measurement.
+    All pairs of clicks with a delay t_b - t_a in [-window, window) are
+    histogrammed, not just the nearest stop, so there is no start-stop bias.
+    Pairs are found with a sorted search on the click times, so the cost is
+    O(clicks + pairs). Clicks within window of the last tag are returned as
+    leftovers so that pairs spanning reads are still counted, and pairs among
+    the leftovers (already counted by the last call) are skipped.
+
+    Parameters
+    ----------
+    buffer_timestamps : array(int)
+        Timestamps in ps returned by the read call on the tagger device
+    buffer_channels : array(int)
+        List of channels returned by the read call on the tagger device
+    apd_channel_a : int
+        Tagger device's channel for the start APD
+    apd_channel_b : int
+        Tagger device's channel for the stop APD
+    leftover_timestamps : array(int)
+        Timestamps of the leftover tags from the last read
+    leftover_channels : array(int)
+        Channels of the leftover tags from the last read
+    bin_width : int
+        Histogram bin width in ps
+    window : int
+        Largest delay magnitude in ps to histogram
+
+    Returns
+    -------
+    array(int)
+        Histogram of the 2 * window // bin_width bins of delays starting at
+        -window
+    array(int)
+        Updated leftover_timestamps
+    array(int)
+        Updated leftover_channels
+    """
+
+    num_old = len(leftover_timestamps)
+    timestamps = np.concatenate((leftover_timestamps, buffer_timestamps))
+    channels = np.concatenate((leftover_channels, buffer_channels))
+    num_bins = (2 * window) // bin_width
+
+    is_new = np.arange(len(timestamps)) >= num_old
+    is_a = channels == apd_channel_a
+    is_b = channels == apd_channel_b
+    times_a = timestamps[is_a]
+    times_b = timestamps[is_b]
+    new_a = is_new[is_a]
+    new_b = is_new[is_b]
+
+    # Pairs with a new start click against every stop click, plus pairs
+    # with an old start click against new stop clicks
+    delays = np.concatenate(
+        (
+            pair_delays(times_a[new_a], times_b, window),
+            pair_delays(times_a[~new_a], times_b[new_b], window),
+        )
+    )
+    bin_inds = (delays + window) // bin_width
+    bin_inds = bin_inds[(bin_inds >= 0) & (bin_inds < num_bins)]
+    histogram = np.bincount(bin_inds, minlength=num_bins).astype(np.int64)
+
+    # Keep the clicks that may still pair with clicks in the next read
+    if len(timestamps) > 0:
+        keep = (is_a | is_b) & (timestamps >= timestamps[-1] - window)
+        timestamps = timestamps[keep]
+        channels = channels[keep]
+
+    return histogram, timestamps, channels
+
+
+def pair_delays(times_a, times_b, window):
+    """Return the delays t_b - t_a of all the pairs of sorted click times
+    with -window <= t_b - t_a < window
+    """
+    starts = np.searchsorted(times_b, times_a - window, side="left")
+    stops = np.searchsorted(times_b, times_a + window, side="left")
+    num_pairs = stops - starts
+    # Expand each start click into its run of stop clicks
+    a_inds = np.repeat(np.arange(len(times_a)), num_pairs)
+    run_starts = np.cumsum(num_pairs) - num_pairs
+    offsets = np.arange(num_pairs.sum()) - np.repeat(run_starts, num_pairs)
+    b_inds = np.repeat(starts, num_pairs) + offsets
+    return times_b[b_inds] - times_a[a_inds]
+
+
+def locate_gates(channels, clock_channel, apd_gate_channel):
+    """Find the sample breaks and gate windows in a buffer of channels. Samples
+    end with (and include) a clock click. Gates open on the gate channel and
+    close on its negative (the falling edge). The number of gates per sample
+    is taken from the first sample and the nth open in each sample is paired
+    with the nth close.
+
+    Parameters
+    ----------
+    channels : array(int)
+        Channels to classify, leftovers from the last read included
+    clock_channel : int
+        Tagger device's clock channel
+    apd_gate_channel : int
+        Tagger device's APD virtual gate channel
+
+    Returns
+    -------
+    tuple or None
+        None if there are no clock clicks in channels. Otherwise
+        (sample_end_ind, num_samples, num_reps, open_inds, close_inds) where
+        sample_end_ind is the index just past the last clock click and
+        open_inds/close_inds are 2D [sample, gate] arrays of indices into
+        channels, -1 where a gate edge is missing
+    """
+
+    clock_click_inds = np.flatnonzero(channels == clock_channel)
+    num_samples = len(clock_click_inds)
+    if num_samples == 0:
+        return None
+    sample_end_ind = clock_click_inds[-1] + 1
+    sampled_channels = channels[:sample_end_ind]
+
+    edges = []
+    for edge_channel in (apd_gate_channel, -apd_gate_channel):
+        edge_inds = np.flatnonzero(sampled_channels == edge_channel)
+        # A clock click closes out its sample, so an edge belongs to the
+        # sample of the first clock click after it
+        edge_samples = np.searchsorted(clock_click_inds, edge_inds)
+        # Position of each edge within its own sample
+        edges_per_sample = np.bincount(edge_samples, minlength=num_samples)
+        sample_starts = np.cumsum(edges_per_sample) - edges_per_sample
+        edge_ranks = np.arange(len(edge_inds)) - sample_starts[edge_samples]
+        edges.append((edge_inds, edge_samples, edge_ranks))
+
+    open_samples = edges[0][1]
+    num_reps = int(np.count_nonzero(open_samples == 0))
+
+    gate_inds = []
+    for edge_inds, edge_samples, edge_ranks in edges:
+        inds = np.full((num_samples, num_reps), -1, dtype=np.int64)
+        keep = edge_ranks < num_reps
+        inds[edge_samples[keep], edge_ranks[keep]] = edge_inds[keep]
+        gate_inds.append(inds)
+    open_inds, close_inds = gate_inds
+
+    return sample_end_ind, num_samples, num_reps, open_inds, close_inds
+
+
+@njit
+def tags_to_counts_loop(
+    buffer_channels,
+    clock_channel,
+    apd_gate_channel,
+    apd_channels,
+    leftover_channels,
+):
+    """Original numba-compiled loop implementation of tags_to_counts. Kept
+    around as a reference for the benchmark at the bottom of this file. Cost
+    grows as samples x APDs x gates x buffer length since every gate window is
+    rescanned once per APD.
 
     Parameters
     ----------
@@ -178,3 +917,43 @@ def tags_to_counts(
         leftover_channels = buffer_channels[sample_end_ind:]
 
     return return_counts, leftover_channels
+
+
+if __name__ == "__main__":
+    # Benchmark tags_to_counts against the original numba loop on synthetic
+    # buffers of num_reps gates per sample and Poissonian clicks in each gate
+    import time
+
+    clock_channel = 8
+    apd_gate_channel = 7
+    apd_channels = np.array([5, 6])
+    num_reps = 100
+    mean_clicks = 2
+    rng = np.random.default_rng()
+
+    for num_tags in [10**5, 10**6, 10**7, 10**8]:
+        # Each gate is open, clicks from each APD, close, and then a clock
+        # after the last gate of the sample
+        tags_per_gate = 2 + (mean_clicks * len(apd_channels)) + (1 / num_reps)
+        num_gates = num_reps * max(int(num_tags / (tags_per_gate * num_reps)), 1)
+        gate_clicks = rng.poisson(mean_clicks, (num_gates, len(apd_channels)))
+        is_last = (np.arange(num_gates) % num_reps) == (num_reps - 1)
+        vals = [apd_gate_channel, *apd_channels, -apd_gate_channel, clock_channel]
+        vals = np.tile(np.array(vals, dtype=np.int32), num_gates)
+        reps = np.column_stack((np.ones(num_gates), gate_clicks))
+        reps = np.column_stack((reps, np.ones(num_gates), is_last)).astype(int)
+        buffer_channels = np.repeat(vals, reps.ravel())
+        leftover_channels = np.empty((0), dtype=np.int32)
+
+        args = (buffer_channels, clock_channel, apd_gate_channel, apd_channels)
+        tags_to_counts_loop(*args, leftover_channels)  # Compile
+        start = time.time()
+        loop_counts, _ = tags_to_counts_loop(*args, leftover_channels)
+        loop_time = time.time() - start
+        start = time.time()
+        counts, _ = tags_to_counts(*args, leftover_channels)
+        vectorized_time = time.time() - start
+
+        match = np.array_equal(counts, loop_counts)
+        msg = "{:.0e} tags: loop {:.3f} s, vectorized {:.3f} s, match: {}"
+        print(msg.format(len(buffer_channels), loop_time, vectorized_time, match))
@@ -26,6 +26,7 @@ import logging
 import re
 import socket
 import sys
+import time
 sys.path.insert(0, 'C:\\Users\\choyl\\ChoyDioptric')  # Add parent directory to path
 from servers.inputs.interfaces.tagger import Tagger
 from utils import common
@@ -54,6 +55,9 @@ class TaggerSwab20(Tagger, LabradServer):
         self.reset_tag_stream_state()
         tagger_ip = config["DeviceIDs"][f"{self.name}_ip"]
         tagger_port = config["DeviceIDs"][f"{self.name}_port"]
+        buffer_size_key = f"{self.name}_buffer_size"
+        if buffer_size_key in config["DeviceIDs"]:
+            self.stream_buffer_size = config["DeviceIDs"][buffer_size_key]
         try:
             self.tagger = TimeTagger.createTimeTaggerNetwork(f'{tagger_ip}:{tagger_port}')
             # self.tagger = Pyro5.api.Proxy("PYRO:TimeTaggerRestricted@192.168.1.8:41101")
@@ -86,53 +90,29 @@ class TaggerSwab20(Tagger, LabradServer):
             if self.stream is None:
                 logging.error("read_raw_stream attempted while stream is None.")
                 return
+            start = time.perf_counter()
             buffer = self.stream.getData()
             # Monitor overflows for both the Time Tagger's onboard buffer
             # and the software buffer that the stream feeds into on our PC
             num_hardware_overflows = self.tagger.getOverflowsAndClear()
+            latency = time.perf_counter() - start
             has_software_overflows = buffer.hasOverflows
             if (num_hardware_overflows > 0) or has_software_overflows:
                 logging.info(f"Num hardware overflows: {num_hardware_overflows}")
                 logging.info(f"Has software overflows: {has_software_overflows}")
             timestamps = buffer.getTimestamps()
             channels = buffer.getChannels()
+            self.record_raw_read(
+                len(channels), num_hardware_overflows, has_software_overflows, latency
+            )
             return timestamps, channels
 
-    def read_counter_internal(self):
-        if self.stream is None:
-            logging.error("read_counter_internal attempted while stream is None.")
-            return
-        _, buffer_channels = self.read_raw_stream()
-
-        # Do the hard work in the fast sub function
-        apd_channels = [self.tagger_di_apd[val] for val in self.stream_apd_indices]
-        return_counts, leftover_channels = Tagger.tags_to_counts(
-            buffer_channels,
-            self.tagger_di_clock,
-            self.tagger_di_apd_gate,
-            apd_channels,
-            self.leftover_channels,
-        )
-
-        # MCC: Bounce check
-        # if 0 in np.array(return_counts):
-        #     double_samples = [self.tagger_di_clock, self.tagger_di_clock]
-        #     errors = [(buffer_times[i], buffer_times[i+1]) for i in range(len(buffer_channels)) if buffer_channels[i:i+2].tolist() == double_samples]
-        #     logging.info(errors)
-        self.leftover_channels = leftover_channels
-        return return_counts
-
     def stop_tag_stream_internal(self):
+        self.stop_acquisition()
         if self.stream is not None:
             self.stream.stop()
         self.reset_tag_stream_state()
 
-    def reset_tag_stream_state(self):
-        self.stream = None
-        self.stream_apd_indices = []
-        self.stream_channels = []
-        self.leftover_channels = np.empty((0), dtype=np.int32)
-
     @setting(0, returns="*i")
     def get_channel_mapping(self, c):
         """As a regexp, the order is:
@@ -174,7 +154,9 @@ class TaggerSwab20(Tagger, LabradServer):
         self.stream_channels = channels
         # De-duplicate the channels list
         channels = list(set(channels))
-        self.stream = TimeTagger.TimeTagStream(self.tagger, 10**8, channels)
+        self.stream = TimeTagger.TimeTagStream(
+            self.tagger, self.stream_buffer_size, channels
+        )
         # When you set up a measurement, it will not start recording data
         # immediately. It takes some time for the tagger to configure the fpga,
         # etc. The sync call waits until this process is complete.
@@ -191,19 +173,105 @@ class TaggerSwab20(Tagger, LabradServer):
     @setting(3)
     def clear_buffer(self, c):
         """Clear the hardware's internal buffer. Should be called before
-        starting a pulse sequence."""
-        buffer = self.stream.getData()
-        # We also don't care about overflows here, so toss (but log) those
-        num_hardware_overflows = self.tagger.getOverflowsAndClear()
-        has_software_overflows = buffer.hasOverflows
-        if (num_hardware_overflows > 0) or has_software_overflows:
-            logging.info(f"Num hardware overflows: {num_hardware_overflows}")
-            logging.info(f"Has software overflows: {has_software_overflows}")
+        starting a pulse sequence. Also drops any unread samples the
+        acquisition thread has buffered."""
+        # Keep the acquisition thread from reading between the two clears
+        with self.acquisition_lock:
+            buffer = self.stream.getData()
+            # We also don't care about overflows here, so toss (but log) those
+            num_hardware_overflows = self.tagger.getOverflowsAndClear()
+            has_software_overflows = buffer.hasOverflows
+            if (num_hardware_overflows > 0) or has_software_overflows:
+                logging.info(f"Num hardware overflows: {num_hardware_overflows}")
+                logging.info(f"Has software overflows: {has_software_overflows}")
+            with self.acquisition_condition:
+                self.clear_ring_buffer()
 
     @setting(5)
     def reset(self, c):
         self.stop_tag_stream_internal()
 
+    @setting(6, bin_width="i", num_bins="i", apd_indices="*i")
+    def start_histogram_stream(self, c, bin_width, num_bins, apd_indices=None):
+        """Start a tag stream that is accumulated into a histogram of photon
+        arrival times relative to gate open, per APD and per gate index within
+        a sample. Only the histogram crosses LabRAD (see read_histogram), so
+        long lifetime/time-resolved runs cost O(bins) of traffic rather than
+        O(photons). Close with stop_tag_stream.
+
+        Params
+            bin_width: int
+                Bin width in ps
+            num_bins: int
+                Number of bins. Clicks arriving more than bin_width * num_bins
+                after the gate opens are dropped
+            apd_indices: list(int)
+                APDs to histogram. Default is the APDs in the config
+        """
+        self.start_tag_stream(c, apd_indices)
+        self.histogram_bin_width = bin_width
+        self.histogram_num_bins = num_bins
+        self.start_acquisition("histogram")
+
+    @setting(7, returns="*3w")
+    def read_histogram(self, c):
+        """Return the histogram accumulated since start_histogram_stream,
+        as of the acquisition thread's last pass over the stream. The
+        first dimension is for APDs, the second is for the gate index within
+        a sample, and the third is for arrival time bins
+        """
+        if self.histogram_num_bins is None:
+            logging.error("read_histogram attempted without a histogram stream.")
+            return
+        with self.acquisition_condition:
+            if self.histogram is None:
+                num_apds = len(self.stream_apd_indices)
+                shape = (num_apds, 0, self.histogram_num_bins)
+                return np.zeros(shape, dtype=np.uint32)
+            return self.histogram.astype(np.uint32)
+
+    @setting(8, bin_width="i", window="i", apd_indices="*i")
+    def start_g2_stream(self, c, bin_width, window, apd_indices=None):
+        """Start a tag stream that is accumulated into a histogram of the
+        delays between clicks on two APDs, as for a g2 measurement. All
+        pairs of clicks are correlated, not just start-stop. Only the
+        histogram crosses LabRAD (see read_g2). Close with stop_tag_stream.
+
+        Params
+            bin_width: int
+                Bin width in ps
+            window: int
+                Delays from -window up to window are histogrammed, in ps
+            apd_indices: list(int)
+                The start and stop APDs. Default is [0, 1]
+        """
+        if apd_indices is None:
+            apd_indices = [0, 1]
+        if len(apd_indices) != 2:
+            logging.error("start_g2_stream requires exactly two APDs.")
+            return
+        self.start_tag_stream(c, apd_indices, apd_gate=False, clock=False)
+        self.g2_bin_width = bin_width
+        self.g2_window = window
+        num_bins = (2 * window) // bin_width
+        self.g2_histogram = np.zeros(num_bins, dtype=np.int64)
+        self.start_acquisition("g2")
+
+    @setting(9, returns="*v*w")
+    def read_g2(self, c):
+        """Return the delay histogram accumulated since start_g2_stream as
+        the delay at the start of each bin in ps and the number of
+        coincidences in the bin. Delays are stop click minus start click
+        """
+        if self.g2_histogram is None:
+            logging.error("read_g2 attempted without a g2 stream.")
+            return
+        with self.acquisition_condition:
+            g2_histogram = self.g2_histogram.astype(np.uint32)
+        num_bins = len(g2_histogram)
+        delays = -self.g2_window + self.g2_bin_width * np.arange(num_bins)
+        return delays.astype(float), g2_histogram
+
 
 __server__ = TaggerSwab20()
 
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+Stand-in for the Time Tagger that feeds the Tagger interface from software
+instead of hardware. Tags come from either a recorded tag file or a synthetic
+generator of Poissonian APD clicks with the clock and gate structure of a
+sequence. Use it to exercise and benchmark the counter path on any box.
+
+Recorded tag files are .npy structured arrays with an int64 "timestamp" field
+in ps and an int32 "channel" field - see save_tags. They're memory-mapped, so
+they can be much larger than RAM.
+
+Created on October 18th, 2026
+
+### BEGIN NODE INFO
+[info]
+name = tagger_replay
+version = 1.0
+description =
+[startup]
+cmdline = %PYTHON% %FILE%
+timeout = 20
+[shutdown]
+message = 987654321
+timeout = 5
+### END NODE INFO
+"""
+
+from labrad.server import LabradServer
+from labrad.server import setting
+import numpy as np
+import logging
+import re
+import socket
+import time
+from servers.inputs.interfaces.tagger import Tagger
+from utils import common
+
+tag_dtype = np.dtype([("timestamp", "<i8"), ("channel", "<i4")])
+
+
+def save_tags(file_path, timestamps, channels):
+    """Save tags (e.g. from tool_belt.decode_tag_stream) to a file that can be
+    replayed with load_replay_file
+    """
+    tags = np.empty(len(timestamps), dtype=tag_dtype)
+    tags["timestamp"] = timestamps
+    tags["channel"] = channels
+    np.save(file_path, tags)
+
+
+class ReplaySource:
+    """Replays the tags in a recorded tag file. If realtime, each read returns
+    the tags recorded in the wall time since the last read. Otherwise each
+    read returns read_dur ps worth of tags as fast as they're requested
+    """
+
+    def __init__(self, file_path, realtime, read_dur):
+        self.tags = np.load(file_path, mmap_mode="r")
+        self.realtime = realtime
+        self.read_dur = read_dur
+        self.start_time = time.perf_counter()
+        self.first_timestamp = self.tags["timestamp"][0] if len(self.tags) else 0
+        self.end_time = self.first_timestamp
+        self.read_ind = 0
+
+    def clear(self):
+        """Drop any tags that have come in but haven't been read"""
+        if self.realtime:
+            self.end_time = self.next_time()
+            self.read_ind = np.searchsorted(self.tags["timestamp"], self.end_time)
+
+    def next_time(self):
+        if not self.realtime:
+            return self.end_time + self.read_dur
+        elapsed = round((time.perf_counter() - self.start_time) * 10**12)
+        return self.first_timestamp + elapsed
+
+    def read(self):
+        self.end_time = self.next_time()
+        end_ind = np.searchsorted(self.tags["timestamp"], self.end_time)
+        # Copy out of the memory map
+        tags = np.array(self.tags[self.read_ind : end_ind])
+        self.read_ind = end_ind
+        return tags["timestamp"], tags["channel"]
+
+
+class SyntheticSource:
+    """Generates Poissonian clicks on the APD channels, with the gate and
+    clock tags of a sequence that repeats a gate of gate_dur ps every
+    rep_period ps, num_reps times per sample, and then clocks. The clicks are
+    uniform in time, so only the fraction inside the gates is counted. If
+    realtime, each read returns the tags for the wall time since the last
+    read. Otherwise each read returns read_dur ps worth of tags as fast as
+    they're requested
+    """
+
+    def __init__(
+        self,
+        apd_channels,
+        apd_gate_channel,
+        clock_channel,
+        count_rate,
+        rep_period,
+        gate_dur,
+        num_reps,
+        realtime,
+        read_dur,
+    ):
+        self.apd_channels = apd_channels
+        self.apd_gate_channel = apd_gate_channel
+        self.clock_channel = clock_channel
+        # Click rate per APD in clicks per ps
+        self.click_rate = count_rate * 10**-12
+        self.rep_period = rep_period
+        self.gate_dur = gate_dur
+        self.num_reps = num_reps
+        self.realtime = realtime
+        self.read_dur = read_dur
+        self.rng = np.random.default_rng()
+        self.start_time = time.perf_counter()
+        self.end_time = 0
+
+    def clear(self):
+        """Drop any tags that have come in but haven't been read"""
+        if self.realtime:
+            self.end_time = self.next_time()
+
+    def next_time(self):
+        if not self.realtime:
+            return self.end_time + self.read_dur
+        return round((time.perf_counter() - self.start_time) * 10**12)
+
+    def read(self):
+        start_time = self.end_time
+        self.end_time = self.next_time()
+        end_time = self.end_time
+
+        # Gate edges and clocks from the sequence structure in [start, end).
+        # A gate that opened in an earlier read can close in this one, so the
+        # closes come from their own range of reps
+        first_rep = -(-start_time // self.rep_period)
+        rep_inds = np.arange(first_rep, end_time // self.rep_period + 1)
+        opens = rep_inds * self.rep_period
+        first_rep = -(-(start_time - self.gate_dur) // self.rep_period)
+        rep_inds = np.arange(first_rep, end_time // self.rep_period + 1)
+        closes = rep_inds * self.rep_period + self.gate_dur
+        # Clock right at the end of each sample, after its last gate closes
+        sample_period = self.num_reps * self.rep_period
+        first_sample = -(-(start_time + 1) // sample_period)
+        sample_inds = np.arange(first_sample, (end_time + 1) // sample_period + 1)
+        clocks = sample_inds * sample_period - 1
+        edge_times = [
+            times[(times >= start_time) & (times < end_time)]
+            for times in (opens, closes, clocks)
+        ]
+        edge_channels = [
+            self.apd_gate_channel,
+            -self.apd_gate_channel,
+            self.clock_channel,
+        ]
+        edge_channels = [
+            np.full(len(times), chan) for times, chan in zip(edge_times, edge_channels)
+        ]
+
+        # Poissonian clicks from each APD
+        click_times = []
+        click_channels = []
+        for apd_channel in self.apd_channels:
+            num_clicks = self.rng.poisson(self.click_rate * (end_time - start_time))
+            click_times.append(self.rng.integers(start_time, end_time, num_clicks))
+            click_channels.append(np.full(num_clicks, apd_channel))
+
+        timestamps = np.concatenate((*edge_times, *click_times))
+        channels = np.concatenate((*edge_channels, *click_channels))
+        order = np.argsort(timestamps, kind="stable")
+        return timestamps[order].astype(np.int64), channels[order].astype(np.int32)
+
+
+class TaggerReplay(Tagger, LabradServer):
+    name = "tagger_replay"
+    pc_name = socket.gethostname()
+
+    def initServer(self):
+        # Log to the console since this may run on a box without the lab's
+        # logging directory
+        logging.basicConfig(
+            level=logging.INFO,
+            format="%(asctime)s %(levelname)-8s %(message)s",
+            datefmt="%y-%m-%d_%H-%M-%S",
+        )
+
+        config = common.get_config_dict()
+        self.config_apd_indices = config["apd_indices"]
+        self.source = None
+
+        # Wiring
+        wiring = config["Wiring"]["Tagger"]
+        self.tagger_di_clock = wiring["di_clock"]
+        self.tagger_di_apd_gate = wiring["di_apd_gate"]
+
+        # Get the APD channels
+        self.tagger_di_apd = {}
+        keys = wiring.keys()
+        for key in keys:
+            if re.fullmatch(r"di_apd_[0-9]+", key):
+                apd_index = int(key.split("_")[2])
+                di_apd = wiring[key]
+                self.tagger_di_apd[apd_index] = di_apd
+
+        self.reset_tag_stream_state()
+        logging.info("init complete")
+
+    def read_raw_stream(self):
+        if self.stream is None:
+            logging.error("read_raw_stream attempted while stream is None.")
+            return
+        start = time.perf_counter()
+        timestamps, channels = self.stream.read()
+        latency = time.perf_counter() - start
+        # Like a TimeTagStream, only return the channels in the stream
+        in_stream = np.isin(channels, self.stream_channels)
+        timestamps = timestamps[in_stream]
+        channels = channels[in_stream]
+        self.record_raw_read(len(channels), 0, False, latency)
+        return timestamps, channels
+
+    def get_poll_interval(self):
+        # Sources that aren't realtime produce tags as fast as they're read,
+        # so don't wait between reads
+        if self.stream is not None and not self.stream.realtime:
+            return 0
+        return super().get_poll_interval()
+
+    def stop_tag_stream_internal(self):
+        self.stop_acquisition()
+        self.reset_tag_stream_state()
+
+    @setting(10, file_path="s", realtime="b", read_dur="i")
+    def load_replay_file(self, c, file_path, realtime=True, read_dur=10**10):
+        """Replay the tags in a recorded tag file (see save_tags) in the
+        streams started from now on.
+
+        Params
+            file_path: str
+                Path to the .npy tag file
+            realtime: bool
+                If True, tags come in at the rate they were recorded.
+                Otherwise they come in as fast as they're read
+            read_dur: int
+                Recorded time in ps returned by each read if not realtime
+        """
+        self.source = (ReplaySource, (file_path, realtime, read_dur))
+
+    @setting(
+        11,
+        count_rate="v",
+        rep_period="i",
+        gate_dur="i",
+        num_reps="i",
+        realtime="b",
+        read_dur="i",
+    )
+    def load_synthetic_source(
+        self,
+        c,
+        count_rate,
+        rep_period,
+        gate_dur,
+        num_reps=1,
+        realtime=True,
+        read_dur=10**10,
+    ):
+        """Generate synthetic tags in the streams started from now on. Each
+        APD clicks at count_rate, and the gates and clock follow a sequence
+        that opens a gate for gate_dur at the start of every rep_period,
+        num_reps times per sample.
+
+        Params
+            count_rate: float
+                Click rate per APD in counts per second
+            rep_period: int
+                Period of the reps in ps
+            gate_dur: int
+                Gate duration in ps. Must be less than rep_period
+            num_reps: int
+                Gates per sample
+            realtime: bool
+                If True, tags come in at the real rate. Otherwise they come in
+                as fast as they're read, for throughput benchmarks
+            read_dur: int
+                Simulated time in ps returned by each read if not realtime
+        """
+        if gate_dur >= rep_period:
+            logging.error("Synthetic gate_dur must be less than rep_period.")
+            return
+        args = (count_rate, rep_period, gate_dur, num_reps, realtime, read_dur)
+        self.source = (SyntheticSource, args)
+
+    @setting(0, returns="*i")
+    def get_channel_mapping(self, c):
+        """As a regexp, the order is:
+        [+APD, ?gate open, ?gate close, ?clock]
+        Whether certain channels will be present/how many channels of a given
+        type will be present is based on the channels passed to
+        start_tag_stream.
+        """
+        return self.stream_channels
+
+    @setting(1, apd_indices="*i", apd_gate="b", clock="b")
+    def start_tag_stream(self, c, apd_indices=None, apd_gate=True, clock=True):
+        """Expose a raw tag stream from the source loaded with
+        load_replay_file or load_synthetic_source. The stream can be read
+        with read_tag_stream and closed with stop_tag_stream.
+        """
+
+        # Make sure the existing stream is stopped and we have fresh state
+        if self.stream is not None:
+            logging.warning(
+                "New stream started before existing stream was "
+                "stopped. Stopping existing stream."
+            )
+            self.stop_tag_stream_internal()
+        else:
+            self.reset_tag_stream_state()
+
+        if self.source is None:
+            logging.error("start_tag_stream attempted without a loaded source.")
+            return
+
+        if apd_indices is None:
+            apd_indices = self.config_apd_indices
+
+        channels = []
+        for ind in apd_indices:
+            channels.append(self.tagger_di_apd[ind])
+        if apd_gate:
+            channels.append(self.tagger_di_apd_gate)
+            channels.append(-self.tagger_di_apd_gate)
+        if clock:
+            channels.append(self.tagger_di_clock)
+        self.stream_channels = channels
+
+        source_class, args = self.source
+        if source_class is SyntheticSource:
+            apd_channels = [self.tagger_di_apd[ind] for ind in apd_indices]
+            gate_clock = (self.tagger_di_apd_gate, self.tagger_di_clock)
+            args = (apd_channels, *gate_clock, *args)
+        self.stream = source_class(*args)
+        self.stream_apd_indices = apd_indices
+
+    @setting(2)
+    def stop_tag_stream(self, c):
+        """Closes the stream started with start_tag_stream. Resets
+        leftovers.
+        """
+        self.stop_tag_stream_internal()
+
+    @setting(3)
+    def clear_buffer(self, c):
+        """Drop the tags that have come in but haven't been read, along
+        with any unread samples the acquisition thread has buffered."""
+        with self.acquisition_lock:
+            self.stream.clear()
+            with self.acquisition_condition:
+                self.clear_ring_buffer()
+
+    @setting(5)
+    def reset(self, c):
+        self.stop_tag_stream_internal()
+
+
+__server__ = TaggerReplay()
+
+if __name__ == "__main__":
+    from labrad import util
+
+    util.runServer(__server__)
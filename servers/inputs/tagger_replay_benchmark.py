@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput and regression check for the counter path of the Tagger interface,
+run against TaggerReplay so no hardware or LabRAD connection is needed.
+
+For each number of gates per sample, a synthetic stream of Poissonian clicks
+is read through the acquisition thread and ring buffer with the same
+read-and-reduce path as read_counter_simple, and the throughput is reported
+along with the mean counts per gate against the expected count_rate *
+gate_dur. The raw tags of a second synthetic stream are then recorded,
+replayed from file through read_counter_complete's path, and compared against
+tags_to_counts run on the whole recording at once, so any change to the
+chunked processing that changes the counts shows up as a mismatch. Exits
+with status 1 if any check fails.
+
+Created on October 18th, 2026
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from servers.inputs.interfaces.counter import reduce_complete, reduce_simple
+from servers.inputs.interfaces.tagger import tags_to_counts
+from servers.inputs.tagger_replay import TaggerReplay, save_tags
+
+# Wiring of the replay tagger
+apd_channels = {0: 5, 1: 6}
+apd_gate_channel = 7
+clock_channel = 8
+
+# Synthetic sequence: 1 Mcps per APD, a 300 ns gate every 1 us
+count_rate = 1e6
+rep_period = 10**6
+gate_dur = 3 * 10**5
+# Simulated time in ps per raw read. Not a multiple of rep_period, so read
+# boundaries land inside gates
+read_dur = 10**10 + 150_001
+# Allowed deviation of the mean counts per gate from expected, in standard
+# errors
+num_stes = 5
+
+
+def make_tagger():
+    """TaggerReplay with the wiring set directly instead of from the
+    registry in initServer
+    """
+    tagger = TaggerReplay()
+    tagger.tagger_di_clock = clock_channel
+    tagger.tagger_di_apd_gate = apd_gate_channel
+    tagger.tagger_di_apd = dict(apd_channels)
+    tagger.config_apd_indices = list(apd_channels)
+    tagger.source = None
+    tagger.reset_tag_stream_state()
+    return tagger
+
+
+def benchmark_throughput(tagger, num_reps, num_samples):
+    """Read num_samples samples of num_reps gates each off a synthetic
+    stream. Returns the time in s, the number of tags processed, the mean
+    counts per gate per APD, and the number of gates times APDs that the
+    mean is over
+    """
+    tagger.load_synthetic_source(
+        None, count_rate, rep_period, gate_dur, num_reps, False, read_dur
+    )
+    tagger.start_tag_stream(None)
+    start = time.perf_counter()
+    counts = reduce_simple(tagger.read_counter_setting_internal(num_samples))
+    elapsed = time.perf_counter() - start
+    telemetry = dict(tagger.get_stream_telemetry(None))
+    tagger.stop_tag_stream(None)
+    if len(counts) < num_samples:
+        print(f"Only read {len(counts)} of {num_samples} samples")
+    # reduce_simple sums over the APDs
+    num_gates = counts.size * num_reps * len(apd_channels)
+    mean_counts = counts.sum() / num_gates
+    return elapsed, telemetry["num_tags"], mean_counts, num_gates
+
+
+def check_replay(tagger, file_path, num_reps, num_raw_reads):
+    """Record num_raw_reads raw reads of a synthetic stream to file_path,
+    replay them through the counter path, and compare against converting the
+    whole recording in one call. Returns whether the counts match
+    """
+    tagger.load_synthetic_source(
+        None, count_rate, rep_period, gate_dur, num_reps, False, read_dur
+    )
+    tagger.start_tag_stream(None)
+    reads = [tagger.read_raw_stream() for _ in range(num_raw_reads)]
+    tagger.stop_tag_stream(None)
+    timestamps = np.concatenate([read[0] for read in reads])
+    channels = np.concatenate([read[1] for read in reads])
+    save_tags(file_path, timestamps, channels)
+
+    ref_counts, _ = tags_to_counts(
+        channels,
+        clock_channel,
+        apd_gate_channel,
+        np.array(list(apd_channels.values())),
+        np.empty((0), dtype=np.int32),
+    )
+    ref_counts = reduce_complete(ref_counts)
+
+    # Replay in shorter reads than were recorded so that samples straddle
+    # the reads
+    tagger.load_replay_file(None, str(file_path), False, read_dur // 7)
+    tagger.start_tag_stream(None)
+    counts = reduce_complete(tagger.read_counter_setting_internal(len(ref_counts)))
+    tagger.stop_tag_stream(None)
+    return np.array_equal(counts, ref_counts)
+
+
+if __name__ == "__main__":
+    tagger = make_tagger()
+    expected_counts = count_rate * gate_dur * 10**-12
+    failures = []
+
+    for num_reps in [1, 10, 100, 1000]:
+        num_samples = max(10**6 // num_reps, 100)
+        elapsed, num_tags, mean_counts, num_gates = benchmark_throughput(
+            tagger, num_reps, num_samples
+        )
+        msg = (
+            "{} reps: {:.0f} samples/s, {:.2e} tags/s, "
+            "{:.4f} counts per gate (expected {:.4f})"
+        )
+        print(
+            msg.format(
+                num_reps,
+                num_samples / elapsed,
+                num_tags / elapsed,
+                mean_counts,
+                expected_counts,
+            )
+        )
+        # Counts per gate are Poissonian
+        tolerance = num_stes * np.sqrt(expected_counts / num_gates)
+        if abs(mean_counts - expected_counts) > tolerance:
+            failures.append(f"{num_reps} reps counts per gate")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = Path(temp_dir) / "tags.npy"
+        for num_reps in [1, 100]:
+            match = check_replay(tagger, file_path, num_reps, 10)
+            print(f"{num_reps} reps replay: match: {match}")
+            if not match:
+                failures.append(f"{num_reps} reps replay")
+
+    if failures:
+        print(f"Failed: {', '.join(failures)}")
+        sys.exit(1)
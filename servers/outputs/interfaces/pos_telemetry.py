@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Interface for positioning servers that can stream their axis positions. A
+background thread samples the positions at a fixed rate into a timestamped
+ring buffer, and clients pull all the samples over a time window in one call
+once a scan is done, instead of reading the position after every point
+
+Created on October 18th, 2026
+"""
+
+from abc import ABC, abstractmethod
+import logging
+import threading
+import time
+import numpy as np
+from labrad.server import setting
+from twisted.internet.threads import deferToThread
+
+
+class PosTelemetry(ABC):
+    # Number of samples the ring buffer holds before the oldest are dropped
+    telemetry_buffer_size = 10**5
+    # Default sampling rate in Hz
+    telemetry_rate = 200.0
+
+    def init_telemetry(self):
+        """Call in initServer before starting the telemetry"""
+        # Guards the ring buffer filled by the telemetry thread
+        self.telemetry_lock = threading.Lock()
+        self.telemetry_stop = None
+        self.telemetry_thread = None
+        # Each row is (timestamp, x, y, z)
+        self.telemetry_buffer = np.empty((self.telemetry_buffer_size, 4))
+        self.telemetry_start = 0
+        self.telemetry_num_samples = 0
+
+    @abstractmethod
+    def read_telemetry_positions(self, task):
+        """Return the current (x, y, z) positions. Called from the telemetry
+        thread, so it must not block on the reactor's thread. task is what
+        setup_telemetry returned for this thread
+        """
+        pass
+
+    def setup_telemetry(self):
+        """Called from the telemetry thread before the first sample, e.g. to
+        open a persistent hardware task. The return value is passed to
+        read_telemetry_positions and cleanup_telemetry, so it stays local to
+        the thread even if a new thread starts before this one has finished
+        """
+        return None
+
+    def cleanup_telemetry(self, task):
+        """Called from the telemetry thread after the last sample with what
+        setup_telemetry returned
+        """
+        pass
+
+    # region Telemetry thread
+
+    def start_telemetry(self, rate=None):
+        if rate is not None:
+            self.telemetry_rate = rate
+        if self.telemetry_thread is not None:
+            return
+        # Each thread gets its own stop event in case a stopped thread is
+        # still finishing its last read when a new one starts
+        self.telemetry_stop = threading.Event()
+        self.telemetry_thread = threading.Thread(
+            target=self.telemetry_loop, args=(self.telemetry_stop,), daemon=True
+        )
+        self.telemetry_thread.start()
+
+    def stop_telemetry(self):
+        """Signal the telemetry thread to stop. Returns a Deferred that fires
+        once the thread has finished, or None if there's no thread
+        """
+        if self.telemetry_thread is None:
+            return None
+        self.telemetry_stop.set()
+        thread = self.telemetry_thread
+        self.telemetry_thread = None
+        # Reads that go through the reactor can't finish while the reactor's
+        # thread is blocked, so wait on the thread from the thread pool
+        return deferToThread(thread.join)
+
+    def telemetry_loop(self, stop):
+        try:
+            task = self.setup_telemetry()
+        except Exception as exc:
+            logging.exception(exc)
+            return
+        # Sample on a fixed schedule so that slow reads don't make the
+        # sampling drift
+        next_sample = time.time()
+        while not stop.is_set():
+            try:
+                timestamp = time.time()
+                positions = self.read_telemetry_positions(task)
+                self.push_telemetry(timestamp, positions)
+            except Exception as exc:
+                logging.exception(exc)
+            next_sample = max(next_sample + 1 / self.telemetry_rate, time.time())
+            stop.wait(next_sample - time.time())
+        try:
+            self.cleanup_telemetry(task)
+        except Exception as exc:
+            logging.exception(exc)
+
+    def push_telemetry(self, timestamp, positions):
+        """Append a sample to the ring buffer, overwriting the oldest sample
+        if it's full
+        """
+        with self.telemetry_lock:
+            capacity = len(self.telemetry_buffer)
+            write_ind = (self.telemetry_start + self.telemetry_num_samples) % capacity
+            self.telemetry_buffer[write_ind, 0] = timestamp
+            self.telemetry_buffer[write_ind, 1:] = positions
+            if self.telemetry_num_samples < capacity:
+                self.telemetry_num_samples += 1
+            else:
+                self.telemetry_start = (self.telemetry_start + 1) % capacity
+
+    def get_telemetry_window(self, start, stop):
+        """Return the samples with start <= timestamp <= stop, oldest first"""
+        with self.telemetry_lock:
+            capacity = len(self.telemetry_buffer)
+            inds = np.arange(self.telemetry_num_samples) + self.telemetry_start
+            samples = self.telemetry_buffer[inds % capacity]
+        # Timestamps are increasing, so the window is a contiguous slice
+        timestamps = samples[:, 0]
+        start_ind = np.searchsorted(timestamps, start, side="left")
+        stop_ind = np.searchsorted(timestamps, stop, side="right")
+        return samples[start_ind:stop_ind]
+
+    # endregion
+    # region Settings
+
+    @setting(300, rate="v[]")
+    def start_position_telemetry(self, c, rate=None):
+        """Start sampling the positions in the background
+
+        Params
+            rate: float
+                Sampling rate in Hz. Defaults to the last rate used
+        """
+        self.start_telemetry(rate)
+
+    @setting(301)
+    def stop_position_telemetry(self, c):
+        """Stop sampling the positions. Returns once the sampling thread has
+        finished. The buffered samples are kept
+        """
+        return self.stop_telemetry()
+
+    @setting(302, returns="v[]")
+    def get_telemetry_time(self, c):
+        """Return the server's current time in s. Telemetry timestamps are on
+        this clock, which may be on a different PC than the client
+        """
+        return time.time()
+
+    @setting(303, start="v[]", stop="v[]", returns="*2v")
+    def read_position_telemetry(self, c, start=0.0, stop=np.inf):
+        """Return the position samples over a window of time
+
+        Params
+            start: float
+                Start of the window in s on the server's clock
+            stop: float
+                End of the window in s on the server's clock
+
+        Returns
+            array(float)
+                One row per sample of (timestamp, x, y, z), oldest first
+        """
+        samples = self.get_telemetry_window(start, stop)
+        if len(samples) == 0:
+            return np.empty((0, 4))
+        return samples
+
+    # endregion
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Base class for positioning servers that drive their axes with analog outputs on
+an NI DAQ, e.g. the PI piezo stages and the Thorlabs galvos. Setting up a DAQ
+task (creating it, adding channels, configuring timing) takes much longer than
+writing to one, which dominates short scans like optimize sweeps. So rather
+than building a new task for every write and every stream, we keep one
+persistent task per set of channels for writes and one for streams, and only
+rewrite the buffer and sample count between stream loads.
+
+Created on October 18th, 2026
+"""
+
+from labrad.server import LabradServer
+import nidaqmx
+import nidaqmx.stream_writers as stream_writers
+from nidaqmx.constants import AcquisitionType
+import numpy
+
+
+class PosDaqAoBase(LabradServer):
+    # Output range of the AO channels. Subclasses with channels on different
+    # ranges can override get_ao_limits
+    ao_min_val = -10.0
+    ao_max_val = 10.0
+    # Set the DAC reference voltage of the channels if not None
+    ao_dac_ref_val = None
+
+    def init_daq_ao(self):
+        """Call in initServer before any writes"""
+        # Persistent tasks by tuple of channel names
+        self.write_tasks = {}
+        self.stream_tasks = {}
+        self.stream_writers = {}
+        # Last (freq, num_samples, sample_mode) configured on each stream task
+        self.stream_timings = {}
+        # Channels of the stream task that was last started
+        self.running_stream = None
+
+    def stopServer(self):
+        self.close_task_internal()
+
+    def get_ao_task(self, tasks, chans, task_type):
+        """Get the persistent task for these channels out of tasks, creating
+        it if this is the first time we've used them
+        """
+        key = tuple(chans)
+        if key not in tasks:
+            task = nidaqmx.Task(f"{self.name}-{task_type}_{len(tasks)}")
+            for chan in chans:
+                min_val, max_val = self.get_ao_limits(chan)
+                channel = task.ao_channels.add_ao_voltage_chan(
+                    chan, min_val=min_val, max_val=max_val
+                )
+                if self.ao_dac_ref_val is not None:
+                    channel.ao_dac_ref_val = self.ao_dac_ref_val
+            tasks[key] = task
+        return tasks[key]
+
+    def get_ao_limits(self, chan):
+        """Get the (min, max) output voltages of a channel"""
+        return self.ao_min_val, self.ao_max_val
+
+    def write_ao(self, chans, voltages):
+        """Write one voltage to each channel, stopping any running stream"""
+        self.stop_stream_internal()
+        task = self.get_ao_task(self.write_tasks, chans, "write")
+        task.write(list(voltages))
+
+    def load_stream_ao(self, chans, stream_voltages, freq, continuous=False):
+        """Load voltages to step through on the clock and start the stream.
+        The first voltages are written on the first clock pulse, so write the
+        starting position with write_ao before calling this
+
+        Params
+            chans: list(str)
+                DAQ channels to stream on
+            stream_voltages: array(float)
+                Voltages to write, one row per channel. May be 1D for a
+                single channel
+            freq: float
+                Max expected clock rate in Hz
+            continuous: bool
+                If True, loop through the voltages continuously
+        """
+        self.stop_stream_internal()
+        stream_voltages = numpy.atleast_2d(stream_voltages)
+        stream_voltages = numpy.ascontiguousarray(stream_voltages, dtype=numpy.float64)
+        num_stream_voltages = stream_voltages.shape[1]
+        if num_stream_voltages == 0:
+            return
+
+        key = tuple(chans)
+        task = self.get_ao_task(self.stream_tasks, chans, "stream")
+        if key not in self.stream_writers:
+            output_stream = nidaqmx.task.OutStream(task)
+            writer = stream_writers.AnalogMultiChannelWriter(output_stream)
+            self.stream_writers[key] = writer
+
+        # Configure the sample to advance on the rising edge of the clock. The
+        # buffer is sized by the sample count, so only reconfigure if it changed
+        if continuous:
+            sample_mode = AcquisitionType.CONTINUOUS
+        else:
+            sample_mode = AcquisitionType.FINITE
+        timing = (freq, num_stream_voltages, sample_mode)
+        if self.stream_timings.get(key) != timing:
+            task.timing.cfg_samp_clk_timing(
+                freq,
+                source=self.daq_di_clock,
+                samps_per_chan=num_stream_voltages,
+                sample_mode=sample_mode,
+            )
+            self.stream_timings[key] = timing
+
+        self.stream_writers[key].write_many_sample(stream_voltages)
+        task.start()
+        self.running_stream = key
+
+    def stop_stream_internal(self):
+        """Stop the running stream, if any, freeing its channels. A finished
+        finite stream still holds its channels until it's stopped
+        """
+        if self.running_stream is not None:
+            self.stream_tasks[self.running_stream].stop()
+            self.running_stream = None
+
+    def close_task_internal(self, task_handle=None, status=None, callback_data=None):
+        """Close all the persistent tasks. They're recreated on the next use"""
+        tasks = list(self.write_tasks.values()) + list(self.stream_tasks.values())
+        for task in tasks:
+            task.close()
+        self.init_daq_ao()
+        return 0
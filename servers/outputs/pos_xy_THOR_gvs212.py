@@ -22,19 +22,17 @@ timeout = 5
 ### END NODE INFO
 """
 
-from labrad.server import LabradServer
 from labrad.server import setting
 from twisted.internet.defer import ensureDeferred
 import nidaqmx
-from nidaqmx.constants import AcquisitionType
-import nidaqmx.stream_writers as stream_writers
 import numpy as np
 import logging
 import socket
 from servers.outputs.interfaces.pos_xy_stream import PosXyStream
+from servers.outputs.pos_daq_ao_base import PosDaqAoBase
 
 
-class PosXyThorGvs212(LabradServer, PosXyStream):
+class PosXyThorGvs212(PosDaqAoBase, PosXyStream):
     name = "pos_xy_THOR_gvs212"
     pc_name = socket.gethostname()
 
@@ -49,7 +47,7 @@ class PosXyThorGvs212(LabradServer, PosXyStream):
             datefmt="%y-%m-%d_%H-%M-%S",
             filename=filename,
         )
-        self.task = None
+        self.init_daq_ao()
         self.sub_init_server_xy()
 
     def sub_init_server_xy(self):
@@ -72,16 +70,6 @@ class PosXyThorGvs212(LabradServer, PosXyStream):
         self.daq_di_clock = config[2]
         logging.debug("Init complete")
 
-    def stopServer(self):
-        self.close_task_internal()
-
-    def close_task_internal(self, task_handle=None, status=None, callback_data=None):
-        task = self.task
-        if task is not None:
-            task.close()
-            self.task = None
-        return 0
-
     @setting(0, xVoltage="v[]", yVoltage="v[]")
     def write_xy(self, c, xVoltage, yVoltage):
         """Write the specified voltages to the galvo.
@@ -93,20 +81,9 @@ class PosXyThorGvs212(LabradServer, PosXyStream):
                 Voltage to write to the y channel
         """
 
-        # Close the stream task if it exists
-        # This can happen if we quit out early
-        if self.task is not None:
-            self.close_task_internal()
-
-        with nidaqmx.Task() as task:
-            # Set up the output channels
-            task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_galvo_x, min_val=-10.0, max_val=10.0
-            )
-            task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_galvo_y, min_val=-10.0, max_val=10.0
-            )
-            task.write([xVoltage, yVoltage])
+        # This stops the stream if it's still running, e.g. if we quit out early
+        chans = [self.daq_ao_galvo_x, self.daq_ao_galvo_y]
+        self.write_ao(chans, [xVoltage, yVoltage])
 
     @setting(1, returns="*v[]")
     def read_xy(self, c):
@@ -134,10 +111,6 @@ class PosXyThorGvs212(LabradServer, PosXyStream):
 
         voltages = np.vstack((coords_x, coords_y))
 
-        # Close the existing task if there is one
-        if self.task is not None:
-            self.close_task_internal()
-
         # Write the initial voltages and stream the rest
         num_voltages = voltages.shape[1]
         self.write_xy(c, voltages[0, 0], voltages[1, 0])
@@ -146,48 +119,12 @@ class PosXyThorGvs212(LabradServer, PosXyStream):
             stream_voltages = np.roll(voltages, -1, axis=1)
         else:
             stream_voltages = voltages[:, 1:num_voltages]
-        stream_voltages = np.ascontiguousarray(stream_voltages)
-        num_stream_voltages = num_voltages - 1
-        # Create a new task
-        task = nidaqmx.Task(f"{self.name}-load_stream_xy")
-        self.task = task
-
-        # Set up the output channels
-        task.ao_channels.add_ao_voltage_chan(
-            self.daq_ao_galvo_x, min_val=-10.0, max_val=10.0
-        )
-        task.ao_channels.add_ao_voltage_chan(
-            self.daq_ao_galvo_y, min_val=-10.0, max_val=10.0
-        )
-
-        # Set up the output stream
-        output_stream = nidaqmx.task.OutStream(task)
-        writer = stream_writers.AnalogMultiChannelWriter(output_stream)
 
-        # Configure the sample to advance on the rising edge of the PFI input.
         # The frequency specified is just the max expected rate in this case.
-        # We'll stop once we've run all the samples.
         freq = 100  # Just guess a data rate of 100 Hz
-        if continuous:
-            task.timing.cfg_samp_clk_timing(
-                freq,
-                source=self.daq_di_clock,
-                samps_per_chan=num_stream_voltages,
-                sample_mode=AcquisitionType.CONTINUOUS,
-            )
-        else:
-            task.timing.cfg_samp_clk_timing(
-                freq,
-                source=self.daq_di_clock,
-                samps_per_chan=num_stream_voltages,
-            )
-
-        writer.write_many_sample(stream_voltages)
-
-        # Close the task once we've written all the samples
-        task.register_done_event(self.close_task_internal)
-        task.start()
-        
+        chans = [self.daq_ao_galvo_x, self.daq_ao_galvo_y]
+        self.load_stream_ao(chans, stream_voltages, freq, continuous)
+
     @setting(3)
     def reset(self, c):
         self.close_task_internal()
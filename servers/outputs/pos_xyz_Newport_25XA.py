@@ -25,17 +25,192 @@ timeout = 5
 from labrad.server import LabradServer
 from labrad.server import setting
 from twisted.internet.defer import ensureDeferred
+from twisted.internet.defer import Deferred
+from twisted.internet.defer import succeed
+from twisted.internet import reactor
+from twisted.internet.endpoints import TCP4ClientEndpoint
+from twisted.internet.endpoints import connectProtocol
+from twisted.internet.protocol import Protocol
+from twisted.internet.task import deferLater
+from twisted.internet.threads import blockingCallFromThread
+from collections import deque
 import numpy as np
 import logging
 import socket
 import json
 import os
+import re
 import time
+from servers.outputs.interfaces.pos_telemetry import PosTelemetry
+
+# Commands that return a value without ending in "?", e.g. "1TP"
+query_mnemonics = ["TP", "TE", "TB", "TS"]
+
+
+def is_query(command):
+    """Whether the controller will respond to this command"""
+    mnemonic = command.lstrip("0123456789")
+    return command.endswith("?") or mnemonic in query_mnemonics
+
+
+class StageProtocol(Protocol):
+    """Pipelined command channel to the stage controller. Commands are sent as
+    frames, several commands joined by ";" and terminated by a carriage
+    return, which the controller executes in order. The controller only
+    responds to queries, and answers frames in the order they were sent, so
+    each frame with queries gets a Deferred that is fired by the next
+    responses off the wire. Frames are written as soon as they're sent, so
+    any number can be in flight at once.
+
+    If a response times out, the responses behind it can't be matched to
+    their frames anymore, so every pending frame fails and the channel is
+    resynced: a marker query is sent and every line is dropped until its
+    response comes back.
+    """
+
+    # Marker query for resyncing, and its response. The server sets the
+    # response to the controller's version string once it's connected.
+    # Until then any line with "Version" in it matches
+    resync_command = "VE?"
+    resync_response = None
+
+    def __init__(self, response_timeout=1.0):
+        self.response_timeout = response_timeout
+        self.buffer = b""
+        # Frames waiting on responses, as [Deferred, num_queries, responses]
+        self.pending = deque()
+        # Timeout call of the last marker query while we're resyncing, else
+        # None. Each marker sent gets one response
+        self.resync_call = None
+        self.num_markers = 0
+        # Marker timeouts in a row without hearing anything back
+        self.num_silent_timeouts = 0
+
+    def send_frame(self, commands):
+        """Send a frame of commands. Returns a Deferred that fires with the
+        list of responses to the queries in the frame, in order
+        """
+        num_queries = len([command for command in commands if is_query(command)])
+        self.transport.write(f"{';'.join(commands)}\r".encode())
+        if num_queries == 0:
+            return succeed([])
+        d = Deferred()
+        self.pending.append([d, num_queries, []])
+        timeout_call = reactor.callLater(
+            self.response_timeout, self.on_timeout, d, commands
+        )
+        d.addBoth(self.cancel_timeout, timeout_call)
+        return d
+
+    def on_timeout(self, d, commands):
+        # The response may come late or never, so fail the frames behind
+        # this one too rather than risk handing them the wrong responses
+        msg = f"Timeout waiting for response to {';'.join(commands)}"
+        logging.info(msg)
+        # Resync first so that frames sent from the errbacks queue up behind
+        # the marker
+        self.resync()
+        self.fail_pending(TimeoutError(msg))
+
+    def fail_pending(self, reason):
+        # Swap out the queue first since the errbacks may send new frames
+        pending, self.pending = self.pending, deque()
+        for d, _, _ in pending:
+            if not d.called:
+                d.errback(reason)
+
+    def resync(self):
+        """Send the marker query and drop lines until its response comes
+        back. Frames sent in the meantime are answered after the marker, so
+        they queue up as usual
+        """
+        if self.resync_call is not None:
+            return
+        self.send_marker()
+
+    def send_marker(self):
+        self.transport.write(f"{self.resync_command}\r".encode())
+        self.num_markers += 1
+        self.resync_call = reactor.callLater(
+            self.response_timeout, self.on_resync_timeout
+        )
 
-
-class PosXyzNewport25XA(LabradServer):
+    def on_resync_timeout(self):
+        logging.info("Timeout waiting for the controller to resync")
+        # If nothing at all has come back for a while, the earlier markers
+        # were lost rather than stuck behind slow responses, so only wait on
+        # the new one
+        self.num_silent_timeouts += 1
+        if self.num_silent_timeouts >= 3:
+            self.num_markers = 0
+            self.num_silent_timeouts = 0
+        self.send_marker()
+        self.fail_pending(TimeoutError("Controller out of sync"))
+
+    def is_resync_response(self, line):
+        if self.resync_response is None:
+            return "Version" in line
+        return line == self.resync_response
+
+    def cancel_timeout(self, result, timeout_call):
+        if timeout_call.active():
+            timeout_call.cancel()
+        return result
+
+    def dataReceived(self, data):
+        self.buffer += data
+        *lines, self.buffer = re.split(b"[\r\n]", self.buffer)
+        for line in lines:
+            line = line.decode("utf-8").strip()
+            if line != "":
+                self.line_received(line)
+
+    def line_received(self, line):
+        if self.resync_call is not None:
+            self.num_silent_timeouts = 0
+            if not self.is_resync_response(line):
+                logging.info(f"Dropped stale response from controller: {line}")
+                return
+            self.num_markers -= 1
+            if self.num_markers == 0:
+                self.resync_call.cancel()
+                self.resync_call = None
+            return
+        if len(self.pending) == 0:
+            logging.info(f"Unexpected response from controller: {line}")
+            return
+        frame = self.pending[0]
+        d, num_queries, responses = frame
+        # Multiple queries in a frame may be answered on one line separated
+        # by commas or on separate lines
+        if num_queries == 1:
+            responses.append(line)
+        else:
+            responses.extend(field.strip() for field in line.split(","))
+        if len(responses) >= num_queries:
+            self.pending.popleft()
+            if not d.called:
+                d.callback(responses)
+
+    def connectionLost(self, reason):
+        if self.resync_call is not None:
+            self.resync_call.cancel()
+            self.resync_call = None
+        self.fail_pending(reason)
+
+
+class PosXyzNewport25XA(PosTelemetry, LabradServer):
     name = "pos_xyz_Newport_25XA"
     pc_name = socket.gethostname()
+    # Axis numbers on the controller
+    axes = {"x": 2, "y": 3, "z": 1}
+    # Seconds to wait for the response to a query
+    response_timeout = 1.0
+    # Seconds between motion-done queries, and the longest to wait for a move
+    motion_poll_interval = 0.005
+    motion_timeout = 30.0
+    # Extra wait in ns after each trigger in a step scan, on top of the period
+    step_scan_margin = 1000
 
     def initServer(self):
 
@@ -52,6 +227,13 @@ class PosXyzNewport25XA(LabradServer):
             filename=filename,
         )
         self.task = None
+        self.stage = None
+        self.pulse_gen_name = None
+        self.step_scan = None
+        self.init_telemetry()
+        self.step_scan_positions = []
+        self.step_scan_error = None
+        self.step_scan_stop = False
         config = ensureDeferred(self.get_config())
         config.addCallback(self.on_get_config)
         # self.laser_socket = None
@@ -65,38 +247,82 @@ class PosXyzNewport25XA(LabradServer):
         return result["get"]
 
     def on_get_config(self, reg_vals):
+        return ensureDeferred(self.connect_stage(reg_vals[0], reg_vals[1]))
 
-        self.stage_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    async def connect_stage(self, ip, port):
         try:
-            self.stage_socket.connect((reg_vals[0], reg_vals[1]))
-            print(reg_vals[0], reg_vals[1])
-            response = self.send_command("VE?")
-            response_str = response.decode('utf-8').strip()
-            logging.info(response_str)
-            # logging.info(f"{response_str}")
+            endpoint = TCP4ClientEndpoint(reactor, ip, port)
+            protocol = StageProtocol(self.response_timeout)
+            self.stage = await connectProtocol(endpoint, protocol)
+            print(ip, port)
+            response = await self.send_command("VE?")
+            logging.info(response[0])
+            self.stage.resync_response = response[0]
 
         except Exception as e:
             # Log any exceptions that occur during connection
             print(e)
             logging.info(e)
-            del self.stage_socket
+            self.stage = None
 
-    def send_command(self, command):
+    def send_command(self, *commands):
+        """Send commands to the controller in one frame. Returns a Deferred
+        that fires with the responses to the queries among them
+        """
+        return self.stage.send_frame(list(commands))
+
+    async def wait_for_motion_done(self, axes):
+        """Poll the motion-done status of the axes until they've all stopped"""
+        start = time.time()
+        while True:
+            responses = await self.send_command(*[f"{axis}MD?" for axis in axes])
+            if all(int(el) == 1 for el in responses):
+                return
+            if time.time() - start > self.motion_timeout:
+                msg = f"Axes {axes} still moving after {self.motion_timeout} s"
+                raise TimeoutError(msg)
+            await deferLater(reactor, self.motion_poll_interval, lambda: None)
+
+    async def move_absolute(self, positions):
+        """Move axes to absolute positions in one frame and wait for them to
+        stop. positions is a dict of axis: position
+        """
+        commands = [f"{axis}PA{position}" for axis, position in positions.items()]
+        await self.send_command(*commands)
+        await self.wait_for_motion_done(list(positions))
+
+    async def read_positions(self, axes):
+        """Read the positions of the axes in one frame"""
+        responses = await self.send_command(*[f"{axis}TP" for axis in axes])
         try:
-            self.stage_socket.settimeout(1.0)  # Set a 5-second timeout
-            self.stage_socket.sendall(f"{command}\r".encode())
-            response = self.stage_socket.recv(1024)  # Adjust buffer size if needed
-            print(f"send_command: Received response: {repr(response)}")
-            return response
-        except socket.timeout:
-            print(f"send_command: Timeout waiting for response to {command}")
-            return None
-        except Exception as e:
-            print(f"send_command: Error: {e}")
-            raise
+            return [float(el) for el in responses]
+        except ValueError as e:
+            raise ValueError(f"Invalid response from controller: {responses}") from e
+
+    async def get_pulse_gen(self):
+        """Get the pulse gen server for this setup from the registry"""
+        if self.pulse_gen_name is None:
+            p = self.client.registry.packet()
+            p.cd(["", "Config", "Servers"])
+            p.get("pulse_gen")
+            result = await p.send()
+            self.pulse_gen_name = result["get"]
+        return self.client[self.pulse_gen_name]
+
+    def read_telemetry_positions(self, task):
+        if self.stage is None:
+            return [np.nan] * 3
+        axes = [self.axes["x"], self.axes["y"], self.axes["z"]]
+        # The stage connection lives on the reactor's thread
+        return blockingCallFromThread(
+            reactor, lambda: ensureDeferred(self.read_positions(axes))
+        )
 
     def stopServer(self):
+        self.stop_telemetry()
         self.close_task_internal()
+        if self.stage is not None:
+            self.stage.transport.loseConnection()
 
     def close_task_internal(self, task_handle=None, status=None, callback_data=None):
         task = self.task
@@ -105,7 +331,7 @@ class PosXyzNewport25XA(LabradServer):
             self.task = None
         return 0
 
-    @setting(0, axis="i", returns = "v")  
+    @setting(0, axis="i", returns = "v")
     def get_axis_position(self, c, axis):
         """Send command to get the position of the specified axis.
 
@@ -115,49 +341,38 @@ class PosXyzNewport25XA(LabradServer):
         Returns:
             float: Current position of the axis.
         """
-        # command = f"{axis}TP\r"  
-        # response = self.send_command(command)
-        # response_str = response.decode('utf-8').strip()
-        # response_parts = response_str.split(',')
-
-        command = f"{axis}TP\r"  # Send command to get position
-        response = self.send_command(command)
-        response_str = response.decode('utf-8').strip()
-
-        try:
-                position = float(response_str)
-                return position
-        except ValueError as e:
-            raise ValueError(f"Invalid response from controller: {response_str}") from e
+        d = ensureDeferred(self.read_positions([axis]))
+        d.addCallback(lambda positions: positions[0])
+        return d
 
     @setting(1, axis="i", position="v")
     def write_absolute(self, c, axis, position):
-        """Move the specified axis to an absolute position."""
-        command = f"{axis}PA{position}"  # 'PA' (Position Absolute) command
-        self.send_command(command)
+        """Move the specified axis to an absolute position and wait for it to
+        stop."""
+        return ensureDeferred(self.move_absolute({axis: position}))
 
     @setting(2, axis="i", position="v")
     def write_relative(self, c, axis, position):
-        """Move the specified axis to an absolute position."""
-        command = f"{axis}PR{position}"
-        self.send_command(command)
-    
+        """Move the specified axis by a relative distance and wait for it to
+        stop."""
+        return ensureDeferred(self.move_relative_internal(axis, position))
+
+    async def move_relative_internal(self, axis, position):
+        await self.send_command(f"{axis}PR{position}")
+        await self.wait_for_motion_done([axis])
+
     @setting(3, axis="i")
     def stop_motion(self, c, axis):
         """Stop the motion of the specified axis."""
-        command = f"{axis}ST"
-        self.send_command(command)
-    
+        return self.send_command(f"{axis}ST")
+
     @setting(4, x_start="v", x_stop="v", y_start="v", y_stop="v", num_steps="i", period="i")
     def raster_scan(self, c, x_start, x_stop, y_start, y_stop, num_steps, period):
         """Perform a raster scan (X: 2, Y: 3)."""
         x_positions = np.linspace(x_start, x_stop, num_steps)
         y_positions = np.linspace(y_start, y_stop, num_steps)
-        for y in y_positions:
-            for x in x_positions:
-                self.write_absolute(c, 2, x)  # Move X axis (Axis 2)
-                self.write_absolute(c, 3, y)  # Move Y axis (Axis 3)
-                time.sleep(period / 1000)  # Dwell time at each point
+        points = [(x, y) for y in y_positions for x in x_positions]
+        return ensureDeferred(self.scan_xy_internal(points, period))
 
     @setting(5, x_center="v", y_center="v", xy_range="v", num_steps="i", period="i")
     def cross_scan(self, c, x_center, y_center, xy_range, num_steps, period):
@@ -165,67 +380,58 @@ class PosXyzNewport25XA(LabradServer):
         x_voltages = np.linspace(x_center - xy_range / 2, x_center + xy_range / 2, num_steps)
         y_voltages = np.linspace(y_center - xy_range / 2, y_center + xy_range / 2, num_steps)
 
-        # Scan X (Axis 2) with Y (Axis 3) fixed
-        for x in x_voltages:
-            self.write_absolute(c, 2, x)
-            self.write_absolute(c, 3, y_center)
-            time.sleep(period / 1000)
-
-        # Scan Y (Axis 3) with X (Axis 2) fixed
-        for y in y_voltages:
-            self.write_absolute(c, 2, x_center)
-            self.write_absolute(c, 3, y)
-            time.sleep(period / 1000)           
-        @setting(8)
-        def reset(self):
-            self.close_task_internal()
-    
+        # Scan X (Axis 2) with Y (Axis 3) fixed, then Y (Axis 3) with X (Axis 2) fixed
+        points = [(x, y_center) for x in x_voltages]
+        points.extend([(x_center, y) for y in y_voltages])
+        return ensureDeferred(self.scan_xy_internal(points, period))
+
     @setting(6, radius="v", num_steps="i", period="i")
     def circular_scan(self, c, radius, num_steps, period):
         """Perform a circular scan around the origin (X: 2, Y: 3)."""
         angles = np.linspace(0, 2 * np.pi, num_steps)
         x_positions = radius * np.cos(angles)
         y_positions = radius * np.sin(angles)
+        points = list(zip(x_positions, y_positions))
+        return ensureDeferred(self.scan_xy_internal(points, period))
 
-        for x, y in zip(x_positions, y_positions):
-            self.write_absolute(c, 2, x)  # X axis (Axis 2)
-            self.write_absolute(c, 3, y)  # Y axis (Axis 3)
-            time.sleep(period / 1000)
+    async def scan_xy_internal(self, points, period):
+        """Move through the xy points, dwelling period ms at each once the
+        stage has stopped"""
+        x_axis, y_axis = self.axes["x"], self.axes["y"]
+        for x, y in points:
+            await self.move_absolute({x_axis: x, y_axis: y})
+            await deferLater(reactor, period / 1000, lambda: None)
 
     @setting(7, returns="v[]")
     def read_xy(self, c):
         """Read the positions of both X (Axis 2) and Y (Axis 3) axes."""
-        x_position = self.get_axis_position(c, 2)
-        y_position = self.get_axis_position(c, 3)
-        return x_position, y_position
-    
+        return ensureDeferred(self.read_positions([self.axes["x"], self.axes["y"]]))
+
     @setting(8, returns="v")
     def read_z(self, c):
         """Read the position of the Z (Axis 1) axis."""
-        z_position = self.get_axis_position(c, 1)
-        return z_position
-    
+        return self.get_axis_position(c, self.axes["z"])
+
     @setting(9, returns="*v")
     def read_xyz(self, c):
-        """Read the positions of both X (Axis 2) and Y (Axis 3) axes."""
-        x_position = self.get_axis_position(c, 2)
-        y_position = self.get_axis_position(c, 3)
-        z_position = self.get_axis_position(c, 1)
-        return x_position, y_position, z_position
-    
+        """Read the positions of the X (Axis 2), Y (Axis 3), and Z (Axis 1) axes."""
+        axes = [self.axes["x"], self.axes["y"], self.axes["z"]]
+        return ensureDeferred(self.read_positions(axes))
+
     @setting(10, x_position="v", y_position="v")
     def write_xy(self, c, x_position, y_position):
         """
         Move both the X (Axis 2) and Y (Axis 3) axes to specified absolute positions.
+        Both moves go out in one frame so the axes move together, and the
+        setting returns once they've both stopped.
 
         Args:
             x_position (float): The position for the X-axis.
             y_position (float): The position for the Y-axis.
         """
-        # Move X and Y axes to absolute positions
         print(f"write_xy called with x: {x_position}, y: {y_position}")
-        self.write_absolute(c, 2, x_position)  # Absolute move for X-axis (Axis 2)
-        self.write_absolute(c, 3, y_position)  # Absolute move for Y-axis (Axis 3)
+        positions = {self.axes["x"]: x_position, self.axes["y"]: y_position}
+        return ensureDeferred(self.move_absolute(positions))
 
     @setting(11, z_position="v")
     def write_z(self, c, z_position):
@@ -235,9 +441,88 @@ class PosXyzNewport25XA(LabradServer):
         Args:
             position (float): The desired position for the Z-axis.
         """
-        # Move Z axis to absolute position
         print(f"write_z called with z: {z_position}")
-        self.write_absolute(c, 1, z_position)  # Absolute move for Z-axis (Axis 1)
+        return ensureDeferred(self.move_absolute({self.axes["z"]: z_position}))
+
+
+    @setting(12, coords_x="*v", coords_y="*v", coords_z="*v", period="i")
+    def start_step_scan(self, c, coords_x, coords_y, coords_z, period):
+        """Start a step scan through the passed coords and return immediately.
+        At each point the stage moves and waits for motion done, then the pulse
+        gen runs its loaded sequence once, and the actual position of the
+        stage is recorded. Get the positions with read_step_scan. The counts
+        come from the counter as usual, one sample per point, so the pulse gen
+        and counter must be set up before the scan starts.
+
+        Params
+            coords_x: list(float)
+                X coords of each point
+            coords_y: list(float)
+                Y coords of each point
+            coords_z: list(float)
+                Z coords of each point
+            period: int
+                Period of the loaded sequence in ns. We wait this long after
+                each trigger before moving on
+        """
+        if self.step_scan is not None and not self.step_scan.called:
+            raise RuntimeError("A step scan is already running.")
+        points = np.column_stack((coords_x, coords_y, coords_z))
+        self.step_scan_positions = []
+        self.step_scan_error = None
+        self.step_scan_stop = False
+        self.step_scan = ensureDeferred(self.step_scan_internal(points, period))
+        self.step_scan.addErrback(self.on_step_scan_error)
+
+    async def step_scan_internal(self, points, period):
+        pulse_gen = await self.get_pulse_gen()
+        axes = [self.axes["x"], self.axes["y"], self.axes["z"]]
+        dwell = (period + self.step_scan_margin) / 1e9
+        last_point = None
+        for point in points:
+            if self.step_scan_stop:
+                break
+            # Only move the axes whose coords changed
+            positions = {
+                axis: val
+                for ind, (axis, val) in enumerate(zip(axes, point))
+                if last_point is None or val != last_point[ind]
+            }
+            last_point = point
+            await self.move_absolute(positions)
+            # The stage is stopped, so read it back while the sequence runs
+            await pulse_gen.stream_start(1)
+            actual_positions = await self.read_positions(axes)
+            await deferLater(reactor, dwell, lambda: None)
+            self.step_scan_positions.append(actual_positions)
+
+    def on_step_scan_error(self, failure):
+        logging.info(failure.getErrorMessage())
+        self.step_scan_error = failure
+
+    @setting(13, returns="*2v")
+    def read_step_scan(self, c):
+        """Get the actual stage positions recorded since the last read, as
+        [x, y, z] for each point. Raises the error if the scan failed
+
+        Returns
+            list(list(float))
+                Positions of the points scanned since the last read
+        """
+        if self.step_scan_error is not None:
+            failure = self.step_scan_error
+            self.step_scan_error = None
+            failure.raiseException()
+        positions = self.step_scan_positions
+        self.step_scan_positions = []
+        if len(positions) == 0:
+            return np.empty((0, 3))
+        return np.array(positions)
+
+    @setting(14)
+    def stop_step_scan(self, c):
+        """Stop the step scan after the current point"""
+        self.step_scan_stop = True
 
 
 
@@ -23,19 +23,18 @@ timeout =
 """
 
 
-from labrad.server import LabradServer
 from labrad.server import setting
 from twisted.internet.defer import ensureDeferred
 from pipython import GCSDevice
 import nidaqmx
 import logging
 import numpy
-import nidaqmx.stream_writers as stream_writers
 import socket
 from pathlib import Path
+from servers.outputs.pos_daq_ao_base import PosDaqAoBase
 
 
-class PosXyzPi6163c(LabradServer):
+class PosXyzPi6163c(PosDaqAoBase):
     name = "pos_xyz_PI_616_3c"
     pc_name = socket.gethostname()
 
@@ -50,7 +49,7 @@ class PosXyzPi6163c(LabradServer):
             datefmt="%y-%m-%d_%H-%M-%S",
             filename=filename,
         )
-        self.task = None
+        self.init_daq_ao()
         self.sub_init_server_xyz()
 
     def sub_init_server_xyz(self):
@@ -112,6 +111,10 @@ class PosXyzPi6163c(LabradServer):
         
         self.piezo_stage_voltage_range_factor = config[5]
         self.daq_voltage_range_factor = config[6]
+        # Set the daq reference value to either 5 or 10 V
+        self.ao_min_val = -self.daq_voltage_range_factor
+        self.ao_max_val = self.daq_voltage_range_factor
+        self.ao_dac_ref_val = self.daq_voltage_range_factor
         
         self.piezo_stage_scaling_offset = config[7]
         self.piezo_stage_scaling_gain = config[8]
@@ -161,187 +164,51 @@ class PosXyzPi6163c(LabradServer):
 # %%
     def load_stream_writer_xy(self, c, task_name, voltages, period):
 
-        # Close the existing task if there is one
-        if self.task is not None:
-            self.close_task_internal()
-
         # Write the initial voltages and stream the rest
         num_voltages = voltages.shape[1]
         self.write_xy(c, voltages[0, 0], voltages[1, 0])
         stream_voltages = voltages[:, 1:num_voltages]
-        stream_voltages = numpy.ascontiguousarray(stream_voltages)
-        num_stream_voltages = num_voltages - 1
-        # Create a new task
-        task = nidaqmx.Task(task_name)
-        self.task = task
-        
-        
-
-        # Set up the output channels
-        # task.ao_channels.add_ao_voltage_chan(
-        #     self.daq_ao_piezo_stage_x, min_val=-self.daq_voltage_range_factor, 
-        #                                 max_val=self.daq_voltage_range_factor
-        # )
-        # task.ao_channels.add_ao_voltage_chan(
-        #     self.daq_ao_piezo_stage_y, min_val=-self.daq_voltage_range_factor, 
-        #                                 max_val=self.daq_voltage_range_factor
-        # )
-        
-        channel_0 =task.ao_channels.add_ao_voltage_chan(
-            self.daq_ao_piezo_stage_x, min_val=-self.daq_voltage_range_factor, 
-                                        max_val=self.daq_voltage_range_factor
-        )
-        channel_1 =task.ao_channels.add_ao_voltage_chan(
-            self.daq_ao_piezo_stage_y, min_val=-self.daq_voltage_range_factor, 
-                                        max_val=self.daq_voltage_range_factor
-        )
-        
-        # Set the daq reference value to either 5 or 10 V
-        channel_0.ao_dac_ref_val = self.daq_voltage_range_factor
-        channel_1.ao_dac_ref_val = self.daq_voltage_range_factor
-
-        # Set up the output stream
-        output_stream = nidaqmx.task.OutStream(task)
-        writer = stream_writers.AnalogMultiChannelWriter(output_stream)
 
-        # Configure the sample to advance on the rising edge of the PFI input.
         # The frequency specified is just the max expected rate in this case.
-        # We'll stop once we've run all the samples.
         freq = float(1 / (period * (10 ** -9)))  # freq in seconds as a float
-  
-        task.timing.cfg_samp_clk_timing(
-            freq, source=self.daq_di_clock, 
-            samps_per_chan=num_stream_voltages
-        )
-
-        writer.write_many_sample(stream_voltages)
-
-        # Close the task once we've written all the samples
-        task.register_done_event(self.close_task_internal)
+        chans = [self.daq_ao_piezo_stage_x, self.daq_ao_piezo_stage_y]
+        self.load_stream_ao(chans, stream_voltages, freq)
 
-        task.start()
-        
     def load_stream_writer_xyz(self, c, task_name, voltages, period):
 
-        # Close the existing task if there is one
-        if self.task is not None:
-            self.close_task_internal()
-
         # Write the initial voltages and stream the rest
         num_voltages = voltages.shape[1]
         self.write_xyz(c, voltages[0, 0], voltages[1, 0], voltages[2, 0])
         stream_voltages = voltages[:, 1:num_voltages]
-        stream_voltages = numpy.ascontiguousarray(stream_voltages)
-        num_stream_voltages = num_voltages - 1
-        # Create a new task
-        task = nidaqmx.Task(task_name)
-        self.task = task
- 
-        
-        channel_0 =task.ao_channels.add_ao_voltage_chan(
-            self.daq_ao_piezo_stage_x, min_val=-self.daq_voltage_range_factor, 
-                                        max_val=self.daq_voltage_range_factor
-        )
-        channel_1 =task.ao_channels.add_ao_voltage_chan(
-            self.daq_ao_piezo_stage_y, min_val=-self.daq_voltage_range_factor, 
-                                        max_val=self.daq_voltage_range_factor
-        )
-        channel_2 =task.ao_channels.add_ao_voltage_chan(
-            self.daq_ao_piezo_stage_z, min_val=-self.daq_voltage_range_factor, 
-                                        max_val=self.daq_voltage_range_factor
-        )
-        
-        # Set the daq reference value to either 5 or 10 V
-        channel_0.ao_dac_ref_val = self.daq_voltage_range_factor
-        channel_1.ao_dac_ref_val = self.daq_voltage_range_factor
-        channel_2.ao_dac_ref_val = self.daq_voltage_range_factor
-
-        # Set up the output stream
-        output_stream = nidaqmx.task.OutStream(task)
-        writer = stream_writers.AnalogMultiChannelWriter(output_stream)
 
-        # Configure the sample to advance on the rising edge of the PFI input.
         # The frequency specified is just the max expected rate in this case.
-        # We'll stop once we've run all the samples.
         freq = float(1 / (period * (10 ** -9)))  # freq in seconds as a float
-  
-        task.timing.cfg_samp_clk_timing(
-            freq, source=self.daq_di_clock, 
-            samps_per_chan=num_stream_voltages
-        )
-
-        writer.write_many_sample(stream_voltages)
-
-        # Close the task once we've written all the samples
-        task.register_done_event(self.close_task_internal)
-
-        task.start()
-
-    def close_task_internal(self, task_handle=None, status=None, callback_data=None):
-        task = self.task
-        if task is not None:
-            task.close()
-            self.task = None
-        return 0
+        chans = [
+            self.daq_ao_piezo_stage_x,
+            self.daq_ao_piezo_stage_y,
+            self.daq_ao_piezo_stage_z,
+        ]
+        self.load_stream_ao(chans, stream_voltages, freq)
 
     @setting(32,  xVoltage="v[]", yVoltage="v[]") ###???? Do i need to change the decorators ????
     def write_xy(self, c, xVoltage, yVoltage):
         """Write the specified x and y voltages to the piezo stage"""
 
-        # Close the stream task if it exists
-        # This can happen if we quit out early
-        if self.task is not None:
-            self.close_task_internal()
-
+        # This stops the stream if it's still running, e.g. if we quit out early
+        chans = [self.daq_ao_piezo_stage_x, self.daq_ao_piezo_stage_y]
+        self.write_ao(chans, [xVoltage, yVoltage])
 
-        with nidaqmx.Task() as task:
-            # Set up the output channels
-            channel_0 = task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_piezo_stage_x, min_val=-self.daq_voltage_range_factor,
-                                        max_val=self.daq_voltage_range_factor
-            )
-        
-            channel_1 = task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_piezo_stage_y, min_val=-self.daq_voltage_range_factor, 
-                                        max_val=self.daq_voltage_range_factor
-            )
-            
-            channel_0.ao_dac_ref_val = self.daq_voltage_range_factor
-            channel_1.ao_dac_ref_val = self.daq_voltage_range_factor
-            
-            task.write([xVoltage, yVoltage])
-    
     @setting(42,  xVoltage="v[]", yVoltage="v[]", zVoltage="v[]")
     def write_xyz(self, c, xVoltage, yVoltage, zVoltage):
         """Write the specified x and y and z voltages to the piezo stage"""
 
-        # Close the stream task if it exists
-        # This can happen if we quit out early
-        if self.task is not None:
-            self.close_task_internal()
-
-
-        with nidaqmx.Task() as task:
-            # Set up the output channels
-            channel_0 = task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_piezo_stage_x, min_val=-self.daq_voltage_range_factor,
-                                        max_val=self.daq_voltage_range_factor
-            )
-        
-            channel_1 = task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_piezo_stage_y, min_val=-self.daq_voltage_range_factor, 
-                                        max_val=self.daq_voltage_range_factor
-            )
-            channel_2 = task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_piezo_stage_z, min_val=-self.daq_voltage_range_factor, 
-                                        max_val=self.daq_voltage_range_factor
-            )
-            
-            channel_0.ao_dac_ref_val = self.daq_voltage_range_factor
-            channel_1.ao_dac_ref_val = self.daq_voltage_range_factor
-            channel_2.ao_dac_ref_val = self.daq_voltage_range_factor
-            
-            task.write([xVoltage, yVoltage, zVoltage])
+        # This stops the stream if it's still running, e.g. if we quit out early
+        chans = [
+            self.daq_ao_piezo_stage_x,
+            self.daq_ao_piezo_stage_y,
+            self.daq_ao_piezo_stage_z,
+        ]
+        self.write_ao(chans, [xVoltage, yVoltage, zVoltage])
 
 
     @setting(31, returns="*v[]")
@@ -29,26 +29,83 @@ import time
 from pathlib import Path
 
 import nidaqmx
-import nidaqmx.stream_writers as stream_writers
 import numpy
-from labrad.server import LabradServer, setting
+from labrad.server import setting
 from numpy.polynomial.polynomial import Polynomial
 from pipython import GCSDevice, GCSError
 from twisted.internet.defer import ensureDeferred
 
+from servers.outputs.interfaces.pos_telemetry import PosTelemetry
+from servers.outputs.pos_daq_ao_base import PosDaqAoBase
 from utils import common
 from utils import tool_belt as tb
 
 
-class PosXyzPiP6163c(LabradServer):
+def invert_hysteresis(
+    position, a, b, last_position, current_direction, last_turning_position
+):
+    """Apply the inverse of the quadratic hysteresis model to an array of
+    positions. The distance p from the last turning point is related to the
+    voltage v needed to cover it by p = a v^2 + b v. The turning points are
+    where the direction of motion flips, and a repeated position keeps the
+    current direction. Returns the compensated voltages and the state to carry
+    over to the next call as (last_position, current_direction,
+    last_turning_position)
+    """
+    num_positions = len(position)
+    previous = numpy.concatenate(([last_position], position[:-1]))
+    steps = numpy.sign(position - previous)
+
+    # The direction of each step is the sign of the step, or the direction
+    # of the last nonzero step for repeated positions
+    moving = steps != 0
+    last_moving_inds = numpy.where(moving, numpy.arange(num_positions), -1)
+    last_moving_inds = numpy.maximum.accumulate(last_moving_inds)
+    directions = numpy.where(
+        last_moving_inds >= 0, steps[last_moving_inds], current_direction
+    )
+
+    # A turn happens at each step against the previous direction, and the
+    # turning point is the position before the step
+    previous_directions = numpy.concatenate(([current_direction], directions[:-1]))
+    turns = moving & (steps == -previous_directions)
+    last_turn_inds = numpy.where(turns, numpy.arange(num_positions), -1)
+    last_turn_inds = numpy.maximum.accumulate(last_turn_inds)
+    turning_positions = numpy.where(
+        last_turn_inds >= 0, previous[last_turn_inds], last_turning_position
+    )
+
+    # Calculate compensated voltage based on the quadratic model
+    if a != 0:
+        abs_p = numpy.abs(position - turning_positions)
+        discriminant = b**2 + 4 * a * abs_p
+        if numpy.any(discriminant < 0):
+            raise ValueError(
+                "No real roots found for quadratic equation. Adjust hysteresis parameters."
+            )
+        v = (-b + numpy.sqrt(discriminant)) / (2 * a)
+    else:
+        v = (position - turning_positions) / b
+    compensated = turning_positions + directions * v
+
+    state = (position[-1], directions[-1], turning_positions[-1])
+    return compensated, state
+
+
+class PosXyzPiP6163c(PosTelemetry, PosDaqAoBase):
     name = "pos_xyz_PI_p616_3c"
     pc_name = socket.gethostname()
 
     def initServer(self):
         tb.configure_logging(self)
-        self.task = None
+        self.init_daq_ao()
+        self.init_telemetry()
         self.sub_init_server_xyz()
 
+    def stopServer(self):
+        self.stop_telemetry()
+        super().stopServer()
+
     def sub_init_server_xyz(self):
         """Sub-routine to be called by xyz server"""
         self.x_last_position = None
@@ -133,6 +190,10 @@ class PosXyzPiP6163c(LabradServer):
 
         config_wiring_daq = config["Wiring"]["Piezo_Controller_E727"]
         self.daq_voltage_range_factor = config_wiring_daq["voltage_range_factor"]
+        # Set the daq reference value to either 5 or 10 V
+        self.ao_min_val = -self.daq_voltage_range_factor
+        self.ao_max_val = self.daq_voltage_range_factor
+        self.ao_dac_ref_val = self.daq_voltage_range_factor
 
         config_wiring_piezo = config["Wiring"]["Piezo_Controller_E727"]
         self.piezo_stage_voltage_range_factor = config_wiring_piezo[
@@ -301,6 +362,9 @@ class PosXyzPiP6163c(LabradServer):
         if not isinstance(position, (numpy.ndarray, list)):
             single_value = True
             position = [position]
+        position = numpy.asarray(position, dtype=float)
+        if len(position) == 0:
+            return position
 
         # Initialize state variables if they are not set
         if None in [last_position, current_direction, last_turning_position]:
@@ -308,31 +372,10 @@ class PosXyzPiP6163c(LabradServer):
             current_direction = +1
             last_turning_position = position[0]
 
-        compensated_voltage = []
-        for val in position:
-            movement_direction = numpy.sign(val - last_position)
-            if movement_direction == 0:
-                movement_direction = current_direction
-            elif movement_direction == -current_direction:
-                last_turning_position = last_position
-                current_direction = movement_direction
-
-            abs_p = abs(val - last_turning_position)
-            # Calculate compensated voltage based on the quadratic model
-            if a != 0:
-                discriminant = b**2 - 4 * a * (0 - abs_p)
-                if discriminant < 0:
-                    raise ValueError(
-                        "No real roots found for quadratic equation. Adjust hysteresis parameters."
-                    )
-                v = (-b + numpy.sqrt(discriminant)) / (2 * a)
-            else:
-                v = (val - last_turning_position) / b
-
-            result = last_turning_position + (movement_direction * v)
-            compensated_voltage.append(result)
-
-            last_position = val
+        compensated_voltage, state = invert_hysteresis(
+            position, a, b, last_position, current_direction, last_turning_position
+        )
+        last_position, movement_direction, last_turning_position = state
 
         # Update state variables
         if axis == "x":
@@ -348,275 +391,128 @@ class PosXyzPiP6163c(LabradServer):
             self.z_current_direction = movement_direction
             self.z_last_turning_position = last_turning_position
 
-        return (
-            compensated_voltage[0] if single_value else numpy.array(compensated_voltage)
-        )
+        return compensated_voltage[0] if single_value else compensated_voltage
 
-    def load_stream_writer_xy(self, c, task_name, voltages, period):
-        # Close the existing task if there is one
-        if self.task is not None:
-            self.close_task_internal()
+    def setup_telemetry(self):
+        # Read back the AO voltages through the DAQ's internal channels, e.g.
+        # dev1/AO0 -> dev1/_ao0_vs_aognd
+        task = nidaqmx.Task(f"{self.name}-telemetry")
+        ao_chans = [
+            self.daq_ao_piezo_stage_x,
+            self.daq_ao_piezo_stage_y,
+            self.daq_ao_piezo_stage_z,
+        ]
+        for ao_chan in ao_chans:
+            device, chan = ao_chan.split("/")
+            task.ai_channels.add_ai_voltage_chan(
+                f"{device}/_{chan.lower()}_vs_aognd",
+                min_val=-self.daq_voltage_range_factor,
+                max_val=self.daq_voltage_range_factor,
+            )
+        return task
+
+    def cleanup_telemetry(self, task):
+        task.close()
+
+    def read_telemetry_positions(self, task):
+        return task.read()
 
+    def load_stream_writer_xy(self, c, task_name, voltages, period):
         # Write the initial voltages and stream the rest
         num_voltages = voltages.shape[1]
         self.write_xy(c, voltages[0, 0], voltages[1, 0])
         stream_voltages = voltages[:, 1:num_voltages]
         # Compensate hysteresis for both x and y axes
         compensated_voltages = numpy.vstack(
-            self.compensate_hysteresis(stream_voltages[0], "x"),
-            self.compensate_hysteresis(stream_voltages[1], "y"),
-        )
-        stream_voltages = numpy.ascontiguousarray(compensated_voltages)
-        num_stream_voltages = num_voltages - 1
-        # Create a new task
-        task = nidaqmx.Task(task_name)
-        self.task = task
-
-        # Set up the output channels
-        # task.ao_channels.add_ao_voltage_chan(
-        #     self.daq_ao_piezo_stage_x, min_val=-self.daq_voltage_range_factor,
-        #                                 max_val=self.daq_voltage_range_factor
-        # )
-        # task.ao_channels.add_ao_voltage_chan(
-        #     self.daq_ao_piezo_stage_y, min_val=-self.daq_voltage_range_factor,
-        #                                 max_val=self.daq_voltage_range_factor
-        # )
-
-        channel_0 = task.ao_channels.add_ao_voltage_chan(
-            self.daq_ao_piezo_stage_x,
-            min_val=-self.daq_voltage_range_factor,
-            max_val=self.daq_voltage_range_factor,
-        )
-        channel_1 = task.ao_channels.add_ao_voltage_chan(
-            self.daq_ao_piezo_stage_y,
-            min_val=-self.daq_voltage_range_factor,
-            max_val=self.daq_voltage_range_factor,
+            (
+                self.compensate_hysteresis(stream_voltages[0], "x"),
+                self.compensate_hysteresis(stream_voltages[1], "y"),
+            )
         )
 
-        # Set the daq reference value to either 5 or 10 V
-        channel_0.ao_dac_ref_val = self.daq_voltage_range_factor
-        channel_1.ao_dac_ref_val = self.daq_voltage_range_factor
-        # Set up the output stream
-        output_stream = nidaqmx.task.OutStream(task)
-        writer = stream_writers.AnalogMultiChannelWriter(output_stream)
-
-        # Configure the sample to advance on the rising edge of the PFI input.
         # The frequency specified is just the max expected rate in this case.
-        # We'll stop once we've run all the samples.
         freq = float(1 / (period * (10**-9)))  # freq in seconds as a float
-
-        task.timing.cfg_samp_clk_timing(
-            freq, source=self.daq_di_clock, samps_per_chan=num_stream_voltages
-        )
-
-        writer.write_many_sample(stream_voltages)
-
-        # Close the task once we've written all the samples
-        task.register_done_event(self.close_task_internal)
-
-        task.start()
+        chans = [self.daq_ao_piezo_stage_x, self.daq_ao_piezo_stage_y]
+        self.load_stream_ao(chans, compensated_voltages, freq)
 
     def load_stream_writer_xyz(self, c, task_name, voltages, period):
-        # Close the existing task if there is one
-        if self.task is not None:
-            self.close_task_internal()
-
         # Write the initial voltages and stream the rest
         num_voltages = voltages.shape[1]
         self.write_xyz(c, voltages[0, 0], voltages[1, 0], voltages[2, 0])
         stream_voltages = voltages[:, 1:num_voltages]
         # Compensate hysteresis for both x and y axes
         compensated_voltages = numpy.vstack(
-            self.compensate_hysteresis(stream_voltages[0], "x"),
-            self.compensate_hysteresis(stream_voltages[1], "y"),
-            self.compensate_hysteresis(stream_voltages[2], "z"),
+            (
+                self.compensate_hysteresis(stream_voltages[0], "x"),
+                self.compensate_hysteresis(stream_voltages[1], "y"),
+                self.compensate_hysteresis(stream_voltages[2], "z"),
+            )
         )
-        stream_voltages = numpy.ascontiguousarray(compensated_voltages)
-        num_stream_voltages = num_voltages - 1
-        # Create a new task
-        task = nidaqmx.Task(task_name)
-        self.task = task
 
-        channel_0 = task.ao_channels.add_ao_voltage_chan(
+        # The frequency specified is just the max expected rate in this case.
+        freq = float(1 / (period * (10**-9)))  # freq in seconds as a float
+        chans = [
             self.daq_ao_piezo_stage_x,
-            min_val=-self.daq_voltage_range_factor,
-            max_val=self.daq_voltage_range_factor,
-        )
-        channel_1 = task.ao_channels.add_ao_voltage_chan(
             self.daq_ao_piezo_stage_y,
-            min_val=-self.daq_voltage_range_factor,
-            max_val=self.daq_voltage_range_factor,
-        )
-        channel_2 = task.ao_channels.add_ao_voltage_chan(
             self.daq_ao_piezo_stage_z,
-            min_val=-self.daq_voltage_range_factor,
-            max_val=self.daq_voltage_range_factor,
-        )
-
-        # Set the daq reference value to either 5 or 10 V
-        channel_0.ao_dac_ref_val = self.daq_voltage_range_factor
-        channel_1.ao_dac_ref_val = self.daq_voltage_range_factor
-        channel_2.ao_dac_ref_val = self.daq_voltage_range_factor
-
-        # Set up the output stream
-        output_stream = nidaqmx.task.OutStream(task)
-        writer = stream_writers.AnalogMultiChannelWriter(output_stream)
-
-        # Configure the sample to advance on the rising edge of the PFI input.
-        # The frequency specified is just the max expected rate in this case.
-        # We'll stop once we've run all the samples.
-        freq = float(1 / (period * (10**-9)))  # freq in seconds as a float
-
-        task.timing.cfg_samp_clk_timing(
-            freq, source=self.daq_di_clock, samps_per_chan=num_stream_voltages
-        )
-
-        writer.write_many_sample(stream_voltages)
-
-        # Close the task once we've written all the samples
-        task.register_done_event(self.close_task_internal)
-
-        task.start()
-
-    def close_task_internal(self, task_handle=None, status=None, callback_data=None):
-        task = self.task
-        if task is not None:
-            task.close()
-            self.task = None
-        return 0
+        ]
+        self.load_stream_ao(chans, compensated_voltages, freq)
 
     @setting(70, xVoltage="v[]")  # Voltage value for X-axis
     def write_x(self, c, xVoltage):
         """Write the specified x voltage to the piezo stage"""
 
-        # Close the existing task if there is one
-        if self.task is not None:
-            self.close_task_internal()
         # Adjust voltage turn for hysteresis
         xVoltage = self.compensate_hysteresis(xVoltage, "x")
-        # Create a new task to write the voltage
-        with nidaqmx.Task() as task:
-            # Set up the output channel for X
-            channel_0 = task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_piezo_stage_x,
-                min_val=-self.daq_voltage_range_factor,
-                max_val=self.daq_voltage_range_factor,
-            )
-            channel_0.ao_dac_ref_val = self.daq_voltage_range_factor
-
-            # Write the specified voltage to the channel
-            task.write([xVoltage])
-            # logging.debug(f"X-axis voltage set to {xVoltage} V")
+        # This stops the stream if it's still running
+        self.write_ao([self.daq_ao_piezo_stage_x], [xVoltage])
 
     @setting(71, yVoltage="v[]")  # Voltage value for Y-axis
     def write_y(self, c, yVoltage):
         """Write the specified y voltage to the piezo stage"""
 
-        # Close the existing task if there is one
-        if self.task is not None:
-            self.close_task_internal()
         # Adjust voltage turn for hysteresis
         yVoltage = self.compensate_hysteresis(yVoltage, "y")
-        # Create a new task to write the voltage
-        with nidaqmx.Task() as task:
-            # Set up the output channel for Y
-            channel_0 = task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_piezo_stage_y,
-                min_val=-self.daq_voltage_range_factor,
-                max_val=self.daq_voltage_range_factor,
-            )
-            channel_0.ao_dac_ref_val = self.daq_voltage_range_factor
-
-            # Write the specified voltage to the channel
-            task.write([yVoltage])
-            # logging.debug(f"Y-axis voltage set to {yVoltage} V")
+        # This stops the stream if it's still running
+        self.write_ao([self.daq_ao_piezo_stage_y], [yVoltage])
 
     @setting(72, zVoltage="v[]")  # Voltage value for Z-axis
     def write_z(self, c, zVoltage):
         """Write the specified z voltage to the piezo stage"""
 
-        # Close the existing task if there is one
-        if self.task is not None:
-            self.close_task_internal()
         # Adjust voltage turn for hysteresis
         zVoltage = self.compensate_hysteresis(zVoltage, "z")
-        # Create a new task to write the voltage
-        with nidaqmx.Task() as task:
-            # Set up the output channel for Z
-            channel_2 = task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_piezo_stage_z,
-                min_val=-self.daq_voltage_range_factor,
-                max_val=self.daq_voltage_range_factor,
-            )
-            channel_2.ao_dac_ref_val = self.daq_voltage_range_factor
-
-            task.write([zVoltage])
-            # logging.debug(f"Z-axis voltage set to {zVoltage} V")
+        # This stops the stream if it's still running
+        self.write_ao([self.daq_ao_piezo_stage_z], [zVoltage])
 
     @setting(32, xVoltage="v", yVoltage="v")
     def write_xy(self, c, xVoltage, yVoltage):
         """Write the specified x and y voltages to the piezo stage"""
 
-        # Close the stream task if it exists
-        if self.task is not None:
-            self.close_task_internal()
         # Compensate hysteresis for both x and y axes
         xVoltage = self.compensate_hysteresis(xVoltage, "x")
         yVoltage = self.compensate_hysteresis(yVoltage, "y")
 
-        with nidaqmx.Task() as task:
-            # Set up the output channels
-            task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_piezo_stage_x,
-                min_val=-self.daq_voltage_range_factor,
-                max_val=self.daq_voltage_range_factor,
-            )
-
-            task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_piezo_stage_y,
-                min_val=-self.daq_voltage_range_factor,
-                max_val=self.daq_voltage_range_factor,
-            )
-
-            task.write([xVoltage, yVoltage])
+        # This stops the stream if it's still running
+        chans = [self.daq_ao_piezo_stage_x, self.daq_ao_piezo_stage_y]
+        self.write_ao(chans, [xVoltage, yVoltage])
 
     @setting(42, xVoltage="v[]", yVoltage="v[]", zVoltage="v[]")
     def write_xyz(self, c, xVoltage, yVoltage, zVoltage):
         """Write the specified x and y and z voltages to the piezo stage"""
 
-        # Close the stream task if it exists
-        # This can happen if we quit out early
-        if self.task is not None:
-            self.close_task_internal()
         # Compensate hysteresis for both x and y axes
         xVoltage = self.compensate_hysteresis(xVoltage, "x")
         yVoltage = self.compensate_hysteresis(yVoltage, "y")
-        zVoltage = self.compensate_hysteresis(yVoltage, "z")
-
-        with nidaqmx.Task() as task:
-            # Set up the output channels
-            channel_0 = task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_piezo_stage_x,
-                min_val=-self.daq_voltage_range_factor,
-                max_val=self.daq_voltage_range_factor,
-            )
-
-            channel_1 = task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_piezo_stage_y,
-                min_val=-self.daq_voltage_range_factor,
-                max_val=self.daq_voltage_range_factor,
-            )
-            channel_2 = task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_piezo_stage_z,
-                min_val=-self.daq_voltage_range_factor,
-                max_val=self.daq_voltage_range_factor,
-            )
-
-            channel_0.ao_dac_ref_val = self.daq_voltage_range_factor
-            channel_1.ao_dac_ref_val = self.daq_voltage_range_factor
-            channel_2.ao_dac_ref_val = self.daq_voltage_range_factor
+        zVoltage = self.compensate_hysteresis(zVoltage, "z")
 
-            task.write([xVoltage, yVoltage, zVoltage])
+        # This stops the stream if it's still running, e.g. if we quit out early
+        chans = [
+            self.daq_ao_piezo_stage_x,
+            self.daq_ao_piezo_stage_y,
+            self.daq_ao_piezo_stage_z,
+        ]
+        self.write_ao(chans, [xVoltage, yVoltage, zVoltage])
 
     @setting(31, returns="*v[]")
     def read_xy(self, c):
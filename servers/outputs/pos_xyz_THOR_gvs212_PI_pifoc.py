@@ -23,11 +23,8 @@ timeout = 5
 """
 
 
-from labrad.server import LabradServer
 from labrad.server import setting
 from twisted.internet.defer import ensureDeferred
-import nidaqmx
-import nidaqmx.stream_writers as stream_writers
 import numpy
 import logging
 import socket
@@ -52,65 +49,31 @@ class PosXyzThorgvs212PiPifoc(PosXyThorGvs212, PosZPiPifoc):
             datefmt="%y-%m-%d_%H-%M-%S",
             filename=filename,
         )
-        self.task = None
+        self.init_daq_ao()
         self.sub_init_server_xy()
         self.sub_init_server_z()
         logging.info('Init complete')
 
-    def stopServer(self):
-        self.close_task_internal()
-
     @setting(100, coords_x="*v[]", coords_y="*v[]", coords_z="*v[]", continuous="b")
     def load_stream_xyz(self, c, coords_x, coords_y, coords_z, continuous=False):
 
         
         voltages = numpy.vstack((coords_x, coords_y, coords_z))
-        
-        # Close the existing task if there is one
-        if self.task is not None:
-            self.close_task_internal()
 
         # Write the initial voltages and stream the rest
         num_voltages = voltages.shape[1]
         self.write_xy(c, voltages[0, 0], voltages[1, 0])
         self.write_z(c, voltages[2, 0])
         stream_voltages = voltages[:, 1:num_voltages]
-        stream_voltages = numpy.ascontiguousarray(stream_voltages)
-        num_stream_voltages = num_voltages - 1
-
-        # Create a new task
-        task = nidaqmx.Task(f"{self.name}-load_stream_xyz")
-        self.task = task
-
-        # Set up the output channels
-        task.ao_channels.add_ao_voltage_chan(
-            self.daq_ao_galvo_x, min_val=-10.0, max_val=10.0
-        )
-        task.ao_channels.add_ao_voltage_chan(
-            self.daq_ao_galvo_y, min_val=-10.0, max_val=10.0
-        )
-        task.ao_channels.add_ao_voltage_chan(
-            self.daq_ao_objective_piezo, min_val=1.0, max_val=9.0
-        )
-
-        # Set up the output stream
-        output_stream = nidaqmx.task.OutStream(task)
-        writer = stream_writers.AnalogMultiChannelWriter(output_stream)
 
-        # Configure the sample to advance on the rising edge of the PFI input.
         # The frequency specified is just the max expected rate in this case.
-        # We'll stop once we've run all the samples.
         freq = 100  # Just guess a data rate of 100 Hz
-        task.timing.cfg_samp_clk_timing(
-            freq, source=self.daq_di_clock, samps_per_chan=num_stream_voltages
-        )
-
-        writer.write_many_sample(stream_voltages)
-
-        # Close the task once we've written all the samples
-        task.register_done_event(self.close_task_internal)
-
-        task.start()
+        chans = [
+            self.daq_ao_galvo_x,
+            self.daq_ao_galvo_y,
+            self.daq_ao_objective_piezo,
+        ]
+        self.load_stream_ao(chans, stream_voltages, freq)
 
     @setting(200, xVoltage="v[]", yVoltage="v[]", zVoltage="v[]")
     def write_xyz(self, c, xVoltage, yVoltage, zVoltage):
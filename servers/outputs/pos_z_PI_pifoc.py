@@ -22,19 +22,18 @@ timeout =
 ### END NODE INFO
 """
 
-from labrad.server import LabradServer
 from labrad.server import setting
 from twisted.internet.defer import ensureDeferred
 from pipython import GCSDevice
 import nidaqmx
 import logging
 import numpy
-import nidaqmx.stream_writers as stream_writers
 import socket
 from pathlib import Path
+from servers.outputs.pos_daq_ao_base import PosDaqAoBase
 
 
-class PosZPiPifoc(LabradServer):
+class PosZPiPifoc(PosDaqAoBase):
     name = "pos_z_PI_pifoc"
     pc_name = socket.gethostname()
 
@@ -50,7 +49,7 @@ class PosZPiPifoc(LabradServer):
             datefmt="%y-%m-%d_%H-%M-%S",
             filename=filename,
         )
-        self.task = None
+        self.init_daq_ao()
         self.sub_init_server_z()
 
     def sub_init_server_z(self):
@@ -100,8 +99,14 @@ class PosZPiPifoc(LabradServer):
         logging.info("Init complete")
 
     def stopServer(self):
+        self.close_task_internal()
         self.piezo.CloseConnection()
 
+    def get_ao_limits(self, chan):
+        if chan == self.daq_ao_objective_piezo:
+            return 1.0, 9.0
+        return super().get_ao_limits(chan)
+
     def compensate_hysteresis_z(self, position):
         """
         The hysteresis curve is p(v) = a * v**2 + b * v.
@@ -181,10 +186,6 @@ class PosZPiPifoc(LabradServer):
 
     def load_stream_writer_z(self, c, task_name, voltages, period):
 
-        # Close the existing task if there is one
-        if self.task is not None:
-            self.close_task_internal()
-
         # Make sure the voltages are an array
         voltages = numpy.array(voltages)
 
@@ -194,64 +195,22 @@ class PosZPiPifoc(LabradServer):
         stream_voltages = voltages[1:num_voltages]
         # Compensate the remaining voltages
         stream_voltages = self.compensate_hysteresis_z(stream_voltages)
-        stream_voltages = numpy.ascontiguousarray(stream_voltages)
-        num_stream_voltages = num_voltages - 1
 
-        # Create a new task
-        task = nidaqmx.Task(task_name)
-        self.task = task
-
-        # Set up the output channels
-        task.ao_channels.add_ao_voltage_chan(
-            self.daq_ao_objective_piezo, min_val=1.0, max_val=9.0
-        )
-
-        # Set up the output stream
-        output_stream = nidaqmx.task.OutStream(task)
-        writer = stream_writers.AnalogSingleChannelWriter(output_stream)
-
-        # Configure the sample to advance on the rising edge of the PFI input.
         # The frequency specified is just the max expected rate in this case.
-        # We'll stop once we've run all the samples.
         freq = float(1 / (period * (10**-9)))  # freq in seconds as a float
-        task.timing.cfg_samp_clk_timing(
-            freq, source=self.daq_di_clock, samps_per_chan=num_stream_voltages
-        )
-
-        writer.write_many_sample(stream_voltages)
-
-        # Close the task once we've written all the samples
-        task.register_done_event(self.close_task_internal)
-
-        task.start()
-
-    def close_task_internal(
-        self, task_handle=None, status=None, callback_data=None
-    ):
-        task = self.task
-        if task is not None:
-            task.close()
-            self.task = None
-        return 0
+        chans = [self.daq_ao_objective_piezo]
+        self.load_stream_ao(chans, stream_voltages, freq)
 
     @setting(22, voltage="v[]")
     def write_z(self, c, voltage):
         """Write the specified voltage to the piezo"""
 
-        # Close the stream task if it exists
-        # This can happen if we quit out early
-        if self.task is not None:
-            self.close_task_internal()
-
         # Adjust voltage turn for hysteresis
         compensated_voltage = self.compensate_hysteresis_z(voltage)
 
-        with nidaqmx.Task() as task:
-            # Set up the output channels
-            task.ao_channels.add_ao_voltage_chan(
-                self.daq_ao_objective_piezo, min_val=1.0, max_val=9.0
-            )
-            task.write(compensated_voltage)
+        # This stops the stream if it's still running, e.g. if we quit out early
+        chans = [self.daq_ao_objective_piezo]
+        self.write_ao(chans, numpy.atleast_1d(compensated_voltage))
 
     @setting(21, returns="v[]")
     def read_z(self, c):
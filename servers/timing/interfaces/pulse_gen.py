@@ -72,6 +72,51 @@ class PulseGen(LabradServer, ABC):
         """
         pass
 
+    @abstractmethod
+    def wait_for_stream(self, c, timeout=None):
+        """
+        Wait for the running stream to finish without blocking the server
+
+        Params
+            timeout: float
+                Seconds to wait. Default is None, which waits indefinitely
+
+        Returns
+            bool
+                True if the stream finished, False if we timed out
+        """
+        pass
+
+    @abstractmethod
+    def stream_load_next(self, c, seq_file, seq_args_string=""):
+        """
+        Build the sequence from seq_file into a next slot without touching the
+        running stream. stream_start_next swaps it in.
+
+        Params
+            seq_file: str
+                A sequence file from the sequence library
+            seq_args_string: str
+                Encoded args for the sequence - see stream_load
+
+        Returns
+            list(any)
+                Arbitrary list returned by the sequence file
+        """
+        pass
+
+    @abstractmethod
+    def stream_start_next(self, c, num_reps=1):
+        """
+        Wait for the running stream to finish, then run the sequence in the
+        next slot for the specified number of repitions.
+
+        Params
+            num_reps: int
+                Number of times to repeat the sequence. Default is 1
+        """
+        pass
+
     @abstractmethod
     def constant(self, c, digital_channels=[], analog_channels=[], analog_voltages=[]):
         """
@@ -25,12 +25,18 @@ timeout = 5
 from labrad.server import LabradServer
 from labrad.server import setting
 from twisted.internet.defer import ensureDeferred
+from twisted.internet import reactor
+from twisted.internet.task import deferLater
+from collections import OrderedDict
 import importlib
 import os
 import sys
+import time
 sys.path.insert(0, 'C:\\Users\\choyl\\ChoyDioptric')  # Add parent directory to path
 import utils.tool_belt as tool_belt
+from utils import pulse_trains
 import logging
+import numpy as np
 import socket
 from pathlib import Path
 from servers.timing.interfaces.pulse_gen import PulseGen
@@ -43,6 +49,13 @@ from pulsestreamer import OutputState
 class PulseGenSwab82(PulseGen, LabradServer):
     name = "pulse_gen_SWAB_82"
     pc_name = socket.gethostname()
+    # Number of built sequences to keep in the sequence cache
+    seq_cache_size = 32
+    # Seconds between checks on whether the stream has finished
+    finish_poll_interval = 0.005
+    # Initial guess for the upload rate in bytes / s. Updated from the
+    # uploads of sequences that have been through estimate_upload
+    upload_rate = 10**6
 
     def initServer(self):
         filename = (
@@ -57,6 +70,13 @@ class PulseGenSwab82(PulseGen, LabradServer):
             filename=filename,
         )
         self.task = None
+        # Built sequences by (seq_file, seq_args_string). The config they're
+        # built from is only read at init, so they stay valid until restart
+        self.seq_cache = OrderedDict()
+        # Number of pulses in built sequences, by cache key
+        self.seq_num_pulses = {}
+        self.loaded_seq_key = None
+        self.next_seq = None
         config = ensureDeferred(self.get_config())
         config.addCallback(self.on_get_config)
 
@@ -144,6 +164,7 @@ class PulseGenSwab82(PulseGen, LabradServer):
         # Initialize state variables and reset
         self.seq = None
         self.loaded_seq_streamed = False
+        self.streamed_num_repeat = None
         self.reset(None)
         logging.info("Init complete")
 
@@ -158,11 +179,32 @@ class PulseGenSwab82(PulseGen, LabradServer):
             )
         return seq, final, ret_vals
 
-    @setting(2, seq_file="s", seq_args_string="s", returns="*?")
-    def stream_load(self, c, seq_file, seq_args_string=""):
+    def get_seq_cached(self, seq_file, seq_args_string):
+        """Get the sequence from the cache, building it if it isn't there.
+        Returns the cache key along with the outputs of get_seq
+        """
+        key = (seq_file, seq_args_string)
+        if key in self.seq_cache:
+            self.seq_cache.move_to_end(key)
+            return (key, *self.seq_cache[key])
+        seq, final, ret_vals = self.get_seq(seq_file, seq_args_string)
+        if seq is not None:
+            self.seq_cache[key] = (seq, final, ret_vals)
+            # Evict the least recently used sequence
+            if len(self.seq_cache) > self.seq_cache_size:
+                evicted_key, _ = self.seq_cache.popitem(last=False)
+                self.seq_num_pulses.pop(evicted_key, None)
+        return key, seq, final, ret_vals
+
+    @setting(2, seq_file="s", seq_args_string="s", num_reps="i", returns="*?")
+    def stream_load(self, c, seq_file, seq_args_string="", num_reps=1):
         """Load the sequence from seq_file. Set it to end in the specified
         final output state. The sequence will not run until you call
-        stream_start.
+        stream_start. Built sequences are cached by seq_file and
+        seq_args_string, so reloading a recently used sequence skips the
+        rebuild. Reloading the sequence that's already loaded also skips the
+        upload to the Pulse Streamer, unless constant or force_final has
+        replaced it on the Pulse Streamer since it was streamed.
 
         Params
             seq_file: str
@@ -171,6 +213,8 @@ class PulseGenSwab82(PulseGen, LabradServer):
                 Arbitrary list used to modulate a sequence from the sequence
                 library - see simple_readout.py for an example. Default is
                 None
+            num_reps: int
+                Unused. Matches the PulseGen interface
 
         Returns
             list(any)
@@ -178,13 +222,73 @@ class PulseGenSwab82(PulseGen, LabradServer):
         """
 
         self.pulse_streamer.setTrigger(start=TriggerStart.SOFTWARE)
-        seq, final, ret_vals = self.get_seq(seq_file, seq_args_string)
-        if seq is not None:
+        key, seq, final, ret_vals = self.get_seq_cached(seq_file, seq_args_string)
+        if seq is not None and key != self.loaded_seq_key:
             self.seq = seq
+            self.loaded_seq_key = key
             self.loaded_seq_streamed = False
             self.final = final
         return ret_vals
 
+    @setting(8, seq_file="s", seq_args_strings="*s", order="s", returns="*2iv")
+    def stream_load_sweep(self, c, seq_file, seq_args_strings, order="shuffle"):
+        """Load a whole sweep as one sequence: the sequences from seq_file
+        for each of seq_args_strings, concatenated in the specified order.
+        Then stream_start(num_reps) runs num_reps passes of the sweep with one
+        upload and one start. The sample clock comes after the last pass, so
+        each sample holds num_reps * len(gate_map) gates. Demultiplex them
+        with the counter's read_counter_demux.
+
+        Params
+            seq_file: str
+                A sequence file from the sequence library
+            seq_args_strings: list(str)
+                The encoded args for each point of the sweep
+            order: str
+                "sequential" for the order of seq_args_strings, "shuffle" for
+                a random order, or "interleave" to alternate between the
+                two ends of the sweep (0, n-1, 1, n-2, ...) so slow drifts
+                hit every region of the sweep evenly
+
+        Returns
+            list(list(int))
+                The gate map - for each gate in one pass of the sweep,
+                [point index, gate index within the point]
+            float
+                Duration of one pass of the sweep in ns
+        """
+
+        num_points = len(seq_args_strings)
+        if order == "sequential":
+            point_order = np.arange(num_points)
+        elif order == "shuffle":
+            point_order = np.random.permutation(num_points)
+        elif order == "interleave":
+            point_order = np.empty(num_points, dtype=int)
+            point_order[0::2] = np.arange((num_points + 1) // 2)
+            point_order[1::2] = np.arange(num_points - 1, (num_points - 1) // 2, -1)
+        else:
+            raise ValueError(f"Unknown sweep order {order}.")
+
+        self.pulse_streamer.setTrigger(start=TriggerStart.SOFTWARE)
+        gate_chan = self.pulse_streamer_wiring["do_apd_gate"]
+        sweep_seq = None
+        gate_map = []
+        for point in point_order:
+            _, seq, final, _ = self.get_seq_cached(seq_file, seq_args_strings[point])
+            num_gates = count_rising_edges(seq, gate_chan)
+            gate_map.extend([point, ind] for ind in range(num_gates))
+            sweep_seq = seq if sweep_seq is None else sweep_seq + seq
+
+        seq_args_key = (tuple(seq_args_strings), tuple(point_order))
+        key = (seq_file, seq_args_key)
+        if key != self.loaded_seq_key:
+            self.seq = sweep_seq
+            self.loaded_seq_key = key
+            self.loaded_seq_streamed = False
+            self.final = final
+        return gate_map, float(sweep_seq.getDuration())
+
     @setting(3, num_repeat="i")
     def stream_start(self, c, num_repeat=1):
         """Run the currently loaded stream for the specified number of
@@ -197,11 +301,128 @@ class PulseGenSwab82(PulseGen, LabradServer):
                 
         if self.seq == None:
             raise RuntimeError("Stream started with no sequence.")
-        if not self.loaded_seq_streamed:
+        # Upload unless the sequence is already on the Pulse Streamer with
+        # the same number of repetitions
+        if not self.loaded_seq_streamed or num_repeat != self.streamed_num_repeat:
+            start = time.perf_counter()
             self.pulse_streamer.stream(self.seq, num_repeat, self.final)
+            upload_time = time.perf_counter() - start
+            num_pulses = self.seq_num_pulses.get(self.loaded_seq_key)
+            if num_pulses is not None and upload_time > 0:
+                num_bytes = num_pulses * pulse_trains.bytes_per_pulse
+                self.upload_rate = num_bytes / upload_time
             self.loaded_seq_streamed = True
+            self.streamed_num_repeat = num_repeat
         self.pulse_streamer.startNow()
 
+    @setting(12, seq_file="s", seq_args_string="s", returns="(wwv)")
+    def estimate_upload(self, c, seq_file, seq_args_string=""):
+        """Estimate the cost of uploading a sequence before loading it. The
+        sequence is built into the cache, so a following stream_load of the
+        same sequence skips the build. The time estimate uses the rate of the
+        last upload of an estimated sequence.
+
+        Params
+            seq_file: str
+                A sequence file from the sequence library
+            seq_args_string: str
+                Encoded args for the sequence - see stream_load
+
+        Returns
+            int
+                Number of pulses in the sequence
+            int
+                Upload size in bytes
+            float
+                Estimated upload time in s
+        """
+        key, seq, _, _ = self.get_seq_cached(seq_file, seq_args_string)
+        if key not in self.seq_num_pulses:
+            self.seq_num_pulses[key] = len(seq.getData())
+        num_pulses = self.seq_num_pulses[key]
+        num_bytes, upload_time = pulse_trains.estimate_upload(
+            num_pulses, self.upload_rate
+        )
+        return num_pulses, num_bytes, upload_time
+
+    @setting(9, timeout="v", returns="b")
+    def wait_for_stream(self, c, timeout=None):
+        """Wait for the running stream to finish. Returns a Deferred, so the
+        server keeps serving other requests, e.g. stream_load_next, in the
+        meantime.
+
+        Params
+            timeout: float
+                Seconds to wait. Default is None, which waits indefinitely
+
+        Returns
+            bool
+                True if the stream finished, False if we timed out
+        """
+        return ensureDeferred(self.wait_for_stream_internal(timeout))
+
+    async def wait_for_stream_internal(self, timeout=None):
+        start = time.time()
+        while not self.pulse_streamer.hasFinished():
+            if (timeout is not None) and (time.time() - start > timeout):
+                return False
+            await deferLater(reactor, self.finish_poll_interval, lambda: None)
+        return True
+
+    @setting(10, seq_file="s", seq_args_string="s", returns="*?")
+    def stream_load_next(self, c, seq_file, seq_args_string=""):
+        """Build the sequence from seq_file into the next slot without
+        touching the running stream. stream_start_next swaps it in once the
+        running stream finishes. The Pulse Streamer can only hold one
+        sequence, so the upload itself happens at the swap, but the build
+        overlaps with the running stream.
+
+        Params
+            seq_file: str
+                A sequence file from the sequence library
+            seq_args_string: str
+                Encoded args for the sequence - see stream_load
+
+        Returns
+            list(any)
+                Arbitrary list returned by the sequence file
+        """
+        key, seq, final, ret_vals = self.get_seq_cached(seq_file, seq_args_string)
+        if seq is not None:
+            self.next_seq = (key, seq, final)
+        return ret_vals
+
+    @setting(11, num_repeat="i")
+    def stream_start_next(self, c, num_repeat=1):
+        """Wait for the running stream to finish, then load the sequence in
+        the next slot and start it for the specified number of repetitions.
+        Returns a Deferred that fires once the new stream has started.
+
+        Params
+            num_repeat: int
+                Number of times to repeat the sequence. Default is 1
+        """
+        if self.next_seq is None:
+            raise RuntimeError("stream_start_next called with no next sequence.")
+        return ensureDeferred(self.stream_start_next_internal(c, num_repeat))
+
+    async def stream_start_next_internal(self, c, num_repeat):
+        await self.wait_for_stream_internal()
+        # The server kept serving requests while we waited, so a reset may
+        # have cleared the slot
+        if self.next_seq is None:
+            raise RuntimeError(
+                "The next sequence was cleared before the running stream finished."
+            )
+        key, seq, final = self.next_seq
+        self.next_seq = None
+        if key != self.loaded_seq_key:
+            self.seq = seq
+            self.loaded_seq_key = key
+            self.loaded_seq_streamed = False
+            self.final = final
+        self.stream_start(c, num_repeat)
+
     @setting(
         4,
         digital_channels="*i",
@@ -222,6 +443,9 @@ class PulseGenSwab82(PulseGen, LabradServer):
             digital_channels, analog_0_voltage, analog_1_voltage
         )
         self.pulse_streamer.constant(state)
+        # The Pulse Streamer no longer holds the loaded sequence
+        self.loaded_seq_streamed = False
+        self.streamed_num_repeat = None
 
     @setting(5)
     def force_final(self, c):
@@ -230,6 +454,8 @@ class PulseGenSwab82(PulseGen, LabradServer):
         """
 
         self.pulse_streamer.forceFinal()
+        self.loaded_seq_streamed = False
+        self.streamed_num_repeat = None
 
     @setting(6)
     def reset(self, c):
@@ -239,7 +465,30 @@ class PulseGenSwab82(PulseGen, LabradServer):
             c, digital_channels=[], analog_0_voltage=0.0, analog_1_voltage=0.0
         )
         self.seq = None
+        self.loaded_seq_key = None
         self.loaded_seq_streamed = False
+        self.streamed_num_repeat = None
+        self.next_seq = None
+
+    @setting(7)
+    def clear_seq_cache(self, c):
+        """Clear the cache of built sequences. The loaded sequence stays
+        loaded
+        """
+        self.seq_cache.clear()
+        self.seq_num_pulses.clear()
+
+
+def count_rising_edges(seq, chan):
+    """Count the rising edges of a digital channel in a Sequence"""
+    pulses = seq.getData()
+    if len(pulses) == 0:
+        return 0
+    # Each pulse is (duration, digital bitmask, analog 0, analog 1)
+    bitmasks = np.array([pulse[1] for pulse in pulses], dtype=np.int64)
+    highs = (bitmasks >> chan) & 1
+    # Channels start out low
+    return int(np.count_nonzero(np.diff(highs, prepend=0) == 1))
 
 
 __server__ = PulseGenSwab82()
@@ -27,6 +27,7 @@ from pulsestreamer import Sequence
 from pulsestreamer import OutputState
 import numpy
 import utils.tool_belt as tool_belt
+from utils.pulse_trains import Train
 from utils.tool_belt import States
 
 LOW = 0
@@ -134,6 +135,8 @@ def get_seq(pulse_streamer, config, args):
 
     ###
     
+    # The rep trains below are blocks, repeated num_rep_blocks times
+    num_rep_blocks = 1 if pi_pulse_reps == 0 else pi_pulse_reps
     if pi_pulse_reps==0:
         rep_train_low_shrt = [(tau_shrt, LOW), 
                      (tau_shrt, LOW)]
@@ -147,14 +150,14 @@ def get_seq(pulse_streamer, config, args):
                      (echo_buffer, LOW),
                      (echo_pulse_proxy_low, HIGH),
                      (echo_pulse_proxy_high, LOW),
-                     (tau_shrt, LOW)]*pi_pulse_reps
+                     (tau_shrt, LOW)]
     
-    uwave_experiment_train_low_shrt = [(coh_pulse_activ_low, HIGH),
+    uwave_experiment_train_low_shrt = Train([(coh_pulse_activ_low, HIGH),
                                         (coh_pulse_activ_high, LOW),
                                         (coh_buffer, LOW),
                                         (coh_pulse_proxy_low, HIGH),
-                                        (coh_pulse_proxy_high, LOW)]
-    uwave_experiment_train_low_shrt.extend(rep_train_low_shrt)
+                                        (coh_pulse_proxy_high, LOW)])
+    uwave_experiment_train_low_shrt.repeat(rep_train_low_shrt, num_rep_blocks)
     uwave_experiment_train_low_shrt.extend([(coh_pulse_proxy_low, HIGH),
                                             (coh_pulse_proxy_high, LOW),
                                             (coh_buffer, LOW),
@@ -164,9 +167,7 @@ def get_seq(pulse_streamer, config, args):
     # uwave_experiment_train_low_shrt.extend([(20, LOW)]) # adding a wait between pi/2 and pi
     # uwave_experiment_train_low_shrt.extend([(echo_pulse_activ_low, HIGH),
     #                                         (echo_pulse_activ_high, LOW)]) # adding a pi pulse to readout
-    uwave_experiment_dur_shrt = 0
-    for el in uwave_experiment_train_low_shrt:
-        uwave_experiment_dur_shrt += el[0]
+    uwave_experiment_dur_shrt = uwave_experiment_train_low_shrt.duration
         
     ###
     if pi_pulse_reps==0:
@@ -182,13 +183,13 @@ def get_seq(pulse_streamer, config, args):
                      (echo_buffer, LOW),
                      (echo_pulse_proxy_low, HIGH),
                      (echo_pulse_proxy_high, LOW),
-                     (tau_long, LOW)]*pi_pulse_reps
-    uwave_experiment_train_low_long = [(coh_pulse_activ_low, HIGH),
+                     (tau_long, LOW)]
+    uwave_experiment_train_low_long = Train([(coh_pulse_activ_low, HIGH),
                                         (coh_pulse_activ_high, LOW),
                                         (coh_buffer, LOW),
                                         (coh_pulse_proxy_low, HIGH),
-                                        (coh_pulse_proxy_high, LOW)]
-    uwave_experiment_train_low_long.extend(rep_train_low_long)
+                                        (coh_pulse_proxy_high, LOW)])
+    uwave_experiment_train_low_long.repeat(rep_train_low_long, num_rep_blocks)
     uwave_experiment_train_low_long.extend([(coh_pulse_proxy_low, HIGH),
                                             (coh_pulse_proxy_high, LOW),
                                             (coh_buffer, LOW),
@@ -198,9 +199,7 @@ def get_seq(pulse_streamer, config, args):
     # uwave_experiment_train_low_long.extend([(20, LOW)]) # adding a wait between pi/2 and pi
     # uwave_experiment_train_low_long.extend([(echo_pulse_activ_low, HIGH),
     #                                         (echo_pulse_activ_high, LOW)]) # adding a pi pulse to readout
-    uwave_experiment_dur_long = 0
-    for el in uwave_experiment_train_low_long:
-        uwave_experiment_dur_long += el[0]
+    uwave_experiment_dur_long = uwave_experiment_train_low_long.duration
         
     ###
     uwave_experiment_train_low_norm = [(total_uwave_dur_low*8, HIGH),
@@ -255,14 +254,14 @@ def get_seq(pulse_streamer, config, args):
                      (echo_buffer, LOW),
                      (echo_pulse_proxy_low, LOW),
                      (echo_pulse_proxy_high, HIGH),
-                     (tau_shrt, LOW)]*pi_pulse_reps
+                     (tau_shrt, LOW)]
     
-    uwave_experiment_train_high_shrt = [(coh_pulse_activ_low, LOW),
+    uwave_experiment_train_high_shrt = Train([(coh_pulse_activ_low, LOW),
                                 (coh_pulse_activ_high, HIGH),
                                 (coh_buffer, LOW),
                                 (coh_pulse_proxy_low, LOW),
-                                (coh_pulse_proxy_high, HIGH)]
-    uwave_experiment_train_high_shrt.extend(rep_train_high_shrt)
+                                (coh_pulse_proxy_high, HIGH)])
+    uwave_experiment_train_high_shrt.repeat(rep_train_high_shrt, num_rep_blocks)
     uwave_experiment_train_high_shrt.extend([(coh_pulse_proxy_low, LOW),
                                             (coh_pulse_proxy_high, HIGH),
                                             (coh_buffer, LOW),
@@ -287,13 +286,13 @@ def get_seq(pulse_streamer, config, args):
                      (echo_buffer, LOW),
                      (echo_pulse_proxy_low, LOW),
                      (echo_pulse_proxy_high, HIGH),
-                     (tau_long, LOW)]*pi_pulse_reps
-    uwave_experiment_train_high_long = [(coh_pulse_activ_low, LOW),
+                     (tau_long, LOW)]
+    uwave_experiment_train_high_long = Train([(coh_pulse_activ_low, LOW),
                                 (coh_pulse_activ_high, HIGH),
                                 (coh_buffer, LOW),
                                 (coh_pulse_proxy_low, LOW),
-                                (coh_pulse_proxy_high, HIGH)]
-    uwave_experiment_train_high_long.extend(rep_train_high_long)
+                                (coh_pulse_proxy_high, HIGH)])
+    uwave_experiment_train_high_long.repeat(rep_train_high_long, num_rep_blocks)
     uwave_experiment_train_high_long.extend([(coh_pulse_proxy_low, LOW),
                                             (coh_pulse_proxy_high, HIGH),
                                             (coh_buffer, LOW),
@@ -341,9 +340,9 @@ def get_seq(pulse_streamer, config, args):
     ### Write the IQ trigger pulse sequence
     # The first IQ pulse will occur right after optical pulse polarization
     # follwoing IQ pulses will occur half tau before the pi pulse
-    uwave_iq_train_shrt = [(iq_trigger_time, HIGH), 
+    uwave_iq_train_shrt = Train([(iq_trigger_time, HIGH), 
                            (uwave_buffer + uwave_coh_pulse_dur-iq_trigger_time, LOW),
-                           (half_tau_shrt_st, LOW)]
+                           (half_tau_shrt_st, LOW)])
     if pi_pulse_reps == 0:
         uwave_iq_train_shrt.extend([(iq_trigger_time, HIGH), 
                                     (half_tau_shrt_en - iq_trigger_time + half_tau_shrt_st, LOW),
@@ -351,8 +350,8 @@ def get_seq(pulse_streamer, config, args):
     else:
         rep_train = [(iq_trigger_time, HIGH),
                  (half_tau_shrt_en - iq_trigger_time + uwave_echo_pulse_dur +\
-                  tau_shrt + half_tau_shrt_st, LOW)]*(pi_pulse_reps-1)
-        uwave_iq_train_shrt.extend(rep_train)
+                  tau_shrt + half_tau_shrt_st, LOW)]
+        uwave_iq_train_shrt.repeat(rep_train, pi_pulse_reps-1)
         uwave_iq_train_shrt.extend([(iq_trigger_time, HIGH), 
                                     (half_tau_shrt_en - iq_trigger_time + uwave_echo_pulse_dur + half_tau_shrt_st, LOW),
                                     (iq_trigger_time, HIGH), 
@@ -360,9 +359,9 @@ def get_seq(pulse_streamer, config, args):
                                     # (half_tau_shrt_en - iq_trigger_time+ uwave_coh_pulse_dur + 20 + final_pi_pulse, LOW)])
     
     
-    uwave_iq_train_long = [(iq_trigger_time, HIGH), 
+    uwave_iq_train_long = Train([(iq_trigger_time, HIGH), 
                            (uwave_buffer + uwave_coh_pulse_dur-iq_trigger_time, LOW),
-                           (half_tau_long_st, LOW)]
+                           (half_tau_long_st, LOW)])
     if pi_pulse_reps == 0:
         uwave_iq_train_long.extend([(iq_trigger_time, HIGH), 
                                     (half_tau_long_en - iq_trigger_time + half_tau_long_st, LOW),
@@ -370,8 +369,8 @@ def get_seq(pulse_streamer, config, args):
     else:
         rep_train = [(iq_trigger_time, HIGH),
                  (half_tau_long_en - iq_trigger_time + uwave_echo_pulse_dur +\
-                  tau_long + half_tau_long_st, LOW)]*(pi_pulse_reps-1)
-        uwave_iq_train_long.extend(rep_train)
+                  tau_long + half_tau_long_st, LOW)]
+        uwave_iq_train_long.repeat(rep_train, pi_pulse_reps-1)
         uwave_iq_train_long.extend([(iq_trigger_time, HIGH), 
                                     (half_tau_long_en - iq_trigger_time + uwave_echo_pulse_dur + half_tau_long_st, LOW),
                                     (iq_trigger_time, HIGH), 
@@ -566,9 +565,9 @@ def get_seq(pulse_streamer, config, args):
     print(period)
     
     # Microwaves LOW
-    train = [(delay_buffer - uwave_delay_low, LOW),
+    train = Train([(delay_buffer - uwave_delay_low, LOW),
              (polarization_time,LOW),
-             (uwave_buffer, LOW)]
+             (uwave_buffer, LOW)])
     train.extend(uwave_experiment_train_low_shrt)
     train.extend([
              (uwave_buffer, LOW),
@@ -603,17 +602,15 @@ def get_seq(pulse_streamer, config, args):
              (scc_ion_readout_buffer, LOW),
              (gate_time, LOW),
              (back_buffer + uwave_delay_low, LOW)])
-    seq.setDigital(pulser_do_sig_gen_gate_low, train)
+    seq.setDigital(pulser_do_sig_gen_gate_low, train.to_list())
     
-    period = 0
-    for el in train:
-        period += el[0]
+    period = train.duration
     print(period)
 
     # Microwaves HIGH
-    train = [(delay_buffer - uwave_delay_high, LOW),
+    train = Train([(delay_buffer - uwave_delay_high, LOW),
              (polarization_time,LOW),
-             (uwave_buffer, LOW)]
+             (uwave_buffer, LOW)])
     train.extend(uwave_experiment_train_high_shrt)
     train.extend([
              (uwave_buffer, LOW),
@@ -648,17 +645,15 @@ def get_seq(pulse_streamer, config, args):
              (scc_ion_readout_buffer, LOW),
              (gate_time, LOW),
              (back_buffer + uwave_delay_high, LOW)])
-    seq.setDigital(pulser_do_sig_gen_gate_high, train)
+    seq.setDigital(pulser_do_sig_gen_gate_high, train.to_list())
     
-    period = 0
-    for el in train:
-        period += el[0]
+    period = train.duration
     print(period)
     
     # IQ modulation triggers
-    train = [(delay_buffer - iq_delay_time, LOW),
+    train = Train([(delay_buffer - iq_delay_time, LOW),
              (iq_trigger_time, HIGH),
-             (polarization_time-iq_trigger_time, LOW)]
+             (polarization_time-iq_trigger_time, LOW)])
               # (uwave_buffer, LOW)]
     train.extend(uwave_iq_train_shrt)
     train.extend([
@@ -694,11 +689,9 @@ def get_seq(pulse_streamer, config, args):
               (scc_ion_readout_buffer, LOW),
               (gate_time, LOW),
               (back_buffer + iq_delay_time, LOW)])
-    seq.setDigital(pulser_do_arb_wave_trigger, train)
+    seq.setDigital(pulser_do_arb_wave_trigger, train.to_list())
     # print(train)
-    period = 0
-    for el in train:
-        period += el[0]
+    period = train.duration
     print(period)
     
     final_digital = [pulser_wiring['do_sample_clock']]
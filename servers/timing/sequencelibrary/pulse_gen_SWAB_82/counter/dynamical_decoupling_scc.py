@@ -25,6 +25,7 @@ from pulsestreamer import Sequence
 from pulsestreamer import OutputState
 import numpy
 import utils.tool_belt as tool_belt
+from utils.pulse_trains import Train
 from utils.tool_belt import States
 
 LOW = 0
@@ -111,34 +112,30 @@ def get_seq(pulse_streamer, config, args):
     # %% Write the microwave sequence to be used. 
     # Also add up the total time of the uwave experiment and use for other channels
 
-    uwave_experiment_train_shrt = [(pi_on_2_pulse, HIGH)]
+    uwave_experiment_train_shrt = Train([(pi_on_2_pulse, HIGH)])
     if pi_pulse_reps == 0:
-        rep_train = [(tau_shrt, LOW), (tau_shrt, LOW)]
+        uwave_experiment_train_shrt.extend([(tau_shrt, LOW), (tau_shrt, LOW)])
     else:  
-        rep_train = [(tau_shrt, LOW), (pi_pulse, HIGH), (tau_shrt, LOW)]*pi_pulse_reps
-    uwave_experiment_train_shrt.extend(rep_train)
+        rep_block = [(tau_shrt, LOW), (pi_pulse, HIGH), (tau_shrt, LOW)]
+        uwave_experiment_train_shrt.repeat(rep_block, pi_pulse_reps)
     uwave_experiment_train_shrt.extend([(pi_on_2_pulse, HIGH)])
     uwave_experiment_train_shrt.extend([(final_pi_pulse_wait, LOW)]) # adding a wait between pi/2 and pi
     uwave_experiment_train_shrt.extend([(pi_pulse, HIGH)]) # adding a pi pulse to readout
     
-    uwave_experiment_dur_shrt = 0
-    for el in uwave_experiment_train_shrt:
-        uwave_experiment_dur_shrt += el[0]
+    uwave_experiment_dur_shrt = uwave_experiment_train_shrt.duration
     
     
-    uwave_experiment_train_long = [(pi_on_2_pulse, HIGH)]
+    uwave_experiment_train_long = Train([(pi_on_2_pulse, HIGH)])
     if pi_pulse_reps == 0:
-        rep_train = [(tau_long, LOW), (tau_long, LOW)]
+        uwave_experiment_train_long.extend([(tau_long, LOW), (tau_long, LOW)])
     else:  
-        rep_train = [(tau_long, LOW), (pi_pulse, HIGH), (tau_long, LOW)]*pi_pulse_reps
-    uwave_experiment_train_long.extend(rep_train)
+        rep_block = [(tau_long, LOW), (pi_pulse, HIGH), (tau_long, LOW)]
+        uwave_experiment_train_long.repeat(rep_block, pi_pulse_reps)
     uwave_experiment_train_long.extend([(pi_on_2_pulse, HIGH)])
     uwave_experiment_train_long.extend([(final_pi_pulse_wait, LOW)]) # adding a wait between pi/2 and pi
     uwave_experiment_train_long.extend([(pi_pulse, HIGH)]) # adding a pi pulse to readout
         
-    uwave_experiment_dur_long = 0
-    for el in uwave_experiment_train_long:
-        uwave_experiment_dur_long += el[0]
+    uwave_experiment_dur_long = uwave_experiment_train_long.duration
         
     # uwave_experiment_train_norm = [(pi_on_2_pulse, HIGH)]
     # if pi_pulse_reps == 0:
@@ -157,18 +154,18 @@ def get_seq(pulse_streamer, config, args):
     # %% Write the IQ trigger pulse sequence
     # The first IQ pulse will occur right after optical pulse polarization
     # follwoing IQ pulses will occur half tau before the pi pulse
-    uwave_iq_train_shrt = [(iq_trigger_time, HIGH), 
+    uwave_iq_train_shrt = Train([(iq_trigger_time, HIGH), 
                            (pre_uwave_exp_wait_time + pi_on_2_pulse-iq_trigger_time, LOW),
-                           (half_tau_shrt_st, LOW)]
+                           (half_tau_shrt_st, LOW)])
     if pi_pulse_reps == 0:
         uwave_iq_train_shrt.extend([(iq_trigger_time, HIGH), 
                                     (half_tau_shrt_en - iq_trigger_time + half_tau_shrt_st, LOW),
                                     # (half_tau_shrt_en - iq_trigger_time + pi_on_2_pulse, LOW)])
                                     (half_tau_shrt_en + pi_on_2_pulse + final_pi_pulse_wait + pi_pulse, LOW)])
     else:    
-        rep_train = [(iq_trigger_time, HIGH),
-                 (half_tau_shrt_en - iq_trigger_time + pi_pulse + tau_shrt + half_tau_shrt_st, LOW)]*(pi_pulse_reps-1)
-        uwave_iq_train_shrt.extend(rep_train)
+        rep_block = [(iq_trigger_time, HIGH),
+                 (half_tau_shrt_en - iq_trigger_time + pi_pulse + tau_shrt + half_tau_shrt_st, LOW)]
+        uwave_iq_train_shrt.repeat(rep_block, pi_pulse_reps-1)
         uwave_iq_train_shrt.extend([(iq_trigger_time, HIGH), 
                                     (half_tau_shrt_en - iq_trigger_time + pi_pulse + half_tau_shrt_st, LOW),
                                     (iq_trigger_time, HIGH), 
@@ -176,18 +173,18 @@ def get_seq(pulse_streamer, config, args):
                                     (half_tau_shrt_en - iq_trigger_time + pi_on_2_pulse + final_pi_pulse_wait + pi_pulse, LOW)])
     
     
-    uwave_iq_train_long = [(iq_trigger_time, HIGH), 
+    uwave_iq_train_long = Train([(iq_trigger_time, HIGH), 
                            (pre_uwave_exp_wait_time + pi_on_2_pulse-iq_trigger_time, LOW),
-                           (half_tau_long_st, LOW)]
+                           (half_tau_long_st, LOW)])
     if pi_pulse_reps == 0:
         uwave_iq_train_long.extend([(iq_trigger_time, HIGH), 
                                     (half_tau_long_en - iq_trigger_time + half_tau_long_st, LOW),
                                     # (half_tau_long_en - iq_trigger_time + pi_on_2_pulse, LOW)])
                                     (half_tau_long_en + pi_on_2_pulse + final_pi_pulse_wait + pi_pulse, LOW)])
     else:
-        rep_train = [(iq_trigger_time, HIGH),
-                 (half_tau_long_en - iq_trigger_time + pi_pulse + tau_long + half_tau_long_st, LOW)]*(pi_pulse_reps-1)
-        uwave_iq_train_long.extend(rep_train)
+        rep_block = [(iq_trigger_time, HIGH),
+                 (half_tau_long_en - iq_trigger_time + pi_pulse + tau_long + half_tau_long_st, LOW)]
+        uwave_iq_train_long.repeat(rep_block, pi_pulse_reps-1)
         uwave_iq_train_long.extend([(iq_trigger_time, HIGH), 
                                     (half_tau_long_en - iq_trigger_time + pi_pulse + half_tau_long_st, LOW),
                                     (iq_trigger_time, HIGH), 
@@ -387,9 +384,9 @@ def get_seq(pulse_streamer, config, args):
     print(period)
     
     # Microwaves
-    train = [(delay_buffer - rf_delay_time, LOW),
+    train = Train([(delay_buffer - rf_delay_time, LOW),
              (polarization_time,LOW),
-             (pre_uwave_exp_wait_time, LOW)]
+             (pre_uwave_exp_wait_time, LOW)])
     train.extend(uwave_experiment_train_shrt)
     train.extend([
              (post_uwave_exp_wait_time, LOW),
@@ -424,17 +421,15 @@ def get_seq(pulse_streamer, config, args):
              (scc_ion_readout_buffer, LOW),
              (readout_time, LOW),
              (back_buffer + rf_delay_time, LOW)])
-    seq.setDigital(pulser_do_sig_gen_gate, train)
+    seq.setDigital(pulser_do_sig_gen_gate, train.to_list())
     
-    period = 0
-    for el in train:
-        period += el[0]
+    period = train.duration
     print(period)
 
     # IQ modulation triggers
-    train = [(delay_buffer - iq_delay_time, LOW),
+    train = Train([(delay_buffer - iq_delay_time, LOW),
              (iq_trigger_time, HIGH),
-             (polarization_time-iq_trigger_time, LOW)]
+             (polarization_time-iq_trigger_time, LOW)])
               # (pre_uwave_exp_wait_time, LOW)]
     train.extend(uwave_iq_train_shrt)
     train.extend([
@@ -470,11 +465,10 @@ def get_seq(pulse_streamer, config, args):
               (scc_ion_readout_buffer, LOW),
               (readout_time, LOW),
               (back_buffer + iq_delay_time, LOW)])
-    seq.setDigital(pulser_do_arb_wave_trigger, train)
-    print(train)
-    period = 0
-    for el in train:
-        period += el[0]
+    iq_train = train.to_list()
+    seq.setDigital(pulser_do_arb_wave_trigger, iq_train)
+    print(iq_train)
+    period = train.duration
     # print(period)
     
     final_digital = [pulser_wiring['do_sample_clock']]
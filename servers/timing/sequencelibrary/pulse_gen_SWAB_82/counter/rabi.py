@@ -9,6 +9,7 @@ from pulsestreamer import Sequence
 from pulsestreamer import OutputState
 import numpy
 import utils.tool_belt as tool_belt
+from utils.pulse_trains import Timeline
 from utils.tool_belt import States, Digital
 
 
@@ -54,67 +55,39 @@ def get_seq(pulse_streamer, config, args):
 
     # %% Define the sequence
 
-    seq = Sequence()
+    # Times are from the start of polarization. The timeline applies the
+    # laser and microwave delays
+    timeline = Timeline(config, lead=common_delay)
+    timeline.add_channel("apd_gate", pulser_do_apd_gate)
+    timeline.add_laser(laser_name)
+    timeline.add_sig_gen(sig_gen_name)
+
+    # Polarization
+    timeline.pulse(laser_name, 0, polarization_time)
+
+    # Pulse the microwave for tau, ending max_tau after polarization
+    uwave_end = polarization_time + uwave_buffer + max_tau
+    timeline.pulse(sig_gen_name, uwave_end - tau, tau)
 
-    # APD gating - first high is for signal, second high is for reference
-    train = [(common_delay, Digital.LOW),
-             (polarization_time, Digital.LOW),
-             (uwave_buffer, Digital.LOW),
-             (max_tau, Digital.LOW),
-             (uwave_buffer, Digital.LOW),
-             (readout, Digital.HIGH),
-             (readout_pol_max - readout, Digital.LOW),
-             (uwave_buffer, Digital.LOW),
-             (max_tau, Digital.LOW),
-             (uwave_buffer, Digital.LOW),
-             (readout, Digital.HIGH),
-             (final_readout_buffer + short_buffer, Digital.LOW)]
-    seq.setDigital(pulser_do_apd_gate, train)
-    period = 0
-    for el in train:
-        period += el[0]
+    # Signal readout, leaving the laser on long enough to repolarize
+    sig_readout = uwave_end + uwave_buffer
+    timeline.pulse("apd_gate", sig_readout, readout)
+    timeline.pulse(laser_name, sig_readout, readout_pol_max)
+
+    # Reference readout
+    ref_readout = sig_readout + readout_pol_max + 2 * uwave_buffer + max_tau
+    timeline.pulse("apd_gate", ref_readout, readout)
+    timeline.pulse(laser_name, ref_readout, readout + final_readout_buffer)
+
+    exp_period = ref_readout + readout + final_readout_buffer + short_buffer
+    period = common_delay + exp_period
     print(period)
 
-    # Laser for polarization and readout
-    train = [(common_delay - laser_delay, Digital.LOW),
-             (polarization_time, Digital.HIGH),
-             (uwave_buffer, Digital.LOW),
-             (max_tau, Digital.LOW),
-             (uwave_buffer, Digital.LOW),
-             (readout_pol_max, Digital.HIGH),
-             (uwave_buffer, Digital.LOW),
-             (max_tau, Digital.LOW),
-             (uwave_buffer, Digital.LOW),
-             (readout + final_readout_buffer, Digital.HIGH),
-             (short_buffer, Digital.LOW),
-             (laser_delay, Digital.LOW)]
+    seq = Sequence()
+    timeline.set_digital(seq, exp_period)
+    train = timeline.get_train(laser_name, exp_period)
     tool_belt.process_laser_seq(pulse_streamer, seq, config,
                                 laser_name, laser_power, train)
-    total_dur = 0
-    for el in train:
-        total_dur += el[0]
-    print(total_dur)
-
-    # Pulse the microwave for tau
-    train = [(common_delay - uwave_delay, Digital.LOW),
-             (polarization_time, Digital.LOW),
-             (uwave_buffer, Digital.LOW),
-             (max_tau-tau, Digital.LOW),
-             (tau, Digital.HIGH),
-             (uwave_buffer, Digital.LOW),
-             (readout_pol_max, Digital.LOW),
-             (uwave_buffer, Digital.LOW),
-             (max_tau, Digital.LOW),
-             (uwave_buffer, Digital.LOW),
-             (readout + final_readout_buffer, Digital.LOW),
-             (short_buffer, Digital.LOW),
-             (uwave_delay, Digital.LOW)]
-    seq.setDigital(pulser_do_sig_gen_gate, train)
-    # print(train)
-    total_dur = 0
-    for el in train:
-        total_dur += el[0]
-    print(total_dur)
 
     final_digital = [pulser_wiring['do_sample_clock']]
     final = OutputState(final_digital, 0.0, 0.0)
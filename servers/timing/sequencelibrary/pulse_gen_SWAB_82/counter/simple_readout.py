@@ -9,6 +9,7 @@ from pulsestreamer import Sequence
 from pulsestreamer import OutputState
 from utils import tool_belt as tb
 from utils import common
+from utils.pulse_trains import Timeline
 import numpy
 
 LOW = 0
@@ -34,19 +35,25 @@ def get_seq(pulse_streamer, config, args):
 
     # Define the sequence
     seq = Sequence()
+    timeline = Timeline(config, lead=0)
 
     # The clock signal will be high for 100 ns with buffers of 100 ns on
     # either side. During the buffers, everything should be low. The buffers
     # account for any timing jitters/delays and ensure that everything we
     # expect to be on one side of the clock signal is indeed on that side.
-    train = [(period - 200, LOW), (100, HIGH), (100, LOW)]
-    seq.setDigital(pulse_gen_do_daq_clock, train)
+    timeline.add_channel("clock", pulse_gen_do_daq_clock)
+    timeline.pulse("clock", period - 200, 100)
 
-    train = [(delay, LOW), (readout_time, HIGH), (300, LOW)]
-    seq.setDigital(pulse_gen_do_daq_gate, train)
+    timeline.add_channel("apd_gate", pulse_gen_do_daq_gate)
+    timeline.pulse("apd_gate", delay, readout_time)
 
-    train = [(period, HIGH)]
-    tb.process_laser_seq(seq, laser_name, laser_power, train)
+    # The laser stays on the whole time, so its delay doesn't matter
+    timeline.add_laser(laser_name, delay=0)
+    timeline.pulse(laser_name, 0, period)
+
+    timeline.set_digital(seq, period)
+    train = timeline.get_train(laser_name, period)
+    tb.process_laser_seq(pulse_streamer, seq, config, laser_name, laser_power, train)
 
     final_digital = []
     final = OutputState(final_digital, 0.0, 0.0)
@@ -9,6 +9,7 @@ from pulsestreamer import Sequence
 from pulsestreamer import OutputState
 import numpy
 import utils.tool_belt as tool_belt
+from utils.pulse_trains import Train
 from utils.tool_belt import States
 
 LOW = 0
@@ -395,7 +396,8 @@ def get_seq(pulse_streamer, config, args):
             (end_buffer, LOW),
         ]
     )
-    seq.setDigital(pulser_do_sig_gen_high_gate, train)
+    # Drop the pi pulses that are zero-length for this init/read state
+    seq.setDigital(pulser_do_sig_gen_high_gate, Train(train).to_list())
     # durs_only = [el[0] for el in train]
     # total_dur = sum(durs_only)
     # print(total_dur)
@@ -425,7 +427,8 @@ def get_seq(pulse_streamer, config, args):
             (end_buffer, LOW),
         ]
     )
-    seq.setDigital(pulser_do_sig_gen_low_gate, train)
+    # Drop the pi pulses that are zero-length for this init/read state
+    seq.setDigital(pulser_do_sig_gen_low_gate, Train(train).to_list())
     # durs_only = [el[0] for el in train]
     # total_dur = sum(durs_only)
     # print(total_dur)
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark and consistency check for the sequence library. Builds every
+sequence file with a mock Pulse Streamer, so no hardware or LabRAD connection
+is needed. For each sequence it times get_seq (including
+tool_belt.process_laser_seq), checks that every channel has the same total
+duration, and counts pulses. Run it whenever sequences or process_laser_seq
+change and compare the table against the last run.
+
+The args for each sequence are the ones in its __main__ block, unless they're
+overridden in arg_overrides because they've gone stale. Sequences in
+arg_sweeps are also built across a sweep of one of their args.
+
+By default the sequences are built against a benchmark config that fills in
+any wiring, delays, and durations they look up, since none of the dicts in
+config/ has everything the sequences need (and some don't import against the
+current utils.constants). Pass real configs to run_benchmark to check against
+them. Older sequences take the pulse gen wiring rather than the config, and
+they get the config's config["Wiring"]["PulseGen"]. Sequences that need a
+LabRAD connection or have syntax errors show up as errors in the table.
+
+Created on October 18th, 2026
+"""
+
+# region Imports and constants
+
+import ast
+import contextlib
+import copy
+import csv
+import importlib
+import importlib.util
+import inspect
+import io
+import itertools
+import sys
+import time
+import types
+from pathlib import Path
+
+import numpy as np
+
+repo_path = Path(__file__).resolve().parents[3]
+library_path = Path(__file__).resolve().parent
+
+# Args for sequences whose __main__ args no longer match get_seq. The DD
+# __main__ blocks are missing the dd_wait_time and comp_wait_time durations
+arg_overrides = {
+    "dynamical_decoupling": [
+        1000, 10000.0, 300, 88, 44, 1000, 100, 1, 3, "integrated_520", None
+    ],
+    "dynamical_decoupling_dq": [
+        100, 10000.0, 300, 68, 34, 88, 44, 625100, 100, 4, 3, 1,
+        "integrated_520", None,
+    ],
+}  # fmt: skip
+
+# Args to sweep for specific sequences, as (arg index, values). The DD
+# sequences are swept over pi_pulse_reps to track how they scale
+arg_sweeps = {
+    "dynamical_decoupling": (7, [1, 8, 64, 512]),
+    "dynamical_decoupling_dq": (9, [1, 8, 64, 512]),
+    "dynamical_decoupling_scc": (8, [1, 8, 64, 512]),
+    "dynamical_decoupling_dq_scc": (10, [1, 8, 64, 512]),
+}
+
+table_columns = [
+    "sequence",
+    "config",
+    "sweep",
+    "build_ms",
+    "period",
+    "num_pulses",
+    "num_upload_pulses",
+    "status",
+]
+
+# endregion
+# region Mock Pulse Streamer
+
+
+class MockSequence:
+    """Records the trains set on each channel instead of building a real
+    Pulse Streamer sequence
+    """
+
+    def __init__(self):
+        self.trains = {}
+
+    def setDigital(self, chan, pulses):
+        self.trains[f"do_{chan}"] = list(pulses)
+
+    def setAnalog(self, chan, pulses):
+        self.trains[f"ao_{chan}"] = list(pulses)
+
+    def plot(self):
+        pass
+
+
+class MockOutputState:
+    def __init__(self, digital_channels, analog_0=0.0, analog_1=0.0):
+        self.digital_channels = digital_channels
+        self.analog_0 = analog_0
+        self.analog_1 = analog_1
+
+
+def install_mock_pulse_streamer():
+    """Make `from pulsestreamer import Sequence` in the sequence files pick up
+    the mock classes
+    """
+    module = types.ModuleType("pulsestreamer")
+    module.Sequence = MockSequence
+    module.OutputState = MockOutputState
+    sys.modules["pulsestreamer"] = module
+    # tool_belt imports utils.search_index for saving data, which sequences
+    # never do. Stand in an empty module if it's missing from this checkout
+    try:
+        importlib.import_module("utils.search_index")
+    except ModuleNotFoundError:
+        sys.modules["utils.search_index"] = types.ModuleType("utils.search_index")
+
+
+# endregion
+# region Benchmark config
+
+
+class AutoDict(dict):
+    """Dict that fills in missing keys with default_func(key)"""
+
+    def __init__(self, default_func, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_func = default_func
+
+    def __missing__(self, key):
+        val = self.default_func(key)
+        self[key] = val
+        return val
+
+
+def make_bench_config():
+    """Return a config that fills in whatever the sequences look up: a fresh
+    channel for each pulse gen output, digitally modulated lasers with 100 ns
+    delays, signal generators with 50 ns delays and 100 kHz FM bandwidths, and
+    1 us for everything in CommonDurations and Positioning
+    """
+    digital_chans = itertools.count()
+    analog_chans = itertools.count()
+
+    def get_chan(key):
+        return next(analog_chans) if key.startswith("ao_") else next(digital_chans)
+
+    def get_microwaves(key):
+        if key.endswith("delay"):
+            return 50
+        return {"delay": 50, "fm_mod_bandwidth": 100e3}
+
+    pulse_gen_wiring = AutoDict(get_chan)
+    return {
+        "Wiring": {"PulseGen": pulse_gen_wiring, "PulseStreamer": pulse_gen_wiring},
+        "Optics": AutoDict(lambda key: {"delay": 100, "mod_type": "ModTypes.DIGITAL"}),
+        "Microwaves": AutoDict(get_microwaves),
+        "Servers": AutoDict(lambda key: key),
+        "CommonDurations": AutoDict(lambda key: 1000),
+        "Positioning": AutoDict(lambda key: 1000),
+    }
+
+
+# endregion
+# region Loading
+
+
+def load_configs(config_names=None):
+    """Return a dict of the config dicts in config/ by name, and a dict of the
+    errors for configs that failed to load. Default is all of them
+    """
+    if config_names is None:
+        config_paths = sorted((repo_path / "config").glob("*.py"))
+        config_names = [path.stem for path in config_paths]
+        config_names = [name for name in config_names if name != "__init__"]
+    configs = {}
+    errors = {}
+    for name in config_names:
+        try:
+            module = importlib.import_module(f"config.{name}")
+            configs[name] = module.config
+        except Exception as exc:
+            errors[name] = format_error(exc)
+    return configs, errors
+
+
+def load_sequence(file_path):
+    """Import a sequence file as a module"""
+    spec = importlib.util.spec_from_file_location(file_path.stem, file_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def get_main_args(file_path):
+    """Get the args passed to get_seq in the file's __main__ block. Returns
+    None if they can't be found
+    """
+    tree = ast.parse(file_path.read_text())
+    mains = [
+        node
+        for node in tree.body
+        if isinstance(node, ast.If) and "__main__" in ast.unparse(node.test)
+    ]
+    if len(mains) == 0:
+        return None
+    nodes = list(ast.walk(mains[0]))
+    calls = [
+        node
+        for node in nodes
+        if isinstance(node, ast.Call) and ast.unparse(node.func).endswith("get_seq")
+    ]
+    if len(calls) == 0 or not isinstance(calls[0].args[-1], ast.Name):
+        return None
+    call = calls[0]
+    args_name = call.args[-1].id
+    # Last assignment to the args before the call
+    assignments = [
+        node
+        for node in nodes
+        if isinstance(node, ast.Assign)
+        and node.lineno < call.lineno
+        and any(getattr(target, "id", None) == args_name for target in node.targets)
+    ]
+    if len(assignments) == 0:
+        return None
+    value = max(assignments, key=lambda node: node.lineno).value
+    try:
+        return ast.literal_eval(value)
+    except ValueError:
+        # Some files build their args with numpy, e.g. numpy.int64(...)
+        try:
+            return eval(ast.unparse(value), {"numpy": np, "np": np})
+        except Exception:
+            return None
+
+
+def format_error(exc):
+    return f"{type(exc).__name__}: {exc}"[:80]
+
+
+# endregion
+# region Benchmark
+
+
+def check_trains(seq):
+    """Return the status, period, total pulses over all channels, and pulses
+    in the merged sequence the Pulse Streamer would get for a built sequence
+    """
+    trains = seq.trains
+    if len(trains) == 0:
+        return "no channels set", 0, 0, 0
+    totals = {}
+    edges = []
+    for chan, train in trains.items():
+        durations = np.array([el[0] for el in train], dtype=np.int64)
+        ends = np.cumsum(durations)
+        totals[chan] = int(ends[-1]) if len(ends) > 0 else 0
+        edges.append(ends[ends > 0])
+    num_pulses = sum(len(train) for train in trains.values())
+    # The Pulse Streamer gets a pulse between each pair of consecutive edges
+    # on any channel
+    num_upload_pulses = len(np.unique(np.concatenate(edges)))
+    period = max(totals.values())
+    if min(totals.values()) != period:
+        short = [f"{chan}={val}" for chan, val in totals.items() if val != period]
+        return f"lengths differ: {period} vs {', '.join(short)}", period, None, None
+    return "ok", period, num_pulses, num_upload_pulses
+
+
+def benchmark_sequence(module, config, args, num_runs=3):
+    """Build a sequence num_runs times and return a row for the table. The
+    build time is the fastest of the runs
+    """
+    row = {}
+    build_times = []
+    # Older sequences take get_seq(pulser_wiring, args)
+    takes_wiring = len(inspect.signature(module.get_seq).parameters) == 2
+    try:
+        for _ in range(num_runs):
+            run_config = copy.deepcopy(config)
+            if takes_wiring:
+                get_seq_args = (run_config["Wiring"]["PulseGen"], list(args))
+            else:
+                get_seq_args = (None, run_config, list(args))
+            # Sequence files print periods and trains for manual checking
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                seq, _, _ = module.get_seq(*get_seq_args)
+                build_times.append(time.perf_counter() - start)
+        status, period, num_pulses, num_upload_pulses = check_trains(seq)
+    except Exception as exc:
+        row["status"] = format_error(exc)
+        return row
+    row["status"] = status
+    row["build_ms"] = round(min(build_times) * 1000, 3)
+    row["period"] = period
+    row["num_pulses"] = num_pulses
+    row["num_upload_pulses"] = num_upload_pulses
+    return row
+
+
+def run_benchmark(configs=None, seq_names=None, num_runs=3):
+    """Benchmark the sequences in the library against the configs. Returns a
+    list of rows, one per sequence, config, and set of args
+
+    Params
+        configs: dict
+            Config dicts by name. Default is the benchmark config from
+            make_bench_config. load_configs loads the ones in config/
+        seq_names: list(str)
+            Sequence file names without the extension. Default is every
+            sequence in the library
+        num_runs: int
+            Builds per row, for timing
+    """
+    install_mock_pulse_streamer()
+    if configs is None:
+        configs = {"bench": make_bench_config()}
+    seq_dir = library_path / "pulse_gen_SWAB_82" / "counter"
+    seq_paths = sorted(seq_dir.glob("*.py"))
+    if seq_names is not None:
+        seq_paths = [path for path in seq_paths if path.stem in seq_names]
+
+    rows = []
+    for seq_path in seq_paths:
+        base_row = {"sequence": seq_path.stem}
+        try:
+            module = load_sequence(seq_path)
+            args = arg_overrides.get(seq_path.stem, None)
+            if args is None:
+                args = get_main_args(seq_path)
+        except Exception as exc:
+            status = format_error(exc)
+            rows.append(base_row | {"config": None, "sweep": None, "status": status})
+            continue
+        if args is None:
+            status = "no args in __main__"
+            rows.append(base_row | {"config": None, "sweep": None, "status": status})
+            continue
+
+        arg_sets = [(None, args)]
+        if seq_path.stem in arg_sweeps:
+            arg_ind, vals = arg_sweeps[seq_path.stem]
+            arg_sets = []
+            for val in vals:
+                swept_args = list(args)
+                swept_args[arg_ind] = val
+                arg_sets.append((f"args[{arg_ind}]={val}", swept_args))
+
+        for config_name, config in configs.items():
+            for sweep, seq_args in arg_sets:
+                row = base_row | {"config": config_name, "sweep": sweep}
+                row |= benchmark_sequence(module, config, seq_args, num_runs)
+                rows.append(row)
+    return rows
+
+
+def print_table(rows):
+    cells = [[str(row.get(col, "")) for col in table_columns] for row in rows]
+    cells = [[("" if cell == "None" else cell) for cell in line] for line in cells]
+    widths = [len(col) for col in table_columns]
+    for line in cells:
+        widths = [max(width, len(cell)) for width, cell in zip(widths, line)]
+    print("  ".join(col.ljust(width) for col, width in zip(table_columns, widths)))
+    for line in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)))
+
+
+def save_table(rows, file_path):
+    with open(file_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=table_columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# endregion
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(repo_path))
+
+    # Config dicts by name. None for the benchmark config. The pulse gen
+    # builds from the registry, so use {"registry": tool_belt.get_config_dict()}
+    # to check against the config the lab actually runs, or load_configs()[0]
+    # for the dicts in config/
+    configs = None
+    seq_names = None  # All sequences in the library
+    num_runs = 3
+    csv_path = None  # Set to save the table, e.g. to diff against a later run
+
+    rows = run_benchmark(configs, seq_names, num_runs)
+    print_table(rows)
+    if csv_path is not None:
+        save_table(rows, csv_path)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the sequence caching in the Pulse Streamer server, run against a
+mock Pulse Streamer so no hardware or LabRAD connection is needed.
+
+Created on October 18th, 2026
+"""
+
+from collections import OrderedDict
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("labrad")
+pytest.importorskip("pulsestreamer")
+
+from servers.timing.pulse_gen_SWAB_82 import PulseGenSwab82
+
+
+@pytest.fixture
+def server():
+    """Server with the state from initServer and on_get_config_dict set
+    directly, and get_seq swapped for one that builds mock sequences
+    """
+    server = PulseGenSwab82()
+    server.pulse_streamer = mock.MagicMock()
+    server.seq_cache = OrderedDict()
+    server.seq_num_pulses = {}
+    server.seq = None
+    server.loaded_seq_key = None
+    server.loaded_seq_streamed = False
+    server.streamed_num_repeat = None
+    server.next_seq = None
+    server.get_seq = lambda seq_file, seq_args_string: (mock.MagicMock(), None, [])
+    return server
+
+
+def test_reload_skips_upload(server):
+    server.stream_load(None, "simple_readout.py", "[]")
+    server.stream_start(None, 1)
+    server.stream_load(None, "simple_readout.py", "[]")
+    server.stream_start(None, 1)
+    assert server.pulse_streamer.stream.call_count == 1
+    assert server.pulse_streamer.startNow.call_count == 2
+
+
+@pytest.mark.parametrize("interrupt", ["constant", "force_final"])
+def test_reload_after_interrupt_uploads(server, interrupt):
+    server.stream_load(None, "simple_readout.py", "[]")
+    server.stream_start(None, 1)
+    if interrupt == "constant":
+        server.constant(None, [], 0.0, 0.0)
+    else:
+        server.force_final(None)
+    server.stream_load(None, "simple_readout.py", "[]")
+    server.stream_start(None, 1)
+    assert server.pulse_streamer.stream.call_count == 2
+
+
+def test_start_next_after_reset_raises(server):
+    server.stream_load_next(None, "simple_readout.py", "[]")
+
+    # Reset while stream_start_next is waiting on the running stream
+    def has_finished():
+        server.reset(None)
+        return True
+
+    server.pulse_streamer.hasFinished.side_effect = has_finished
+    with pytest.raises(RuntimeError):
+        server.stream_start_next_internal(None, 1).send(None)
+    assert server.pulse_streamer.stream.call_count == 0
@@ -11,8 +11,10 @@ Created on Decemeber 1st, 2022
 
 import numpy as np
 import time
+import weakref
 import labrad
 from enum import Enum, IntEnum, auto
+from functools import lru_cache
 import sys
 sys.path.insert(0, 'C:\\Users\\choyl\\ChoyDioptric')  # Add parent directory to path
 import utils.common as common
@@ -25,15 +27,101 @@ class ControlStyle(Enum):
     STREAM = auto()
 
 
+# Default period in ns of the clock that steps through ramp trajectories, for
+# setups without ramp_sample_period in the registry
+default_ramp_sample_period = int(100e3)
+
+# Drift history kept in the registry, and the span in s of recent history the
+# drift model is fit to, for setups without drift_model_window in the registry
+max_drift_history = 100
+default_drift_model_window = 3600
+
+
+# endregion
+# region Config snapshot
+
+
+class PositioningConfig:
+    """Snapshot of the Config/Positioning registry directory. The whole
+    directory is read in one registry packet and the dtypes and control styles
+    are evaluated once, so the positioning functions don't have to talk to the
+    registry on every move. Get it with get_positioning_config and call
+    invalidate_positioning_config after changing the registry.
+    """
+
+    reg_path = ["", "Config", "Positioning"]
+
+    def __init__(self, cxn):
+        self.vals = {}
+        tool_belt.populate_config_dict(cxn, self.reg_path, self.vals)
+        self.xy_dtype = eval(self.vals["xy_dtype"])
+        self.z_dtype = eval(self.vals["z_dtype"])
+        self.xy_control_style = self._eval_optional("xy_control_style")
+        self.z_control_style = self._eval_optional("z_control_style")
+
+    def _eval_optional(self, key):
+        val = self.vals.get(key)
+        return None if val is None else eval(val)
+
+    def __getitem__(self, key):
+        return self.vals[key]
+
+    def __contains__(self, key):
+        return key in self.vals
+
+    def get(self, key, default=None):
+        return self.vals.get(key, default)
+
+    @property
+    def xy_delay(self):
+        # AG Eventually phase out large angle response
+        if "xy_delay" in self.vals:
+            return self.vals["xy_delay"]
+        return self.vals["xy_large_response_delay"]
+
+    @property
+    def xy_small_response_delay(self):
+        """Finely specified delay for small moves if this setup has one, else
+        the one-size-fits-all value
+        """
+        if "xy_small_response_delay" in self.vals:
+            return self.vals["xy_small_response_delay"]
+        return self.xy_delay
+
+
+# Snapshots by connection. Weak keys so closed connections drop out
+_positioning_configs = weakref.WeakKeyDictionary()
+
+
+def get_positioning_config(cxn):
+    """Get the PositioningConfig for this connection, loading it from the
+    registry on first use
+    """
+    positioning_config = _positioning_configs.get(cxn)
+    if positioning_config is None:
+        positioning_config = PositioningConfig(cxn)
+        _positioning_configs[cxn] = positioning_config
+    return positioning_config
+
+
+def invalidate_positioning_config(cxn=None):
+    """Drop the cached PositioningConfig for this connection so the next call
+    re-reads the registry. Drops all of them if cxn is None
+    """
+    if cxn is None:
+        _positioning_configs.clear()
+    else:
+        _positioning_configs.pop(cxn, None)
+
+
 # endregion
 # region Simple sets
 
 
 def set_xyz(cxn, coords):
-    xy_dtype = common.get_registry_entry(cxn, "xy_dtype", ["", "Config", "Positioning"])
-    z_dtype = common.get_registry_entry(cxn, "z_dtype", ["", "Config", "Positioning"])
-    xy_dtype = eval(xy_dtype)
-    z_dtype = eval(z_dtype)
+    positioning_config = get_positioning_config(cxn)
+    xy_dtype = positioning_config.xy_dtype
+    z_dtype = positioning_config.z_dtype
     pos_xy_server = get_server_pos_xy(cxn)
     pos_z_server = get_server_pos_z(cxn)
     pos_z_server.write_z(z_dtype(coords[2]))
@@ -44,30 +132,22 @@ def set_xyz(cxn, coords):
 
 
 def set_xyz_ramp(cxn, coords):
-    """Step incrementally to this position from the current position"""
-    xy_dtype = common.get_registry_entry(cxn, "xy_dtype", ["", "Config", "Positioning"])
-    z_dtype = common.get_registry_entry(cxn, "z_dtype", ["", "Config", "Positioning"])
+    """Ramp to this position from the current position along a velocity- and
+    acceleration-limited trajectory. See plan_trajectory. The limits are
+    {axis}_max_velocity (units / s) and {axis}_max_acceleration (units / s^2)
+    in the registry. Without a velocity limit an axis moves at most its
+    {axis}_incremental_step_size per sample, and without an acceleration limit
+    it starts and stops abruptly
+    """
+    positioning_config = get_positioning_config(cxn)
+    xy_dtype = positioning_config.xy_dtype
+    z_dtype = positioning_config.z_dtype
     # Get the min step size
-    step_size_xy = common.get_registry_entry(
-        cxn, "xy_incremental_step_size", ["", "Config", "Positioning"]
-    )
-    step_size_z = common.get_registry_entry(
-        cxn, "z_incremental_step_size", ["", "Config", "Positioning"]
-    )
+    step_size_xy = positioning_config["xy_incremental_step_size"]
+    step_size_z = positioning_config["z_incremental_step_size"]
     # Get the delay between movements
-    try:
-        xy_delay = common.get_registry_entry(
-            cxn, "xy_delay", ["", "Config", "Positioning"]
-        )
-
-    except Exception:
-        xy_delay = common.get_registry_entry(
-            cxn,
-            "xy_large_response_delay",  # AG Eventually pahse out large angle response
-            ["", "Config", "Positioning"],
-        )
-
-    z_delay = common.get_registry_entry(cxn, "z_delay", ["", "Config", "Positioning"])
+    xy_delay = positioning_config.xy_delay
+    z_delay = positioning_config["z_delay"]
 
     # Take whichever one is longer
     if xy_delay > z_delay:
@@ -75,14 +155,14 @@ def set_xyz_ramp(cxn, coords):
     else:
         total_movement_delay = z_delay
 
-    xyz_server = get_server_pos_xyz(cxn)
-    pulse_gen = tool_belt.get_server_pulse_gen(cxn)
-
     # if the movement type is int, just skip this and move to the desired position
     if xy_dtype is int or z_dtype is int:
         set_xyz(cxn, coords)
         return
 
+    xyz_server = get_server_pos_xyz(cxn)
+    pulse_gen = tool_belt.get_server_pulse_gen(cxn)
+
     # Get current and final position
     current_x, current_y = xyz_server.read_xy()
     current_z = xyz_server.read_z()
@@ -91,70 +171,118 @@ def set_xyz_ramp(cxn, coords):
     dx = final_x - current_x
     dy = final_y - current_y
     dz = final_z - current_z
-    # print('dx: {}'.format(dx))
-    # print('dy: {}'.format(dy))
 
     # If we are moving a distance smaller than the step size,
     # just set the coords, don't try to run a sequence
 
     if abs(dx) <= step_size_xy and abs(dy) <= step_size_xy and abs(dz) <= step_size_z:
-        # print('just setting coords without ramp')
         set_xyz(cxn, coords)
+        move_time = 0
 
     else:
-        # Determine num of steps to get to final destination based on step size
-        num_steps_x = np.ceil(abs(dx) / step_size_xy)
-        num_steps_y = np.ceil(abs(dy) / step_size_xy)
-        num_steps_z = np.ceil(abs(dz) / step_size_z)
-
-        # Determine max steps for this move
-        max_steps = int(max([num_steps_x, num_steps_y, num_steps_z]))
-
-        # The delay between steps will be the total delay divided by the num of incr steps
-        movement_delay = int(total_movement_delay / max_steps)
-
-        x_points = [current_x]
-        y_points = [current_y]
-        z_points = [current_z]
-
-        # set up the voltages to step thru. Once x, y, or z reach their final
-        # value, just pass the final position for the remaining steps
-        for n in range(max_steps):
-            if n > num_steps_x - 1:
-                x_points.append(final_x)
-            else:
-                move_x = (n + 1) * step_size_xy * dx / abs(dx)
-                incr_x_val = move_x + current_x
-                x_points.append(incr_x_val)
-
-            if n > num_steps_y - 1:
-                y_points.append(final_y)
-            else:
-                move_y = (n + 1) * step_size_xy * dy / abs(dy)
-                incr_y_val = move_y + current_y
-                y_points.append(incr_y_val)
-
-            if n > num_steps_z - 1:
-                z_points.append(final_z)
-            else:
-                move_z = (n + 1) * step_size_z * dz / abs(dz)
-                incr_z_val = move_z + current_z
-                z_points.append(incr_z_val)
-        # Run a simple clock pulse repeatedly to move through voltages
+        sample_period = positioning_config.get(
+            "ramp_sample_period", default_ramp_sample_period
+        )
+        sample_period_s = sample_period / 1e9
+        max_velocity = []
+        max_acceleration = []
+        for axis, step_size in [("xy", step_size_xy), ("z", step_size_z)]:
+            axis_velocity = positioning_config.get(
+                f"{axis}_max_velocity", step_size / sample_period_s
+            )
+            axis_acceleration = positioning_config.get(
+                f"{axis}_max_acceleration", np.inf
+            )
+            num_axes = 2 if axis == "xy" else 1
+            max_velocity.extend([axis_velocity] * num_axes)
+            max_acceleration.extend([axis_acceleration] * num_axes)
+
+        points, move_time = plan_trajectory(
+            (float(current_x), float(current_y), float(current_z)),
+            (float(final_x), float(final_y), float(final_z)),
+            tuple(max_velocity),
+            tuple(max_acceleration),
+            sample_period,
+        )
+        num_steps = points.shape[1] - 1
+
+        # Run a simple clock pulse repeatedly to move through the trajectory.
+        # The clock period is delay + 100 ns
         file_name = "simple_clock.py"
-        seq_args = [movement_delay]
+        seq_args = [int(sample_period) - 100]
         seq_args_string = tool_belt.encode_seq_args(seq_args)
         pulse_gen.stream_load(file_name, seq_args_string)
-        # period = ret_vals[0]
-        # print(z_points)
+        xyz_server.load_stream_xyz(*points.tolist())
+        pulse_gen.stream_start(num_steps)
 
-        xyz_server.load_stream_xyz(x_points, y_points, z_points)
-        pulse_gen.stream_load(file_name, seq_args_string)
-        pulse_gen.stream_start(max_steps)
+    # Force some delay before proceeding to account for the time the
+    # trajectory takes, as well as settling time for movement
+    time.sleep(move_time + total_movement_delay / 1e9)
+
+
+def plan_trajectory(
+    start, end, max_velocity, max_acceleration, sample_period=default_ramp_sample_period
+):
+    """Plan a straight-line move between two points with a trapezoidal
+    velocity profile. All the axes move along the same profile, scaled to
+    their distances, so they start and finish together, and the profile is
+    the fastest one that keeps every axis within its limits
+
+    Params
+        start: tuple(float)
+            Coords to start from
+        end: tuple(float)
+            Coords to end at
+        max_velocity: tuple(float)
+            Max speed of each axis in units / s
+        max_acceleration: tuple(float)
+            Max acceleration of each axis in units / s^2. Use np.inf for no
+            limit
+        sample_period: numeric
+            Time between points in ns
 
-    # Force some delay before proceeding to account
-    # for the effective write time, as well as settling time for movement
-    time.sleep(total_movement_delay / 1e9)
+    Returns
+        array(float)
+            Points along the trajectory, with shape (num_axes, num_points).
+            The first point is start and the last is end
+        float
+            Duration of the move in s
+    """
+    start = np.array(start, dtype=np.float64)
+    end = np.array(end, dtype=np.float64)
+    displacement = end - start
+    distance = np.abs(displacement)
+    moving = distance > 0
+    if not np.any(moving):
+        return start[:, np.newaxis], 0.0
+
+    # Work in the fraction of the move completed, which runs from 0 to 1. The
+    # limits on the fraction are set by the most constrained axis
+    velocity = np.min(np.array(max_velocity)[moving] / distance[moving])
+    acceleration = np.min(np.array(max_acceleration)[moving] / distance[moving])
+    accel_time = velocity / acceleration
+    if velocity * accel_time >= 1:
+        # Triangular profile - max velocity is never reached
+        accel_time = np.sqrt(1 / acceleration)
+        velocity = acceleration * accel_time
+    move_time = 1 / velocity + accel_time
+
+    sample_period_s = sample_period / 1e9
+    num_steps = max(int(np.ceil(move_time / sample_period_s)), 1)
+    times = np.minimum(np.arange(1, num_steps + 1) * sample_period_s, move_time)
+    decel_start = move_time - accel_time
+    fraction = velocity * times - velocity * accel_time / 2
+    if accel_time > 0:
+        accel_fraction = acceleration * times**2 / 2
+        decel_fraction = 1 - acceleration * (move_time - times) ** 2 / 2
+        fraction = np.where(times < accel_time, accel_fraction, fraction)
+        fraction = np.where(times > decel_start, decel_fraction, fraction)
+    fraction = np.clip(fraction, 0, 1)
+    fraction[-1] = 1
+
+    fraction = np.concatenate(([0], fraction))
+    points = start[:, np.newaxis] + displacement[:, np.newaxis] * fraction
+    return points, float(move_time)
 
 
 def set_xyz_on_nv(cxn, nv_sig, drift_adjust=True):
@@ -183,21 +311,13 @@ def get_server_pos_xyz(cxn):
 
 
 def get_xy_control_style(cxn):
-    """Talk to the registry to get the xy control type for this setup"""
-    xy_control_style_return = common.get_registry_entry(
-        cxn, "xy_control_style", ["", "Config", "Positioning"]
-    )
-    xy_control_style_return = eval(xy_control_style_return)
-    return xy_control_style_return
+    """Get the xy control type for this setup from the registry"""
+    return get_positioning_config(cxn).xy_control_style
 
 
 def get_z_control_style(cxn):
-    """Talk to the registry to get the z control type for this setup"""
-    z_control_style_return = common.get_registry_entry(
-        cxn, "z_control_style", ["", "Config", "Positioning"]
-    )
-    z_control_style_return = eval(z_control_style_return)
-    return z_control_style_return
+    """Get the z control type for this setup from the registry"""
+    return get_positioning_config(cxn).z_control_style
 
 
 # endregion
@@ -207,10 +327,9 @@ def get_z_control_style(cxn):
 
 def get_drift(cxn):
     drift = common.get_registry_entry(cxn, "DRIFT", ["", "State"])
-    xy_dtype = common.get_registry_entry(cxn, "xy_dtype", ["", "Config", "Positioning"])
-    xy_dtype = eval(xy_dtype)
-    z_dtype = common.get_registry_entry(cxn, "z_dtype", ["", "Config", "Positioning"])
-    z_dtype = eval(z_dtype)
+    positioning_config = get_positioning_config(cxn)
+    xy_dtype = positioning_config.xy_dtype
+    z_dtype = positioning_config.z_dtype
     drift = [xy_dtype(drift[0]), xy_dtype(drift[1]), z_dtype(drift[2])]
     return drift
 
@@ -229,6 +348,146 @@ def reset_drift(cxn=None):
     
 def _reset_drift(cxn=None):
     set_drift(cxn, [0.0, 0.0, 0.0])
+    # The history is relative to the old reference, so it's no use anymore
+    cxn.registry.cd(["", "State"])
+    if "DRIFT_HISTORY" in cxn.registry.dir()[1]:
+        cxn.registry.del_("DRIFT_HISTORY")
+
+
+def get_drift_history(cxn):
+    """Return the recorded drifts as an array with one row per optimize of
+    (timestamp, x drift, y drift, z drift, temperature), oldest first. The
+    temperature is nan if it wasn't available
+    """
+    try:
+        history = common.get_registry_entry(cxn, "DRIFT_HISTORY", ["", "State"])
+    except Exception:
+        history = []
+    return np.array(history, dtype=float).reshape(-1, 5)
+
+
+def record_drift(cxn, drift, temperature=None):
+    """Set the drift and add it to the history the drift model is fit to.
+    Call with the drift measured by an optimize. The temperature is read from
+    the temp monitor if it's not passed
+    """
+    if temperature is None:
+        temperature = get_drift_temperature(cxn)
+    entry = [time.time(), *[float(el) for el in drift], float(temperature)]
+    history = np.vstack((get_drift_history(cxn), entry))
+    history = history[-max_drift_history:]
+    set_drift(cxn, drift)
+    cxn.registry.cd(["", "State"])
+    cxn.registry.set("DRIFT_HISTORY", history.tolist())
+
+
+def get_drift_temperature(cxn):
+    """Return the temperature from the temp monitor, or nan if there isn't
+    one or it can't be read
+    """
+    temp_monitor = tool_belt.get_server_temp_monitor(cxn)
+    if temp_monitor is None:
+        return np.nan
+    try:
+        return float(temp_monitor.measure())
+    except Exception:
+        return np.nan
+
+
+def predict_drift(cxn, at_time=None):
+    """Predict the drift from the recent drift history
+
+    Params
+        cxn: labrad connection
+        at_time: float
+            Time to predict the drift at, as from time.time(). Default is now
+
+    Returns
+        list(numeric)
+            Predicted drift by axis
+        list(float)
+            Standard error of the prediction by axis, inf if there isn't
+            enough recent history to estimate it
+    """
+    if at_time is None:
+        at_time = time.time()
+    positioning_config = get_positioning_config(cxn)
+    window = positioning_config.get("drift_model_window", default_drift_model_window)
+    history = get_drift_history(cxn)
+    temperature = np.nan
+    if np.any(np.isfinite(history[:, 4])):
+        temperature = get_drift_temperature(cxn)
+    drift, uncertainty = fit_drift(history, at_time, temperature, window)
+    if drift is None:
+        return get_drift(cxn), uncertainty.tolist()
+    xy_dtype = positioning_config.xy_dtype
+    z_dtype = positioning_config.z_dtype
+    if xy_dtype is int:
+        drift[:2] = np.round(drift[:2])
+    if z_dtype is int:
+        drift[2] = np.round(drift[2])
+    drift = [xy_dtype(drift[0]), xy_dtype(drift[1]), z_dtype(drift[2])]
+    return drift, uncertainty.tolist()
+
+
+def fit_drift(history, at_time, temperature=np.nan, window=default_drift_model_window):
+    """Fit the drift history over the window before at_time with a line in time
+    for each axis and extrapolate it to at_time. If every entry in the window
+    and the passed temperature are known, and the temperature has changed over
+    the window, a linear term in temperature is included too
+
+    Returns
+        ndarray(float)
+            Predicted drift by axis, None if the window is empty
+        ndarray(float)
+            Standard error of the prediction by axis, inf if there are too few
+            entries in the window to estimate it
+    """
+    history = np.asarray(history, dtype=float).reshape(-1, 5)
+    recent = history[(history[:, 0] >= at_time - window) & (history[:, 0] <= at_time)]
+    num_entries = len(recent)
+    uncertainty = np.full(3, np.inf)
+    if num_entries == 0:
+        return None, uncertainty
+
+    # Center the regressors so the fit is well-conditioned
+    times = recent[:, 0]
+    regressors = [np.ones(num_entries), times - times.mean()]
+    point = [1.0, at_time - times.mean()]
+    temperatures = recent[:, 4]
+    if np.all(np.isfinite(temperatures)) and np.isfinite(temperature):
+        if np.ptp(temperatures) > 0:
+            regressors.append(temperatures - temperatures.mean())
+            point.append(temperature - temperatures.mean())
+    design = np.column_stack(regressors)
+    point = np.array(point)
+    num_params = design.shape[1]
+
+    # We need more entries than parameters to estimate the scatter
+    if num_entries <= num_params:
+        return recent[-1, 1:4].copy(), uncertainty
+    drifts = recent[:, 1:4]
+    coeffs = np.linalg.lstsq(design, drifts, rcond=None)[0]
+    residuals = drifts - design @ coeffs
+    variance = np.sum(residuals**2, axis=0) / (num_entries - num_params)
+    leverage = point @ np.linalg.pinv(design.T @ design) @ point
+    prediction = point @ coeffs
+    uncertainty = np.sqrt(variance * (1 + leverage))
+    return prediction, uncertainty
+
+
+def drift_prediction_confident(cxn, uncertainty):
+    """Whether a predicted drift is certain enough to skip optimizing, per
+    xy_drift_skip_threshold and z_drift_skip_threshold in the registry.
+    Always False if the thresholds aren't set
+    """
+    positioning_config = get_positioning_config(cxn)
+    xy_threshold = positioning_config.get("xy_drift_skip_threshold")
+    z_threshold = positioning_config.get("z_drift_skip_threshold")
+    if xy_threshold is None or z_threshold is None:
+        return False
+    thresholds = [xy_threshold, xy_threshold, z_threshold]
+    return bool(np.all(np.array(uncertainty) <= thresholds))
 
 
 def adjust_coords_for_drift(coords, cxn=None, drift=None):
@@ -247,6 +506,98 @@ or whatever, variables are named axis-agnostically as <var>_<axis_ind>
 """
 
 
+class ScanPlan:
+    """Order in which a scan visits the pixels of an image, along with the
+    coords to write to the hardware. Sample k of the scan goes to
+    img_array.flat[flat_inds[k]], so a chunk of samples can be placed into an
+    image with one fancy-indexing assignment. Get one from the get_scan_*
+    functions with return_plan=True.
+    """
+
+    def __init__(self, coords, flat_inds, img_shape):
+        """
+        Params
+            coords: tuple(array(numeric))
+                Values to write to each axis, one per sample
+            flat_inds: array(int)
+                Flat index into the image of each sample
+            img_shape: tuple(int)
+                Shape of the image
+        """
+        self.coords = coords
+        self.flat_inds = np.asarray(flat_inds, dtype=np.intp)
+        self.flat_inds.flags.writeable = False
+        self.img_shape = tuple(img_shape)
+
+    @property
+    def num_samples(self):
+        return len(self.flat_inds)
+
+    def new_img_array(self):
+        """Return an image array for the scan, filled with nan so that unset
+        values are not interpreted as 0 by matplotlib's colorbar
+        """
+        return np.full(self.img_shape, np.nan)
+
+    def scatter(self, vals, img_arrays, start=0):
+        """Write the values of a chunk of samples into one or more image arrays.
+        Samples past the end of the scan are dropped
+
+        Params
+            vals: array(numeric) or list(array(numeric))
+                Values of the samples, or a list of them, one per image array
+            img_arrays: ndarray or list(ndarray)
+                The image array, or a list of them
+            start: int
+                Index in the scan of the first sample in vals
+
+        Returns
+            int
+                Index in the scan of the sample after the chunk
+        """
+        if isinstance(img_arrays, np.ndarray):
+            img_arrays = [img_arrays]
+            vals = [vals]
+        inds = self.flat_inds[start : start + len(vals[0])]
+        num_inds = len(inds)
+        for img_array, array_vals in zip(img_arrays, vals):
+            img_array.flat[inds] = np.asarray(array_vals)[:num_inds]
+        return start + num_inds
+
+    def accumulate(self, vals, img_array, start=0):
+        """Like scatter, but add the values to the image instead of
+        overwriting it, e.g. for scans that visit pixels more than once
+        """
+        inds = self.flat_inds[start : start + len(vals)]
+        np.add.at(img_array.reshape(-1), inds, np.asarray(vals)[: len(inds)])
+        return start + len(inds)
+
+    def populate(self, vals, img_arrays, write_pos):
+        """scatter for callers that track progress like
+        image_sample.populate_img_array. write_pos is a list holding the number
+        of samples written so far, [] before the first chunk, and is updated
+        in place
+        """
+        start = write_pos[0] if len(write_pos) > 0 else 0
+        write_pos[:] = [self.scatter(vals, img_arrays, start)]
+        return img_arrays
+
+
+@lru_cache(maxsize=16)
+def get_snake_scan_plan(num_steps_1, num_steps_2):
+    """Plan for a snake scan over an image with num_steps_2 rows of
+    num_steps_1 pixels. The scan starts in the bottom right corner and heads
+    left, moving up a row and reversing at each edge. The image's first axis
+    is the second scan axis, flipped so the first row is at the top
+    """
+    sample_inds = np.arange(num_steps_1 * num_steps_2)
+    scan_rows, row_pos = np.divmod(sample_inds, num_steps_1)
+    rows = num_steps_2 - 1 - scan_rows
+    cols = np.where(scan_rows % 2 == 0, num_steps_1 - 1 - row_pos, row_pos)
+    flat_inds = rows * num_steps_1 + cols
+    return ScanPlan(None, flat_inds, (num_steps_2, num_steps_1))
+
+
 def get_scan_1d(center, scan_range, num_steps):
     """Get a linear spacing of coords about the passed center
 
@@ -274,7 +625,13 @@ def get_scan_1d(center, scan_range, num_steps):
 
 # load_sweep_scan_xy
 def get_scan_grid_2d(
-    center_1, center_2, scan_range_1, scan_range_2, num_steps_1, num_steps_2
+    center_1,
+    center_2,
+    scan_range_1,
+    scan_range_2,
+    num_steps_1,
+    num_steps_2,
+    return_plan=False,
 ):
     """Create a grid of points for a snake scan
 
@@ -292,6 +649,9 @@ def get_scan_grid_2d(
         Number of steps along the first axis
     num_steps_2 : int
         Number of steps along the second axis
+    return_plan : bool
+        If True, also return a ScanPlan that places the samples in an image
+        with num_steps_2 rows of num_steps_1 pixels, matching the extent
 
     Returns
     -------
@@ -346,11 +706,23 @@ def get_scan_grid_2d(
         y_high + y_half_pixel,
     ]
 
+    if return_plan:
+        snake_plan = get_snake_scan_plan(num_steps_1, num_steps_2)
+        scan_plan = ScanPlan(
+            (coords_1, coords_2), snake_plan.flat_inds, snake_plan.img_shape
+        )
+        return coords_1, coords_2, coords_1_1d, coords_2_1d, img_extent, scan_plan
     return coords_1, coords_2, coords_1_1d, coords_2_1d, img_extent
 
 
 def get_scan_cross_2d(
-    center_1, center_2, scan_range_1, scan_range_2, num_steps_1, num_steps_2
+    center_1,
+    center_2,
+    scan_range_1,
+    scan_range_2,
+    num_steps_1,
+    num_steps_2,
+    return_plan=False,
 ):
     """Scan in a cross pattern. The first axis will be scanned while the second is held at its center,
     then the second axis will be scanned while the first is held at its center. This is useful for optimization
@@ -369,6 +741,9 @@ def get_scan_cross_2d(
         Number of steps along the first axis
     num_steps_2 : int
         Number of steps along the second axis
+    return_plan : bool
+        If True, also return a ScanPlan that places the samples in an array
+        with one row per axis scanned
 
     Returns
     -------
@@ -388,6 +763,13 @@ def get_scan_cross_2d(
     coords_1 = np.concatenate([coords_1_1d, np.full(num_steps_2, center_1)])
     coords_2 = np.concatenate([np.full(num_steps_1, center_2), coords_2_1d])
 
+    if return_plan:
+        num_cols = max(num_steps_1, num_steps_2)
+        flat_inds = np.concatenate(
+            [np.arange(num_steps_1), num_cols + np.arange(num_steps_2)]
+        )
+        scan_plan = ScanPlan((coords_1, coords_2), flat_inds, (2, num_cols))
+        return coords_1, coords_2, coords_1_1d, coords_2_1d, scan_plan
     return coords_1, coords_2, coords_1_1d, coords_2_1d
 
 
@@ -448,7 +830,7 @@ def get_scan_one_axis_2d(center_1, center_2, scan_range_1, num_steps_1):
     return coords_1, coords_2
 
 
-def get_scan_circle_2d(center_1, center_2, radius, num_steps):
+def get_scan_circle_2d(center_1, center_2, radius, num_steps, return_plan=False):
     """Get coordinates for a scan around in a circle. Useful for checking galvo alignment
 
     Parameters
@@ -461,6 +843,9 @@ def get_scan_circle_2d(center_1, center_2, radius, num_steps):
         Radius of the circle
     num_steps : int
         Number of steps to discretize the circle into
+    return_plan : bool
+        If True, also return a ScanPlan that places the samples in a 1D
+        array in order around the circle
 
     Returns
     -------
@@ -473,10 +858,15 @@ def get_scan_circle_2d(center_1, center_2, radius, num_steps):
     angles = np.linspace(0, 2 * np.pi, num_steps)
     coords_1 = center_1 + (radius * np.sin(angles))
     coords_2 = center_2 + (radius * np.cos(angles))
+    if return_plan:
+        scan_plan = ScanPlan((coords_1, coords_2), np.arange(num_steps), (num_steps,))
+        return coords_1, coords_2, scan_plan
     return coords_1, coords_2
 
 
-def get_scan_two_point_2d(first_coord_1, first_coord_2, second_coord_1, second_coord_2):
+def get_scan_two_point_2d(
+    first_coord_1, first_coord_2, second_coord_1, second_coord_2, return_plan=False
+):
     """Flip back an forth between two points - designed to be run continuously
 
     Parameters
@@ -489,6 +879,9 @@ def get_scan_two_point_2d(first_coord_1, first_coord_2, second_coord_1, second_c
         Second point, first axis coordinate
     second_coord_2 : numeric
         Second point, second axis coordinate
+    return_plan : bool
+        If True, also return a ScanPlan that places the samples in a
+        2-element array, one per point. Use accumulate to sum the visits
 
     Returns
     -------
@@ -502,6 +895,9 @@ def get_scan_two_point_2d(first_coord_1, first_coord_2, second_coord_1, second_c
     # return a list of 64 coords to be safe
     coords_1 = [first_coord_1, second_coord_1] * 32
     coords_2 = [first_coord_2, second_coord_2] * 32
+    if return_plan:
+        scan_plan = ScanPlan((coords_1, coords_2), np.tile([0, 1], 32), (2,))
+        return coords_1, coords_2, scan_plan
     return coords_1, coords_2
 
 
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Pulse trains for building Pulse Streamer sequences. A Train is a list of
+(duration, level) pulses like the hand-written trains in the sequence library,
+except that a repeated block (e.g. the tau - pi - tau block of a dynamical
+decoupling sequence) is stored once along with its number of repetitions. The
+train is only expanded, with numpy, when it's converted for the Pulse
+Streamer, and adjacent pulses at the same level are merged on the way out.
+
+A Timeline builds all the channels of a sequence at once from pulses placed by
+absolute time. Each channel's delay from the config is applied when the
+trains are generated, and every train comes out the same length, so the
+channels can't drift out of alignment the way hand-written trains can.
+
+Created on October 18th, 2026
+"""
+
+# region Imports and constants
+
+import time
+import numpy as np
+
+# Each pulse goes to the Pulse Streamer as a uint32 duration, a uint8 digital
+# bitmask, and two int16 analog values
+bytes_per_pulse = 9
+
+# endregion
+# region Trains
+
+
+class Train:
+    """Run-length pulse train. Build it with extend and repeat, the way you'd
+    build a list of (duration, level) tuples, then pass to_list() to
+    Sequence.setDigital or tool_belt.process_laser_seq.
+    """
+
+    def __init__(self, pulses=None):
+        # Each block is (durations, levels, num_reps)
+        self.blocks = []
+        if pulses is not None:
+            self.extend(pulses)
+
+    def extend(self, pulses):
+        """Append pulses, either a list of (duration, level) tuples or
+        another Train
+        """
+        if isinstance(pulses, Train):
+            self.blocks.extend(pulses.blocks)
+        else:
+            self.repeat(pulses, 1)
+
+    def repeat(self, pulses, num_reps):
+        """Append pulses, a list of (duration, level) tuples or a Train,
+        num_reps times. The block is stored once no matter num_reps
+        """
+        if isinstance(pulses, Train):
+            durations, levels = pulses.to_arrays(collapse=False)
+        else:
+            if len(pulses) == 0:
+                return
+            durations, levels = zip(*pulses)
+            durations = np.asarray(durations, dtype=np.int64)
+            levels = np.asarray(levels)
+        if np.any(durations < 0):
+            raise ValueError("Pulse trains do not support negative durations.")
+        if num_reps > 0 and len(durations) > 0:
+            self.blocks.append((durations, levels, int(num_reps)))
+
+    @property
+    def duration(self):
+        """Total duration of the train, without expanding it"""
+        return sum(int(d.sum()) * n for d, _, n in self.blocks)
+
+    @property
+    def num_pulses(self):
+        """Number of pulses in the expanded train, before merging"""
+        return sum(len(d) * n for d, _, n in self.blocks)
+
+    def to_arrays(self, collapse=True):
+        """Expand the train into arrays of durations and levels. If collapse,
+        drop zero-duration pulses and merge adjacent pulses at the same level
+        """
+        if len(self.blocks) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=int)
+        durations = np.concatenate([np.tile(d, n) for d, _, n in self.blocks])
+        levels = np.concatenate([np.tile(l, n) for _, l, n in self.blocks])
+        if collapse:
+            durations, levels = collapse_pulses(durations, levels)
+        return durations, levels
+
+    def to_list(self):
+        """Expand the train into a collapsed list of (duration, level) tuples"""
+        durations, levels = self.to_arrays()
+        return list(zip(durations.tolist(), levels.tolist()))
+
+
+def collapse_pulses(durations, levels):
+    """Drop zero-duration pulses and merge adjacent pulses that share a level,
+    so no two adjacent pulses in the returned arrays have the same level
+    """
+    keep = durations > 0
+    durations = durations[keep]
+    levels = levels[keep]
+    if len(durations) == 0:
+        return durations, levels
+    level_changes = np.flatnonzero(levels[1:] != levels[:-1]) + 1
+    run_starts = np.concatenate(([0], level_changes))
+    return np.add.reduceat(durations, run_starts), levels[run_starts]
+
+
+# endregion
+# region Timelines
+
+
+class Timeline:
+    """Channels of pulses placed by absolute time. Times are relative to the
+    start of the experiment, which comes after a lead-in of lead ns so that
+    channels with delays can be started early. Each channel's pulses are
+    shifted earlier by its delay. Build it with add_channel/add_laser/
+    add_sig_gen and pulse, then get the trains with get_train or set_digital.
+    """
+
+    def __init__(self, config, lead=None):
+        """
+        Params
+            config: dict
+                Config dictionary, for the wiring and the delays
+            lead: int
+                Lead-in before the experiment starts in ns. Default is the
+                largest delay of the channels
+        """
+        self.config = config
+        self.lead = lead
+        # Channels by key, each a dict of chan, delay, starts, and durations
+        self.channels = {}
+
+    def add_channel(self, key, chan=None, delay=0):
+        """Add a channel. If chan is not None, set_digital will set the
+        channel's train on that Pulse Streamer digital output
+        """
+        self.channels[key] = {"chan": chan, "delay": delay}
+        self.channels[key] |= {"starts": [], "durations": []}
+
+    def add_laser(self, laser_name, delay=None):
+        """Add a laser channel under the laser's name, with its delay from
+        config["Optics"] unless delay is passed. Get its train with get_train
+        and pass it to tool_belt.process_laser_seq
+        """
+        if delay is None:
+            delay = self.config["Optics"][laser_name]["delay"]
+        self.add_channel(laser_name, delay=delay)
+
+    def add_sig_gen(self, sig_gen_name):
+        """Add the gate of a signal generator under the signal generator's name,
+        with its delay from config["Microwaves"]
+        """
+        chan = self.config["Wiring"]["PulseGen"][f"do_{sig_gen_name}_gate"]
+        delay = self.config["Microwaves"][sig_gen_name]["delay"]
+        self.add_channel(sig_gen_name, chan, delay)
+
+    def pulse(self, key, start, duration):
+        """Set a channel HIGH for duration ns from start. start and duration
+        may also be arrays, to add many pulses at once. Overlapping pulses
+        merge
+        """
+        channel = self.channels[key]
+        channel["starts"].append(np.atleast_1d(np.asarray(start, dtype=np.int64)))
+        durations = np.atleast_1d(np.asarray(duration, dtype=np.int64))
+        channel["durations"].append(durations)
+
+    def get_lead(self):
+        if self.lead is not None:
+            return self.lead
+        delays = [channel["delay"] for channel in self.channels.values()]
+        return max(delays, default=0)
+
+    def get_train(self, key, period):
+        """Get a channel's train as a collapsed list of (duration, level)
+        tuples. Every train is lead + period long
+
+        Params
+            key: str
+                The channel
+            period: int
+                Duration of the experiment in ns, after the lead-in
+        """
+        channel = self.channels[key]
+        lead = self.get_lead()
+        total = lead + period
+        if len(channel["starts"]) == 0:
+            return [(int(total), 0)]
+        starts = np.concatenate(channel["starts"]) + lead - channel["delay"]
+        ends = starts + np.concatenate(channel["durations"])
+        if np.any(starts < 0) or np.any(ends > total):
+            raise ValueError(f"Pulses on {key} extend past the ends of the timeline.")
+        durations, levels = pulses_to_pulse_train(starts, ends, total)
+        return list(zip(durations.tolist(), levels.tolist()))
+
+    def set_digital(self, seq, period):
+        """Set the trains of all the channels with digital outputs on seq"""
+        for key, channel in self.channels.items():
+            if channel["chan"] is not None:
+                seq.setDigital(channel["chan"], self.get_train(key, period))
+
+
+def pulses_to_pulse_train(starts, ends, total):
+    """Convert HIGH pulses from starts to ends into collapsed arrays of
+    durations and levels that run from 0 to total. Overlapping pulses merge
+    """
+    num_pulses = len(starts)
+    times = np.concatenate(([0, total], starts, ends))
+    steps = np.concatenate(([0, 0], np.ones(num_pulses), -np.ones(num_pulses)))
+    edge_times, edge_inds = np.unique(times, return_inverse=True)
+    # Number of pulses high at each edge, and so in the interval that follows
+    num_high = np.cumsum(np.bincount(edge_inds, weights=steps))
+    levels = (num_high[:-1] > 0).astype(int)
+    return collapse_pulses(np.diff(edge_times), levels)
+
+
+# endregion
+# region Upload estimates
+
+
+def estimate_upload(num_pulses, upload_rate):
+    """Estimate the size in bytes and the time in s to upload a sequence with
+    num_pulses pulses to the Pulse Streamer, given an upload rate in bytes / s
+    """
+    num_bytes = num_pulses * bytes_per_pulse
+    return num_bytes, num_bytes / upload_rate
+
+
+# endregion
+
+if __name__ == "__main__":
+    # Benchmark against unrolled lists for an XY8-style block
+    tau = 200
+    pi_pulse = 64
+    for num_reps in [8, 800, 80000]:
+        start = time.perf_counter()
+        unrolled = [(50, 1)]
+        unrolled.extend([(tau, 0), (pi_pulse, 1), (tau, 0)] * num_reps)
+        unrolled.append((50, 1))
+        unrolled_dur = 0
+        for el in unrolled:
+            unrolled_dur += el[0]
+        unrolled_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        train = Train([(50, 1)])
+        train.repeat([(tau, 0), (pi_pulse, 1), (tau, 0)], num_reps)
+        train.extend([(50, 1)])
+        train_dur = train.duration
+        train_time = time.perf_counter() - start
+        start = time.perf_counter()
+        collapsed = train.to_list()
+        expand_time = time.perf_counter() - start
+
+        assert train_dur == unrolled_dur
+        print(f"num_reps: {num_reps}")
+        print(f"Unrolled list: {unrolled_time:.2e} s, {len(unrolled)} pulses")
+        print(f"Train: {train_time:.2e} s to build, {expand_time:.2e} s to expand")
+        print(f"Collapsed pulses: {len(collapsed)}")
+
+    # Timeline with many pulses on delayed channels
+    num_pulses = 10**5
+    config = {"Optics": {"laser": {"delay": 80}}}
+    start = time.perf_counter()
+    timeline = Timeline(config)
+    timeline.add_channel("apd_gate")
+    timeline.add_laser("laser")
+    starts = 1000 * np.arange(num_pulses)
+    timeline.pulse("laser", starts, 500)
+    timeline.pulse("apd_gate", starts + 100, 300)
+    period = 1000 * num_pulses
+    trains = [timeline.get_train(key, period) for key in ["apd_gate", "laser"]]
+    timeline_time = time.perf_counter() - start
+    print(f"Timeline with {num_pulses} pulses per channel: {timeline_time:.2e} s")
@@ -30,6 +30,7 @@ import math
 import sys
 sys.path.insert(0, 'C:\\Users\\choyl\\ChoyDioptric')  # Add parent directory to path
 import utils.common as common
+from utils import pulse_trains
 import utils.search_index as search_index
 import signal
 import copy
@@ -320,60 +321,35 @@ def process_laser_seq(pulse_streamer, seq, config, laser_name, laser_power, trai
     # HIGH = 1
 
     processed_train = []
+    durations = np.array([el[0] for el in train], dtype=np.int64)
+    levels = np.array([int(el[1]) for el in train])
     # Digital, feedthrough, bookend each pulse with 100 ns clock pulses
     # Assumes we always leave the laser on (or off) for at least 100 ns
     if am_feedthrough:
         # Collapse the sequence so that no two adjacent elements have the
         # same value
-        collapsed_train = []
-        ind = 0
-        len_train = len(train)
-        while ind < len_train:
-            el = train[ind]
-            dur = el[0]
-            val = el[1]
-            next_ind = ind + 1
-            while next_ind < len_train:
-                next_el = train[next_ind]
-                next_dur = next_el[0]
-                next_val = next_el[1]
-                # If the next element shares the same value as the current
-                # one, combine them
-                if next_val == val:
-                    dur += next_dur
-                    next_ind += 1
-                else:
-                    break
-            # Append the current pulse and start back
-            # where we left off
-            collapsed_train.append((dur, val))
-            ind = next_ind
-        # print(pulse_streamer)
+        durations, levels = pulse_trains.collapse_pulses(durations, levels)
         # Check if this is just supposed to be always on
-        if (len(collapsed_train) == 1) and (collapsed_train[0][1] == Digital.HIGH):
+        if (len(durations) == 1) and (levels[0] == Digital.HIGH):
             if pulse_streamer is not None:
                 # pulse_streamer.client[laser_name].laser_on(laser_power)
                 pulse_streamer.laser_LGLO_589.laser_on(laser_power)
             return
-        # Set up the bookends
-        # print(collapsed_train)
-        for ind in range(len(collapsed_train)):
-            el = collapsed_train[ind]
-            dur = el[0]
-            val = el[1]
-            # print(Digital.LOW)
-            # For the first element, just leave things LOW
-            # Assumes the laser is off prior to the start of the sequence
-            if (ind == 0) and (val == 0):
-                processed_train.append((dur, Digital.LOW))
-                continue
-            if dur < 75:
-                raise ValueError(
-                    "Feedthrough lasers do not support pulses shorter than" " 100 ns."
-                )
-            processed_train.append((20, Digital.HIGH))
-            processed_train.append((dur - 20, Digital.LOW))
-        # print(processed_train)
+        # Set up the bookends. For the first element, just leave things LOW
+        # Assumes the laser is off prior to the start of the sequence
+        first_low = len(levels) > 0 and levels[0] == 0
+        bookend_durations = durations[1:] if first_low else durations
+        if np.any(bookend_durations < 75):
+            raise ValueError(
+                "Feedthrough lasers do not support pulses shorter than" " 100 ns."
+            )
+        bookended = np.empty(2 * len(bookend_durations), dtype=np.int64)
+        bookended[0::2] = 20
+        bookended[1::2] = bookend_durations - 20
+        bookended_levels = np.tile([Digital.HIGH, Digital.LOW], len(bookend_durations))
+        if first_low:
+            processed_train.append((int(durations[0]), Digital.LOW))
+        processed_train.extend(zip(bookended.tolist(), bookended_levels.tolist()))
         pulser_laser_mod = pulser_wiring["do_{}_am".format(laser_name)]
         seq.setDigital(pulser_laser_mod, processed_train)
     else:
@@ -387,21 +363,18 @@ def process_laser_seq(pulse_streamer, seq, config, laser_name, laser_power, trai
         # Possibly, we could pass laser_power as a list, and then build the sequences
         # for each power (element) in the list.
         elif mod_type is ModTypes.ANALOG:
-            high_count = 0
-            for el in train:
-                dur = el[0]
-                val = el[1]
-                if type(laser_power) == list:
-                    if val == 0:
-                        power_dict = {Digital.LOW: 0.0}
-                    else:
-                        power_dict = {Digital.HIGH: laser_power[high_count]}
-                        if val == Digital.HIGH:
-                            high_count += 1
-                # If a list wasn't passed, just use the single value for laser_power
-                elif type(laser_power) != list:
-                    power_dict = {Digital.LOW: 0.0, Digital.HIGH: laser_power}
-                processed_train.append((dur, power_dict[val]))
+            powers = np.zeros(len(levels))
+            highs = levels == Digital.HIGH
+            # With a list, the nth HIGH element gets the nth power
+            if type(laser_power) == list:
+                num_highs = np.count_nonzero(highs)
+                if num_highs > len(laser_power):
+                    raise IndexError("Not enough laser powers for the HIGH pulses.")
+                powers[highs] = laser_power[:num_highs]
+            # If a list wasn't passed, just use the single value for laser_power
+            else:
+                powers[highs] = laser_power
+            processed_train = list(zip(durations.tolist(), powers.tolist()))
             pulser_laser_mod = pulser_wiring["ao_{}_am".format(laser_name)]
             # print(processed_train)
             seq.setAnalog(pulser_laser_mod, processed_train)
@@ -576,6 +549,28 @@ def get_tagger_wiring(cxn):
     return tagger_wiring
 
 
+def decode_tag_stream(buffer):
+    """Unpack the byte buffer returned by the tagger's read_tag_stream_packed.
+    The arrays are views into the buffer so nothing is copied
+
+    Parameters
+    ----------
+    buffer : bytes
+        Little-endian int64 timestamps in ps followed by int32 channels
+
+    Returns
+    -------
+    array(int64)
+        Timestamps in ps
+    array(int32)
+        Channels
+    """
+    num_tags = len(buffer) // 12
+    timestamps = np.frombuffer(buffer, dtype="<i8", count=num_tags)
+    channels = np.frombuffer(buffer, dtype="<i4", count=num_tags, offset=8 * num_tags)
+    return timestamps, channels
+
+
 # endregion
 # region Math functions
 